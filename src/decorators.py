@@ -1,6 +1,28 @@
+import threading
 import time
+from collections import OrderedDict
 
-import prompt
+from . import metrics
+
+# Ответ на запросы подтверждения: None - спрашивать пользователя,
+# True/False - отвечать автоматически (пакетный режим)
+_auto_confirm = None
+
+
+def set_auto_confirm(answer):
+    """Включает автоматический ответ на запросы подтверждения."""
+    global _auto_confirm
+    _auto_confirm = answer
+
+
+def confirm(message):
+    """Запрашивает подтверждение у пользователя."""
+    if _auto_confirm is not None:
+        return _auto_confirm
+    import prompt
+
+    answer = prompt.string(message).strip().lower()
+    return answer == 'y' or answer == 'yes'
 
 
 def handle_db_errors(func):
@@ -10,18 +32,23 @@ def handle_db_errors(func):
         try:
             return func(*args, **kwargs)
         except FileNotFoundError as e:
+            metrics.increment("errors.FileNotFoundError")
             print(f"Ошибка: Файл данных не найден. {e}")
             return None
         except KeyError as e:
+            metrics.increment("errors.KeyError")
             print(f"Ошибка: Таблица или столбец не найден: {e}")
             return None
         except ValueError as e:
+            metrics.increment("errors.ValueError")
             print(f"Ошибка валидации: {e}")
             return None
         except TypeError as e:
+            metrics.increment("errors.TypeError")
             print(f"Ошибка типа данных: {e}")
             return None
         except Exception as e:
+            metrics.increment(f"errors.{type(e).__name__}")
             print(f"Произошла неизвестная ошибка: {e}")
             return None
 
@@ -44,8 +71,7 @@ def confirm_action(action_name):
             else:
                 message = f'Вы уверены, что хотите выполнить "{action_name}"? [y/n]: '
 
-            answer = prompt.string(message).strip().lower()
-            if answer == 'y' or answer == 'yes':
+            if confirm(message):
                 return func(*args, **kwargs)
             else:
                 print("операция отменена.")
@@ -62,30 +88,66 @@ def confirm_action(action_name):
 
 
 def log_time(func):
-    """декоратор для замера времени выполнения функции."""
+    """декоратор для замера времени выполнения функции.
+
+    Время записывается в гистограмму "function.<имя>" модуля metrics
+    (см. команду stats).
+    """
 
     def wrapper(*args, **kwargs):
-        start_time = time.monotonic()
-        result = func(*args, **kwargs)
-        end_time = time.monotonic()
-        elapsed = end_time - start_time
-        print(f"Функция {func.__name__} выполнилась за {elapsed:.3f} секунд")
-        return result
+        start_time = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            metrics.observe(f"function.{func.__name__}",
+                            time.perf_counter() - start_time)
 
     return wrapper
 
 
-def create_cacher():
-    """Фабрика для создания функции кэширования."""
-    cache = {}
+def create_cacher(max_size=128):
+    """Фабрика для создания функции кэширования.
+
+    Кэш хранит не более max_size результатов и вытесняет давно не
+    использованные. Ключ - кортеж, первый элемент которого (обычно имя
+    таблицы) используется для сброса связанных записей через invalidate.
+    """
+    cache = OrderedDict()
+    stats = {"hits": 0, "misses": 0, "evictions": 0}
+    # Кэш может использоваться из нескольких потоков (режим сервера)
+    lock = threading.Lock()
 
     def cache_result(key, value_func):
         """кэширует результат функции по ключу."""
-        if key in cache:
-            return cache[key]
+        with lock:
+            if key in cache:
+                cache.move_to_end(key)
+                stats["hits"] += 1
+                return cache[key]
+            stats["misses"] += 1
 
         result = value_func()
-        cache[key] = result
+        with lock:
+            cache[key] = result
+            if len(cache) > max_size:
+                cache.popitem(last=False)
+                stats["evictions"] += 1
         return result
 
+    def invalidate(tag=None):
+        """Сбрасывает записи с указанным первым элементом ключа или все."""
+        with lock:
+            if tag is None:
+                cache.clear()
+                return
+            for key in [k for k in cache if k[0] == tag]:
+                del cache[key]
+
+    def get_stats():
+        """Возвращает счетчики попаданий и промахов кэша."""
+        with lock:
+            return {**stats, "size": len(cache), "max_size": max_size}
+
+    cache_result.invalidate = invalidate
+    cache_result.stats = get_stats
     return cache_result
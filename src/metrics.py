@@ -0,0 +1,231 @@
+import bisect
+import io
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# Профилировщики (cProfile, pstats, tracemalloc) импортируются, только
+# когда профилирование включают: их импорт замедляет запуск
+
+# Границы корзин гистограмм задержек в секундах: от 1 мкс, каждая
+# следующая вдвое больше предыдущей (последняя - больше 16 секунд)
+BUCKET_BOUNDS = tuple(2 ** i / 1_000_000 for i in range(25))
+
+# Сколько строк выводить в отчетах профилировщиков
+PROFILE_TOP = 15
+
+PROFILE_KINDS = ("cpu", "memory")
+
+_lock = threading.Lock()
+# Гистограммы: имя -> {"count", "total", "min", "max", "buckets"}
+_histograms = {}
+# Счетчики событий: имя -> число
+_counters = {}
+# Функции, получающие каждый замер: listener(имя, секунды)
+_listeners = []
+# Стек фаз текущего потока: [имя, время вложенных фаз]
+_local = threading.local()
+_started = time.time()
+
+# Включенный профилировщик: None, "cpu" или "memory"
+_profiling = None
+_profiler = None
+
+
+def register_listener(listener):
+    """Регистрирует функцию, вызываемую при каждом замере.
+
+    listener(name, seconds) позволяет передавать замеры во внешние
+    системы мониторинга.
+    """
+    _listeners.append(listener)
+
+
+def increment(name, amount=1):
+    """Увеличивает счетчик событий."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def observe(name, seconds):
+    """Записывает длительность в гистограмму name."""
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = {
+                "count": 0, "total": 0.0, "min": seconds, "max": seconds,
+                "buckets": [0] * (len(BUCKET_BOUNDS) + 1)}
+        histogram["count"] += 1
+        histogram["total"] += seconds
+        histogram["min"] = min(histogram["min"], seconds)
+        histogram["max"] = max(histogram["max"], seconds)
+        histogram["buckets"][bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+
+    for listener in _listeners:
+        listener(name, seconds)
+
+
+@contextmanager
+def phase(name):
+    """Замеряет фазу обработки команды (parse, load, filter, ...).
+
+    В гистограмму "phase.<name>" попадает собственное время фазы: время
+    вложенных фаз вычитается, поэтому суммы фаз не пересекаются.
+    Вложенный вызов той же фазы считается ее частью.
+    """
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    if stack and stack[-1][0] == name:
+        yield
+        return
+
+    frame = [name, 0.0]
+    stack.append(frame)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stack.pop()
+        if stack:
+            stack[-1][1] += elapsed
+        observe(f"phase.{name}", elapsed - frame[1])
+
+
+def timed(name):
+    """Декоратор: вызов функции замеряется как фаза name."""
+
+    def decorator(func):
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+
+    return decorator
+
+
+def _percentile(histogram, percent):
+    """Оценка процентиля по корзинам: верхняя граница нужной корзины."""
+    rank = histogram["count"] * percent / 100
+    seen = 0
+    for bucket, count in enumerate(histogram["buckets"]):
+        seen += count
+        if seen >= rank and count:
+            if bucket == len(BUCKET_BOUNDS):
+                return histogram["max"]
+            return min(BUCKET_BOUNDS[bucket], histogram["max"])
+    return histogram["max"]
+
+
+def snapshot():
+    """Возвращает текущие счетчики и сводки гистограмм (время в мс)."""
+    with _lock:
+        histograms = {}
+        for name, histogram in sorted(_histograms.items()):
+            summary = {"count": histogram["count"],
+                       "total_ms": histogram["total"] * 1000,
+                       "mean_ms": histogram["total"] / histogram["count"] * 1000,
+                       "min_ms": histogram["min"] * 1000}
+            for percent in (50, 95, 99):
+                summary[f"p{percent}_ms"] = _percentile(histogram, percent) * 1000
+            summary["max_ms"] = histogram["max"] * 1000
+            histograms[name] = {key: round(value, 4)
+                                for key, value in summary.items()}
+        counters = dict(sorted(_counters.items()))
+
+    return {"uptime_s": round(time.time() - _started, 3),
+            "profiling": _profiling,
+            "counters": counters,
+            "histograms": histograms}
+
+
+def reset():
+    """Обнуляет все счетчики и гистограммы."""
+    global _started
+
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        _started = time.time()
+
+
+def export(filepath):
+    """Записывает снимок метрик в JSON-файл."""
+    with open(filepath, 'w', encoding='utf-8') as f:
+        json.dump(snapshot(), f, indent=4, ensure_ascii=False)
+
+
+def profiling():
+    """Возвращает включенный профилировщик: None, "cpu" или "memory"."""
+    return _profiling
+
+
+def start_profiling(kind):
+    """Включает профилирование процессора (cProfile) или памяти (tracemalloc).
+
+    cProfile замеряет только поток, в котором профилирование включено.
+    """
+    global _profiling, _profiler
+
+    if kind not in PROFILE_KINDS:
+        raise ValueError(f'Некорректный вид профилирования: {kind}. '
+                         f'Допустимые: {", ".join(PROFILE_KINDS)}')
+    stop_profiling()
+
+    if kind == "cpu":
+        import cProfile
+
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    else:
+        import tracemalloc
+
+        tracemalloc.start()
+    _profiling = kind
+
+
+def profiling_report(limit=PROFILE_TOP):
+    """Отчет включенного профилировщика в виде текста (или None)."""
+    if _profiling == "cpu":
+        import pstats
+
+        stream = io.StringIO()
+        # Сбор статистики выключает профилировщик - включаем его обратно
+        stats = pstats.Stats(_profiler, stream=stream)
+        _profiler.enable()
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+        return stream.getvalue().strip()
+
+    if _profiling == "memory":
+        import tracemalloc
+
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"Память: текущая {current / 1024:.1f} КБ, "
+                 f"пиковая {peak / 1024:.1f} КБ"]
+        top = tracemalloc.take_snapshot().statistics("lineno")[:limit]
+        lines += [str(stat) for stat in top]
+        return "\n".join(lines)
+
+    return None
+
+
+def stop_profiling():
+    """Выключает профилирование и возвращает его последний отчет."""
+    global _profiling, _profiler
+
+    report = profiling_report()
+    if _profiling == "cpu":
+        _profiler.disable()
+    elif _profiling == "memory":
+        import tracemalloc
+
+        tracemalloc.stop()
+
+    _profiling = None
+    _profiler = None
+    return report
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import string
+import subprocess
+import sys
+import tempfile
+import time
+from importlib import metadata as package_metadata
+
+from ..decorators import set_auto_confirm
+from . import core, utils
+from .constants import VALID_TYPES
+from .parser import parse_set, parse_where
+
+BENCHMARK_TABLE = "bench"
+DEFAULT_SCHEMA = "name:str,age:int,active:bool"
+PERCENTILES = (50, 90, 99)
+PACKAGE_NAME = "project-2-shilenko-nikolay-m25-555"
+# Команды, которые выполняет программа при замере запуска
+STARTUP_SCRIPT = "list_tables\nexit\n"
+
+
+def parse_schema(schema):
+    """Разбирает схему вида "имя:тип,имя:тип" в список столбцов."""
+    columns = [col.strip() for col in schema.split(",") if col.strip()]
+    if not columns:
+        raise ValueError("Схема должна содержать хотя бы один столбец.")
+    for col in columns:
+        name, _, col_type = col.partition(":")
+        if not name or col_type not in VALID_TYPES:
+            raise ValueError(f'Некорректный столбец "{col}". '
+                             f'Формат: имя:тип, типы: {", ".join(sorted(VALID_TYPES))}')
+        if name == "ID":
+            raise ValueError("Столбец ID создается автоматически.")
+    return columns
+
+
+def _random_value(col_type, rng):
+    """Случайное значение столбца в том виде, в каком его вводят в insert."""
+    if col_type == "int":
+        return str(rng.randrange(1000))
+    if col_type == "bool":
+        return rng.choice(("true", "false"))
+    return "".join(rng.choices(string.ascii_lowercase, k=8))
+
+
+def _random_row(columns, rng):
+    """Случайная запись: значения по порядку столбцов схемы."""
+    return [_random_value(col.split(":")[1], rng) for col in columns]
+
+
+def _percentile(sorted_values, percent):
+    """Процентиль по методу ближайшего ранга."""
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies, items=None):
+    """Сводка замеров операции: пропускная способность и задержки в мс.
+
+    items - сколько записей обработано за все замеры (по умолчанию по
+    одной на замер), по нему считается пропускная способность.
+    """
+    total = sum(latencies)
+    items = len(latencies) if items is None else items
+    ordered = sorted(latencies)
+    latency = {"mean": total / len(ordered) * 1000}
+    for percent in PERCENTILES:
+        latency[f"p{percent}"] = _percentile(ordered, percent) * 1000
+    latency["max"] = ordered[-1] * 1000
+
+    return {"count": items,
+            "total_s": total,
+            "ops_per_sec": items / total if total > 0 else None,
+            "latency_ms": {key: round(value, 4)
+                           for key, value in latency.items()}}
+
+
+def _measure(name, func, *args):
+    """Вызывает операцию ядра и возвращает время ее выполнения.
+
+    Ошибки ядра выводятся и превращаются в None, поэтому None в
+    результате означает, что замер недействителен.
+    """
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    if result is None:
+        raise RuntimeError(f"Операция {name} завершилась с ошибкой.")
+    return elapsed
+
+
+def _consume(rows):
+    """Дочитывает итератор записей select до конца."""
+    if rows is None:
+        return None
+    return sum(1 for _ in rows)
+
+
+def _run_operations(rows, ops, scans, columns, storage, rng):
+    """Выполняет операции над таблицей в текущем каталоге и замеряет их."""
+    metadata = utils.load_metadata()
+    metadata = core.create_table(metadata, BENCHMARK_TABLE, columns)
+    if metadata is None:
+        raise RuntimeError("Не удалось создать таблицу.")
+    if storage is not None and core.set_storage(
+            metadata, BENCHMARK_TABLE, storage) is None:
+        raise RuntimeError(f"Не удалось выбрать формат {storage}.")
+
+    results = {}
+
+    # Загрузка таблицы одним блоком
+    data = [_random_row(columns, rng) for _ in range(rows)]
+    elapsed = _measure("bulk_load", core.insert_many, metadata,
+                       BENCHMARK_TABLE, data)
+    results["bulk_load"] = summarize([elapsed], items=rows)
+
+    results["insert"] = summarize([
+        _measure("insert", core.insert, metadata, BENCHMARK_TABLE,
+                 _random_row(columns, rng))
+        for _ in range(ops)])
+
+    total_rows = rows + ops
+
+    def point_select():
+        where = parse_where(f"ID = {rng.randint(1, total_rows)}")
+        return _consume(core.select_iter(metadata, BENCHMARK_TABLE, where))
+
+    results["point_select"] = summarize([
+        _measure("point_select", point_select) for _ in range(ops)])
+
+    # Условие, которому почти все записи удовлетворяют: проверяется и
+    # выдается вся таблица
+    name, col_type = columns[0].split(":")
+
+    def full_scan():
+        value = _random_value(col_type, rng)
+        where = parse_where(f"{name} != {value}")
+        return _consume(core.select_iter(metadata, BENCHMARK_TABLE, where))
+
+    results["full_scan"] = summarize(
+        [_measure("full_scan", full_scan) for _ in range(scans)],
+        items=scans * total_rows)
+    results["full_scan"]["scans"] = scans
+
+    def cold_scan():
+        # Сбрасываем кэш: таблица читается из файлов
+        utils.invalidate_table_cache(BENCHMARK_TABLE)
+        return full_scan()
+
+    results["cold_scan"] = summarize(
+        [_measure("cold_scan", cold_scan) for _ in range(scans)],
+        items=scans * total_rows)
+    results["cold_scan"]["scans"] = scans
+
+    def update():
+        set_clause = parse_set(f"{name} = {_random_value(col_type, rng)}")
+        where = parse_where(f"ID = {rng.randint(1, total_rows)}")
+        return core.update(metadata, BENCHMARK_TABLE, set_clause, where)
+
+    results["update"] = summarize([
+        _measure("update", update) for _ in range(ops)])
+
+    deleted_ids = rng.sample(range(1, total_rows + 1), min(ops, total_rows))
+    results["delete"] = summarize([
+        _measure("delete", core.delete, metadata, BENCHMARK_TABLE,
+                 parse_where(f"ID = {row_id}"))
+        for row_id in deleted_ids])
+
+    utils.save_metadata(metadata)
+    utils.sync_files()
+    return results
+
+
+def _project_root():
+    """Каталог, из которого импортируется пакет программы."""
+    path = os.path.dirname(os.path.abspath(__file__))
+    for _ in __package__.split("."):
+        path = os.path.dirname(path)
+    return path
+
+
+def _measure_startup(starts):
+    """Замеряет холодный запуск программы в отдельном процессе.
+
+    Каждый запуск - новый интерпретатор, который выполняет
+    STARTUP_SCRIPT в текущем каталоге и завершается.
+    """
+    command = [sys.executable, "-m", f"{__package__}.main", "-f", "-"]
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        path for path in (_project_root(), env.get("PYTHONPATH")) if path)
+
+    latencies = []
+    for _ in range(starts):
+        start = time.perf_counter()
+        result = subprocess.run(command, input=STARTUP_SCRIPT, text=True,
+                                env=env, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE)
+        latencies.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            raise RuntimeError(f"Запуск программы завершился с ошибкой: "
+                               f"{result.stderr.strip()}")
+    return summarize(latencies)
+
+
+def _package_version():
+    """Версия установленного пакета или None, если он не установлен."""
+    try:
+        return package_metadata.version(PACKAGE_NAME)
+    except package_metadata.PackageNotFoundError:
+        return None
+
+
+def run_benchmark(rows=10000, ops=200, scans=5, schema=DEFAULT_SCHEMA,
+                  storage=None, seed=0, starts=5):
+    """Замеряет основные операции на синтетической таблице.
+
+    Таблица создается во временном каталоге и удаляется после замеров.
+    starts - сколько раз замерить холодный запуск программы (0 - не
+    замерять). Возвращает словарь с параметрами запуска и результатами
+    операций, пригодный для записи в JSON.
+    """
+    if rows < 1 or ops < 1 or scans < 1:
+        raise ValueError("Размеры замеров должны быть положительными.")
+    if starts < 0:
+        raise ValueError("Число запусков не может быть отрицательным.")
+    columns = parse_schema(schema)
+    rng = random.Random(seed)
+
+    previous_dir = os.getcwd()
+    set_auto_confirm(True)
+    with tempfile.TemporaryDirectory(prefix="primitive_db_bench_") as workdir:
+        os.chdir(workdir)
+        try:
+            # Запуск замеряется на пустой базе, до создания таблицы
+            startup = _measure_startup(starts) if starts else None
+            # Сообщения команд не должны влиять на замеры и вывод JSON
+            with open(os.devnull, 'w', encoding='utf-8') as devnull, \
+                    contextlib.redirect_stdout(devnull):
+                results = _run_operations(rows, ops, scans, columns,
+                                          storage, rng)
+        finally:
+            os.chdir(previous_dir)
+            set_auto_confirm(None)
+
+    if startup is not None:
+        results["startup"] = startup
+    return {"version": _package_version(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "parameters": {"rows": rows, "ops": ops, "scans": scans,
+                           "schema": columns, "storage": storage or "default",
+                           "seed": seed, "starts": starts},
+            "results": results}
+
+
+def compare(baseline, report, file=None):
+    """Выводит изменение пропускной способности относительно baseline."""
+    print("Операция        было, оп/с     стало, оп/с   изменение", file=file)
+    for name, result in report["results"].items():
+        before = baseline.get("results", {}).get(name, {}).get("ops_per_sec")
+        after = result["ops_per_sec"]
+        if not before or not after:
+            continue
+        change = (after / before - 1) * 100
+        print(f"{name:<14}{before:>12.0f}{after:>16.0f}{change:>+11.1f}%",
+              file=file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="benchmark",
+        description="Замеры операций базы данных на синтетической таблице")
+    parser.add_argument("--rows", type=int, default=10000,
+                        help="записей в таблице (по умолчанию 10000)")
+    parser.add_argument("--ops", type=int, default=200,
+                        help="замеров insert/select/update/delete "
+                             "(по умолчанию 200)")
+    parser.add_argument("--scans", type=int, default=5,
+                        help="полных просмотров таблицы (по умолчанию 5)")
+    parser.add_argument("--schema", default=DEFAULT_SCHEMA,
+                        help=f'столбцы таблицы (по умолчанию "{DEFAULT_SCHEMA}")')
+    parser.add_argument("--storage", choices=list(utils.STORAGE_BACKENDS),
+                        help="формат хранения таблицы")
+    parser.add_argument("--starts", type=int, default=5,
+                        help="холодных запусков программы "
+                             "(по умолчанию 5, 0 - не замерять)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="начальное значение генератора данных")
+    parser.add_argument("-o", "--output",
+                        help="записать результат в JSON-файл вместо stdout")
+    parser.add_argument("--compare", metavar="FILE",
+                        help="сравнить с прошлым результатом из JSON-файла")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare is not None:
+        try:
+            with open(args.compare, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            parser.error(f"не удалось прочитать {args.compare}: {e}")
+
+    try:
+        report = run_benchmark(args.rows, args.ops, args.scans, args.schema,
+                               args.storage, args.seed, args.starts)
+    except (ValueError, RuntimeError) as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    text = json.dumps(report, indent=4, ensure_ascii=False)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+
+    if baseline is not None:
+        # Если JSON выводится в stdout, сравнение идет в stderr
+        compare(baseline, report,
+                sys.stderr if args.output is None else sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
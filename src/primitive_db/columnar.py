@@ -0,0 +1,149 @@
+import array
+import json
+import struct
+import sys
+
+from .compact import column_getter, row_class
+
+# Формат файла: MAGIC, длина заголовка (4 байта), заголовок в JSON,
+# затем блоки столбцов. Смещения блоков указаны в заголовке относительно
+# начала первого блока.
+MAGIC = b"PDBCOL1\n"
+HEADER_LENGTH = struct.Struct("<I")
+
+# Типы кодов для словарного кодирования строк, от меньшего к большему
+CODE_TYPECODES = (("B", 1 << 8), ("H", 1 << 16), ("I", 1 << 32))
+
+
+def _column_type(values):
+    """Определяет тип столбца по его значениям."""
+    for value in values:
+        if isinstance(value, bool):
+            return "bool"
+        if isinstance(value, int):
+            return "int"
+        return "str"
+    return "str"
+
+
+def _encode_int(values):
+    """Кодирует целые числа в массив int64."""
+    try:
+        return {}, array.array("q", values).tobytes()
+    except OverflowError as e:
+        raise ValueError("Число не помещается в 64 бита и не может быть "
+                         "сохранено в колоночном формате") from e
+
+
+def _encode_bool(values):
+    """Кодирует булевы значения в битовую карту."""
+    bitmap = bytearray((len(values) + 7) // 8)
+    for i, value in enumerate(values):
+        if value:
+            bitmap[i >> 3] |= 1 << (i & 7)
+    return {}, bytes(bitmap)
+
+
+def _encode_str(values):
+    """Кодирует строки словарем уникальных значений и массивом кодов."""
+    dictionary = {}
+    codes = [dictionary.setdefault(value, len(dictionary)) for value in values]
+
+    for typecode, limit in CODE_TYPECODES:
+        if len(dictionary) <= limit:
+            break
+
+    words = json.dumps(list(dictionary), ensure_ascii=False).encode("utf-8")
+    block = words + array.array(typecode, codes).tobytes()
+    return {"typecode": typecode, "dict_size": len(words)}, block
+
+
+def _decode_int(block, info, rows_count):
+    """Декодирует массив int64."""
+    values = array.array("q")
+    values.frombytes(block)
+    if info["byteorder"] != sys.byteorder:
+        values.byteswap()
+    return values.tolist()
+
+
+def _decode_bool(block, info, rows_count):
+    """Декодирует битовую карту булевых значений."""
+    return [bool(block[i >> 3] >> (i & 7) & 1) for i in range(rows_count)]
+
+
+def _decode_str(block, info, rows_count):
+    """Декодирует строки по словарю и массиву кодов."""
+    dict_size = info["dict_size"]
+    dictionary = json.loads(block[:dict_size].decode("utf-8"))
+    codes = array.array(info["typecode"])
+    codes.frombytes(block[dict_size:])
+    if info["byteorder"] != sys.byteorder:
+        codes.byteswap()
+    return [dictionary[code] for code in codes]
+
+
+ENCODERS = {"int": _encode_int, "bool": _encode_bool, "str": _encode_str}
+DECODERS = {"int": _decode_int, "bool": _decode_bool, "str": _decode_str}
+
+
+def write_table(filepath, rows):
+    """Записывает строки таблицы в файл колоночного формата."""
+    column_names = list(rows[0]) if rows else []
+
+    columns = []
+    blocks = []
+    offset = 0
+    for name in column_names:
+        values = list(map(column_getter(rows, name), rows))
+        col_type = _column_type(values)
+        info, block = ENCODERS[col_type](values)
+        info.update(name=name, type=col_type, offset=offset, size=len(block),
+                    byteorder=sys.byteorder)
+        columns.append(info)
+        blocks.append(block)
+        offset += len(block)
+
+    header = json.dumps({"rows": len(rows), "columns": columns},
+                        ensure_ascii=False).encode("utf-8")
+    with open(filepath, "wb") as f:
+        f.write(MAGIC)
+        f.write(HEADER_LENGTH.pack(len(header)))
+        f.write(header)
+        for block in blocks:
+            f.write(block)
+
+
+def read_table(filepath, columns=None, compact=True):
+    """Читает строки таблицы из файла колоночного формата.
+
+    columns - имена нужных столбцов: с диска читаются и декодируются
+    только их блоки (по умолчанию - все столбцы). Строки со всеми
+    столбцами создаются сразу компактными, если compact не False.
+    """
+    with open(filepath, "rb") as f:
+        prefix = f.read(len(MAGIC) + HEADER_LENGTH.size)
+        if not prefix.startswith(MAGIC):
+            raise ValueError(f"Файл {filepath} не в колоночном формате")
+
+        (header_size,) = HEADER_LENGTH.unpack_from(prefix, len(MAGIC))
+        header = json.loads(f.read(header_size).decode("utf-8"))
+        start = len(prefix) + header_size
+
+        rows_count = header["rows"]
+        names = []
+        values = []
+        for info in header["columns"]:
+            if columns is not None and info["name"] not in columns:
+                continue
+            f.seek(start + info["offset"])
+            block = f.read(info["size"])
+            names.append(info["name"])
+            values.append(DECODERS[info["type"]](block, info, rows_count))
+
+    if not names:
+        return [{} for _ in range(rows_count)]
+    cls = row_class(names) if columns is None and compact else None
+    if cls is not None:
+        return [cls(*row) for row in zip(*values)]
+    return [dict(zip(names, row)) for row in zip(*values)]
@@ -0,0 +1,218 @@
+import keyword
+import sys
+from operator import attrgetter, itemgetter
+
+# Сколько строк таблицы просматривать для оценки занимаемой памяти
+MEMORY_SAMPLE = 1000
+
+
+class Row:
+    """Строка таблицы, значения которой хранятся в слотах.
+
+    Имена столбцов общие для всех строк класса, поэтому строка занимает
+    втрое меньше памяти, чем словарь. Строка читается и изменяется как
+    словарь: row[col], keys(), items(), get(), update(), dict(row).
+    Классы строк создает row_class - по одному на набор столбцов.
+    """
+
+    __slots__ = ()
+    _columns = ()
+    _index = frozenset()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        if key not in self._index:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __iter__(self):
+        return iter(self._columns)
+
+    def __len__(self):
+        return len(self._columns)
+
+    def __eq__(self, other):
+        if isinstance(other, (Row, dict)):
+            return as_dict(self) == as_dict(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(as_dict(self))
+
+    def __reduce__(self):
+        # Класс строки создается во время работы, поэтому в pickle
+        # передаются имена столбцов, а не ссылка на класс
+        return _restore, (self._columns, self.values())
+
+    def keys(self):
+        return self._columns
+
+    def values(self):
+        return self._values(self)
+
+    def items(self):
+        return zip(self._columns, self._values(self))
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self._index else default
+
+    def update(self, other=(), **kwargs):
+        for key, value in dict(other, **kwargs).items():
+            self[key] = value
+
+    def copy(self):
+        return type(self)(*self.values())
+
+
+# Классы строк: кортеж имен столбцов -> класс (или None)
+_classes = {}
+
+
+def row_class(columns):
+    """Класс компактных строк для набора столбцов.
+
+    None, если столбцы не годятся в имена слотов (не идентификаторы,
+    ключевые слова или имена методов строки) - такие таблицы хранятся в
+    словарях.
+    """
+    columns = tuple(columns)
+    if columns in _classes:
+        return _classes[columns]
+
+    cls = None
+    if columns and all(col.isidentifier() and not keyword.iskeyword(col)
+                       and not hasattr(Row, col) for col in columns):
+        args = ", ".join(f"_{i}" for i in range(len(columns)))
+        body = "".join(f"\n    self.{col} = _{i}"
+                       for i, col in enumerate(columns))
+        namespace = {}
+        exec(f"def __init__(self, {args}):{body}", namespace)
+
+        getter = attrgetter(*columns)
+        if len(columns) == 1:
+            def getter(row, _get=getter):
+                return (_get(row),)
+
+        cls = type("Row", (Row,), {"__slots__": columns,
+                                   "__init__": namespace["__init__"],
+                                   "_columns": columns,
+                                   "_index": frozenset(columns),
+                                   "_values": staticmethod(getter)})
+    _classes[columns] = cls
+    return cls
+
+
+def _restore(columns, values):
+    """Восстанавливает строку из pickle."""
+    return row_class(columns)(*values)
+
+
+def compact_rows(rows, columns=None):
+    """Переводит строки-словари в компактные строки.
+
+    Набор столбцов берется из columns или из первой строки. Если столбцы
+    не годятся для слотов или строки различаются по составу столбцов,
+    возвращается исходный список: строки переводятся все или ни одна.
+    """
+    if not rows:
+        return rows
+    columns = tuple(rows[0]) if columns is None else tuple(columns)
+    cls = row_class(columns)
+    if cls is None:
+        return rows
+
+    getter = itemgetter(*columns)
+    if len(columns) == 1:
+        def getter(row, _get=getter):
+            return (_get(row),)
+    try:
+        return [row if type(row) is cls else cls(*getter(row))
+                for row in rows]
+    except KeyError:
+        return rows
+
+
+def compact_like(rows, new_rows):
+    """Приводит новые строки-словари к виду строк таблицы rows.
+
+    Строки таблицы однородны - все компактные одного класса или все
+    словари, поэтому вид строк можно узнать по первой (см. is_compact).
+    """
+    if not rows:
+        return compact_rows(new_rows)
+    if is_compact(rows):
+        return compact_rows(new_rows, rows[0].keys())
+    return new_rows
+
+
+def is_compact(rows):
+    """Хранятся ли строки таблицы в компактном виде."""
+    return bool(rows) and isinstance(rows[0], Row)
+
+
+def row_ids(rows):
+    """Список ID строк таблицы в их порядке."""
+    if is_compact(rows):
+        return [row.ID for row in rows]
+    return [row["ID"] for row in rows]
+
+
+def column_getter(rows, column):
+    """Функция row -> row[column] для строк таблицы rows.
+
+    У компактных строк столбец читается как атрибут - это втрое
+    быстрее, чем row[column] через Row.__getitem__.
+    """
+    return attrgetter(column) if is_compact(rows) else itemgetter(column)
+
+
+def as_dict(row):
+    """Копия строки (компактной или словаря) в виде словаря."""
+    if isinstance(row, Row):
+        return dict(zip(row._columns, row._values(row)))
+    return dict(row)
+
+
+def to_dict(row):
+    """Превращает строку в словарь (для json.dump(..., default=to_dict))."""
+    if isinstance(row, Row):
+        return as_dict(row)
+    raise TypeError(f"Object of type {type(row).__name__} "
+                    f"is not JSON serializable")
+
+
+def estimate_size(rows, sample=MEMORY_SAMPLE):
+    """Оценка памяти под строки таблицы в байтах.
+
+    Размер считается по выборке из sample строк. Возвращает пару (байт
+    сейчас, байт, если бы строки были словарями). Значения, общие для
+    нескольких строк выборки, учитываются один раз.
+    """
+    container = sys.getsizeof(rows)
+    if not rows:
+        return container, container
+
+    picked = rows[::max(1, len(rows) // sample)]
+    seen = set()
+    values_size = rows_size = dicts_size = 0
+    for row in picked:
+        rows_size += sys.getsizeof(row)
+        dicts_size += sys.getsizeof(as_dict(row))
+        for value in row.values():
+            if id(value) not in seen:
+                seen.add(id(value))
+                values_size += sys.getsizeof(value)
+
+    scale = len(rows) / len(picked)
+    return (container + round((rows_size + values_size) * scale),
+            container + round((dicts_size + values_size) * scale))
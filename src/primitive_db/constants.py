@@ -1,3 +1,54 @@
 META_FILE = "db_meta.json"
+# Журнал фиксируемой транзакции (есть на диске только во время COMMIT)
+TRANSACTION_FILE = "db_transaction.json"
 DATA_DIR = "data/"
-VALID_TYPES = {"int", "str", "bool"}
\ No newline at end of file
+VALID_TYPES = {"int", "str", "bool"}
+# Формат хранения новых таблиц (json, columnar, records или segmented)
+DEFAULT_STORAGE = "json"
+
+# Журнал изменений (write-ahead log) таблиц
+WAL_ENABLED = True
+WAL_COMPACT_THRESHOLD = 1000
+
+# Политика fsync при записи файлов:
+# "always" - после каждой записи, "interval" - не чаще раза в
+# FSYNC_INTERVAL_MS миллисекунд (и при выходе), "never" - не вызывать
+FSYNC_POLICY = "interval"
+FSYNC_INTERVAL_MS = 200
+
+# Кэш таблиц в памяти (оценка по размеру файлов на диске, в байтах)
+TABLE_CACHE_BUDGET = 64 * 1024 * 1024
+
+# Служебный раздел метаданных с настройками таблиц (индексы и т.п.)
+SERVICE_KEY = "__service__"
+
+# Количество строк на одной странице вывода select
+SELECT_PAGE_SIZE = 100
+
+# Режим просмотра таблиц при фильтрации и агрегации: "auto" - массивы
+# NumPy для таблиц от VECTORIZE_MIN_ROWS строк (если NumPy установлен),
+# "numpy" - всегда массивы, "python" - построчная проверка
+SCAN_MODE = "auto"
+VECTORIZE_MIN_ROWS = 5000
+
+# Параллельный просмотр больших таблиц: число процессов (None - по числу
+# процессоров) и минимальное число строк, с которого он выгоднее
+PARALLEL_WORKERS = None
+PARALLEL_MIN_ROWS = 200000
+
+# Рекомендательная блокировка базы между процессами: файл блокировки и
+# сколько секунд ждать, пока его освободит другой процесс
+LOCK_FILE = "db.lock"
+LOCK_TIMEOUT = 10
+
+# Сервер базы данных: адрес по умолчанию и число потоков для команд
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 7654
+SERVER_WORKERS = 4
+
+# Сегментированные таблицы: записей в сегменте при разбиении по
+# диапазонам ID и число сегментов при разбиении по хэшу столбца
+SEGMENT_ROWS = 10000
+SEGMENT_COUNT = 16
+# Кэш прочитанных сегментов незагруженных таблиц (по размеру файлов, в байтах)
+SEGMENT_CACHE_BUDGET = 16 * 1024 * 1024
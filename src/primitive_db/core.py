@@ -1,13 +1,149 @@
+import heapq
+import itertools
+import time
+from operator import itemgetter
+
 from ..decorators import confirm_action, handle_db_errors, log_time
-from .constants import DATA_DIR, VALID_TYPES
-from .utils import load_table_data, save_table_data
+from ..metrics import increment, timed
+from . import compact, indexes, parallel, segments, vectorized
+from .constants import SERVICE_KEY, VALID_TYPES
+from .utils import (
+    begin_transaction,
+    commit_transaction,
+    compact_table_log,
+    convert_table_storage,
+    count_table_rows,
+    get_rows_by_id,
+    get_segment_files,
+    get_segment_manifest,
+    get_table_storage,
+    in_transaction,
+    invalidate_table_cache,
+    load_segment,
+    load_table_columns,
+    load_table_data,
+    log_changes,
+    max_row_id,
+    peek_table_data,
+    read_import_file,
+    remove_table_data,
+    rollback_transaction,
+    save_table_data,
+    state_lock,
+    table_signature,
+    table_state,
+    write_table_changes,
+)
+
+# Вид индекса -> ключ списка индексированных столбцов в настройках таблицы
+INDEX_SETTINGS = {"hash": "indexes", "sorted": "sorted_indexes"}
+
+# Типы столбцов, по которым можно строить упорядоченный индекс
+SORTED_INDEX_TYPES = ("int", "str")
+
+# Сколько ID читать за раз при выводе в порядке упорядоченного индекса
+ORDER_FETCH_SIZE = 256
+
+# Индекс таблицы используется в соединении вместо хэш-таблицы, если
+# другая таблица хотя бы во столько раз меньше: поиск по индексу дороже
+# вставки строки в хэш-таблицу, зато таблица читается не целиком
+JOIN_INDEX_RATIO = 4
+
+
+def _check_table(metadata, table_name):
+    """Проверяет, что таблица существует."""
+    if table_name not in metadata or table_name == SERVICE_KEY:
+        raise KeyError(f'Таблица "{table_name}" не существует.')
+
+
+def _check_no_transaction(command):
+    """Запрещает команды, меняющие структуру таблиц, внутри транзакции."""
+    if in_transaction():
+        raise ValueError(f'Команда {command} недоступна внутри транзакции.')
+
+
+def _table_settings(metadata, table_name):
+    """Возвращает служебные настройки таблицы (только для чтения)."""
+    return metadata.get(SERVICE_KEY, {}).get(table_name, {})
+
+
+def _edit_table_settings(metadata, table_name):
+    """Возвращает служебные настройки таблицы для изменения."""
+    return metadata.setdefault(SERVICE_KEY, {}).setdefault(table_name, {})
+
+
+def _allocate_ids(metadata, table_name, count=1):
+    """Выделяет count новых ID и возвращает первый из них.
+
+    Счетчик хранится в метаданных, поэтому ID не используются повторно
+    после удаления записей. Метаданные сохраняются отдельно от файлов
+    таблицы и могут отстать от них (сбой между записью журнала и
+    метаданных), поэтому ID не бывает меньше ID, записанных в журнал
+    или файл записей (см. max_row_id) - для этого таблица не загружается.
+    """
+    settings = _edit_table_settings(metadata, table_name)
+    next_id = settings.get("next_id")
+    if next_id is None:
+        # Таблица создана до появления счетчика
+        next_id = max(compact.row_ids(load_table_data(table_name)),
+                      default=0) + 1
+    next_id = max(next_id, max_row_id(table_name) + 1)
+    settings["next_id"] = next_id + count
+    return next_id
+
+
+def _stored_row_count(metadata, table_name):
+    """Количество строк из метаданных или None, если оно устарело.
+
+    Вместе с количеством хранится сигнатура файлов таблицы, поэтому
+    запись в обход метаданных (или сбой до их сохранения) не дает
+    неверного ответа - строки тогда просто пересчитываются.
+    """
+    stored = _table_settings(metadata, table_name).get("row_count")
+    if stored is not None and stored["state"] == table_state(table_name):
+        return stored["rows"]
+    return None
+
+
+def _remember_row_count(metadata, table_name, rows):
+    """Запоминает количество строк таблицы в ее настройках."""
+    # Счетчик обновляет и чтение, поэтому в режиме сервера метаданные
+    # не должны меняться, пока другой поток их записывает
+    with state_lock:
+        settings = _edit_table_settings(metadata, table_name)
+        if rows is None:
+            settings.pop("row_count", None)
+        else:
+            settings["row_count"] = {"rows": rows,
+                                     "state": table_state(table_name)}
+
+
+def _update_row_count(metadata, table_name, rows_before, delta):
+    """Обновляет сохраненное количество строк после записи в таблицу."""
+    rows = rows_before + delta if rows_before is not None else None
+    if rows is None:
+        table_data = peek_table_data(table_name)
+        rows = len(table_data) if table_data is not None else None
+    _remember_row_count(metadata, table_name, rows)
+
+
+def _row_count(metadata, table_name):
+    """Возвращает количество строк, по возможности из метаданных."""
+    rows = _stored_row_count(metadata, table_name)
+    if rows is None:
+        rows = count_table_rows(table_name)
+        _remember_row_count(metadata, table_name, rows)
+    return rows
 
 
 @handle_db_errors
 def create_table(metadata, table_name, columns):
     """Создает новую таблицу в метаданных."""
+    _check_no_transaction("create_table")
     if table_name in metadata:
         raise ValueError(f'Таблица "{table_name}" уже существует.')
+    if table_name == SERVICE_KEY:
+        raise ValueError(f'Имя "{table_name}" зарезервировано.')
 
     table_columns = []
 
@@ -26,11 +162,13 @@ def create_table(metadata, table_name, columns):
         table_columns.append(f"{col_name}:{col_type}")
 
     metadata[table_name] = table_columns
+    _edit_table_settings(metadata, table_name)["next_id"] = 1
     print(f'Таблица "{table_name}" успешно создана'
           f' со столбцами: {", ".join(table_columns)}')
 
     # пустой файл данных для таблицы
     save_table_data(table_name, [])
+    _remember_row_count(metadata, table_name, 0)
 
     return metadata
 
@@ -39,18 +177,18 @@ def create_table(metadata, table_name, columns):
 @confirm_action("удаление таблицы")
 def drop_table(metadata, table_name):
     """Удаляет таблицу из метаданных."""
-    if table_name not in metadata:
-        raise KeyError(f'Таблица "{table_name}" не существует.')
+    _check_no_transaction("drop_table")
+    _check_table(metadata, table_name)
 
+    settings = metadata.get(SERVICE_KEY, {}).pop(table_name, {})
     del metadata[table_name]
     print(f'Таблица "{table_name}" успешно удалена.')
 
-    # Удаляем файл с данными таблицы если онесть
-    try:
-        import os
-        os.remove(f"{DATA_DIR}{table_name}.json")
-    except FileNotFoundError:
-        pass
+    # Удаляем файлы с данными таблицы если они есть
+    remove_table_data(table_name)
+    for kind, key in INDEX_SETTINGS.items():
+        indexes.drop_indexes(table_name, settings.get(key, []), kind)
+    invalidate_table_cache(table_name)
 
     return metadata
 
@@ -58,11 +196,12 @@ def drop_table(metadata, table_name):
 @handle_db_errors
 def list_tables(metadata):
     """Выводит список всех таблиц."""
-    if not metadata:
+    tables = [name for name in metadata if name != SERVICE_KEY]
+    if not tables:
         print("Нет созданных таблиц.")
         return
 
-    for table_name in metadata:
+    for table_name in tables:
         print(f"- {table_name}")
 
 
@@ -85,15 +224,95 @@ def _convert_value(value_str, col_type):
         return value_str
 
 
+def _convert_import_value(value, col_type):
+    """Преобразует значение из файла импорта в нужный тип.
+
+    Значения из JSONL уже могут иметь нужный тип, остальные проходят
+    через те же правила, что и значения команды insert. null в JSONL
+    и недостающее поле CSV - ошибка, а не строка "None".
+    """
+    if value is None:
+        raise ValueError(f"Нет значения для столбца типа {col_type}")
+    if col_type == "int" and type(value) is int:
+        return value
+    if col_type == "bool" and isinstance(value, bool):
+        return value
+    if col_type == "str" and isinstance(value, str):
+        return value
+    return _convert_value(str(value), col_type)
+
+
+@handle_db_errors
+def insert_many(metadata, table_name, rows):
+    """Добавляет в таблицу много записей за одну запись на диск.
+
+    rows - последовательность списков значений (в порядке столбцов) или
+    словарей столбец -> значение. Если хотя бы одна запись некорректна,
+    таблица не изменяется.
+    """
+    _check_table(metadata, table_name)
+    start_time = time.monotonic()
+
+    # получаем схему столбцов (без id)
+    columns_schema = [col.split(":") for col in metadata[table_name][1:]]
+
+    new_rows = []
+    for line_number, values in enumerate(rows, start=1):
+        if isinstance(values, dict):
+            missing = [name for name, _ in columns_schema if name not in values]
+            if missing:
+                raise ValueError(f'Запись {line_number}: нет значений для '
+                                 f'столбцов {", ".join(missing)}')
+            values = [values[name] for name, _ in columns_schema]
+        elif len(values) != len(columns_schema):
+            raise ValueError(f'Запись {line_number}: ожидается '
+                             f'{len(columns_schema)} значений, '
+                             f'получено {len(values)}')
+
+        new_row = {"ID": None}
+        try:
+            for (col_name, col_type), value in zip(columns_schema, values):
+                new_row[col_name] = _convert_import_value(value, col_type)
+        except ValueError as e:
+            raise ValueError(f'Запись {line_number}: {e}') from e
+        new_rows.append(new_row)
+
+    if not new_rows:
+        print("Нет записей для добавления.")
+        return []
+
+    # ID выделяем одним блоком
+    first_id = _allocate_ids(metadata, table_name, len(new_rows))
+    for offset, new_row in enumerate(new_rows):
+        new_row["ID"] = first_id + offset
+
+    rows_before = _stored_row_count(metadata, table_name)
+    table_data = load_table_data(table_name)
+    new_rows = compact.compact_like(table_data, new_rows)
+    table_data.extend(new_rows)
+    save_table_data(table_name, table_data,
+                    [{"op": "insert", "row": row} for row in new_rows])
+    _update_row_count(metadata, table_name, rows_before, len(new_rows))
+
+    elapsed = time.monotonic() - start_time
+    rate = len(new_rows) / elapsed if elapsed > 0 else float("inf")
+    print(f'Добавлено {len(new_rows)} записей в таблицу "{table_name}" '
+          f'за {elapsed:.3f} секунд ({rate:.0f} записей/сек).')
+    return new_rows
+
+
+@handle_db_errors
+def import_table(metadata, table_name, filepath):
+    """Импортирует записи в таблицу из CSV или JSONL файла."""
+    _check_table(metadata, table_name)
+    return insert_many(metadata, table_name, read_import_file(filepath))
+
+
 @handle_db_errors
 @log_time
 def insert(metadata, table_name, values):
     """Добавляет новую запись в таблицу."""
-    if table_name not in metadata:
-        raise KeyError(f'Таблица "{table_name}" не существует.')
-
-    # загрузить данные таблицы
-    table_data = load_table_data(table_name)
+    _check_table(metadata, table_name)
 
     # получаем схему столбцов (без id)
     columns_schema = metadata[table_name][1:]  # Пропускаем ID:int
@@ -103,63 +322,891 @@ def insert(metadata, table_name, values):
         raise ValueError(f'Ожидается {len(columns_schema)} значений, '
                          f'получено {len(values)}')
 
-    # Генерим новый ID
-    if table_data:
-        max_id = max(row["ID"] for row in table_data)
-        new_id = max_id + 1
-    else:
-        new_id = 1
-
-    # Создаем новую запись
-    new_row = {"ID": new_id}
-
     # Добавить значения с проверкой типов
+    new_row = {"ID": None}
     for i, col_schema in enumerate(columns_schema):
         col_name, col_type = col_schema.split(":")
         converted_value = _convert_value(values[i], col_type)
         new_row[col_name] = converted_value
 
-    # запись в данные
-    table_data.append(new_row)
+    # ID выделяем только для прошедшей проверку записи
+    new_id = _allocate_ids(metadata, table_name)
+    new_row["ID"] = new_id
+
+    # запись в данные, если таблица уже загружена
+    rows_before = _stored_row_count(metadata, table_name)
+    table_data = peek_table_data(table_name)
+    new_row = compact.compact_like(table_data, [new_row])[0]
+    if table_data is not None:
+        table_data.append(new_row)
 
     # сохраняем данные
-    save_table_data(table_name, table_data)
+    write_table_changes(table_name, table_data,
+                        [{"op": "insert", "row": new_row}])
+    _update_row_count(metadata, table_name, rows_before, 1)
 
     print(f'Запись с ID={new_id} успешно добавлена в таблицу "{table_name}".')
-    return table_data
+    return new_row
+
+
+# Операторы сравнения условия WHERE и их запись в Python
+PYTHON_OPS = {"=": "==", "!=": "!=", "<": "<", "<=": "<=", ">": ">", ">=": ">="}
+
+
+def _column_types(metadata, table_name):
+    """Возвращает словарь столбец -> тип для таблицы."""
+    return dict(col.split(":", 1) for col in metadata[table_name])
+
+
+def _where_tree(where_clause):
+    """Приводит условие WHERE к дереву из parser.parse_where.
+
+    Словарь {столбец: значение} означает равенство по всем столбцам.
+    """
+    if isinstance(where_clause, dict):
+        nodes = tuple(("cmp", col, "=", str(val))
+                      for col, val in where_clause.items())
+        return nodes[0] if len(nodes) == 1 else ("and", nodes)
+    return where_clause
+
+
+def _typed_where(where, column_types):
+    """Приводит значения условия к типам столбцов один раз на запрос."""
+    kind = where[0]
+    if kind in ("and", "or"):
+        return (kind, tuple(_typed_where(node, column_types)
+                            for node in where[1]))
+
+    col = where[1]
+    if col not in column_types:
+        raise KeyError(f'Столбец "{col}" не найден.')
+    col_type = column_types[col]
+    if kind == "in":
+        return ("in", col, tuple(_convert_value(val, col_type)
+                                 for val in where[2]))
+    return ("cmp", col, where[2], _convert_value(where[3], col_type))
+
+
+def _compile_where(where, attributes=False):
+    """Компилирует типизированное условие в одну функцию row -> bool.
+
+    attributes=True читает столбцы как атрибуты компактных строк.
+    """
+    constants = {}
+
+    def column(name):
+        return f"row.{name}" if attributes else f"row[{name!r}]"
+
+    def emit(node):
+        kind = node[0]
+        if kind in ("and", "or"):
+            return "(" + f" {kind} ".join(emit(child) for child in node[1]) + ")"
+
+        name = f"_v{len(constants)}"
+        if kind == "in":
+            constants[name] = frozenset(node[2])
+            return f"({column(node[1])} in {name})"
+        constants[name] = node[3]
+        return f"({column(node[1])} {PYTHON_OPS[node[2]]} {name})"
+
+    source = f"lambda row: {emit(where)}"
+    return eval(source, {"__builtins__": {}, **constants})
+
+
+def _where_columns(where):
+    """Множество столбцов, которые проверяет условие."""
+    if where[0] in ("and", "or"):
+        return set().union(*(_where_columns(node) for node in where[1]))
+    return {where[1]}
+
+
+def _read_columns(columns, where=None, order_by=None):
+    """Столбцы, которые нужно прочитать для проекции на columns.
+
+    Кроме самих столбцов нужны столбцы условия, сортировки и ID (по
+    нему строки упорядочиваются и сливаются с журналом). Возвращает
+    кортеж, пригодный для ключа кэша, или None - читать все столбцы.
+    """
+    if columns is None:
+        return None
+    needed = set(columns) | {"ID"}
+    if where:
+        needed |= _where_columns(_where_tree(where))
+    if order_by is not None:
+        needed.add(order_by[0])
+    return tuple(sorted(needed))
+
+
+def _project(rows, columns):
+    """Оставляет в строках только столбцы columns в заданном порядке."""
+    if columns is None:
+        return rows
+    return ({col: row[col] for col in columns} for row in rows)
+
+
+def _check_columns(column_types, columns):
+    """Проверяет столбцы проекции."""
+    for col in columns or ():
+        if col not in column_types:
+            raise KeyError(f'Столбец "{col}" не найден.')
+
+
+def _range_ids(table_name, col, op, value):
+    """Возвращает ID строк из упорядоченного индекса для сравнения."""
+    if op == "=":
+        return indexes.lookup_range(table_name, col, value, value)
+    if op in ("<", "<="):
+        return indexes.lookup_range(table_name, col, high=value,
+                                    include_high=op == "<=")
+    if op in (">", ">="):
+        return indexes.lookup_range(table_name, col, low=value,
+                                    include_low=op == ">=")
+    return None
+
+
+def _candidate_ids(table_name, where, settings):
+    """Возвращает ID строк-кандидатов или None, если нужен полный просмотр.
+
+    Кандидатов дают равенства и IN по ID и по столбцам с индексом, а
+    также сравнения по столбцам с упорядоченным индексом.
+    """
+    kind = where[0]
+    if kind == "and":
+        # Из нескольких вариантов берем самый узкий
+        best = None
+        for node in where[1]:
+            ids = _candidate_ids(table_name, node, settings)
+            if ids is not None and (best is None or len(ids) < len(best)):
+                best = ids
+        return best
+
+    if kind == "or":
+        result = set()
+        for node in where[1]:
+            ids = _candidate_ids(table_name, node, settings)
+            if ids is None:
+                return None
+            result.update(ids)
+        return sorted(result)
+
+    col = where[1]
+    if col in settings.get("sorted_indexes", []):
+        if kind == "in":
+            ids = set()
+            for val in where[2]:
+                ids.update(_range_ids(table_name, col, "=", val))
+            return sorted(ids)
+        return _range_ids(table_name, col, where[2], where[3])
+
+    if kind == "cmp" and where[2] != "=":
+        return None
+
+    values = where[2] if kind == "in" else (where[3],)
+    if col == "ID":
+        return sorted(set(values))
+    if col in settings.get("indexes", []):
+        ids = set()
+        for val in values:
+            ids.update(indexes.lookup(table_name, col, val))
+        return sorted(ids)
+    return None
+
+
+@timed("filter")
+def _iter_matching(metadata, table_name, where_clause, columns=None):
+    """Возвращает итератор по строкам, подходящим под условие WHERE.
+
+    Условие проверяется сразу, а строки перебираются лениво. Равенства
+    по ID и по столбцам с индексом, а также диапазоны по столбцам с
+    упорядоченным индексом разрешаются без просмотра всей таблицы.
+    Из незагруженной сегментированной таблицы читаются только сегменты,
+    которые могут содержать подходящие строки. Иначе условие
+    вычисляется масками NumPy по всей таблице, а без него
+    скомпилированное условие проверяет каждую строку - для больших
+    таблиц по частям в нескольких процессах.
+
+    columns - столбцы, которые нужны дальше (см. _read_columns): из
+    колоночного и сегментированного форматов читаются только они, но
+    строки могут содержать и другие столбцы.
+    """
+    column_types = _column_types(metadata, table_name)
+    where = _typed_where(_where_tree(where_clause), column_types)
+    predicate = _compile_where(where)
+
+    ids = _candidate_ids(table_name, where, _table_settings(metadata, table_name))
+    if ids is not None:
+        return filter(predicate, get_rows_by_id(table_name, ids))
+
+    segmented = get_segment_files(table_name)
+    if segmented is not None:
+        return _scan_segments(table_name, *segmented, where, columns=columns)
+
+    if columns is None:
+        table_data = load_table_data(table_name)
+    else:
+        table_data = load_table_columns(table_name, columns)
+    rows = vectorized.filter_rows(table_name, table_data, where, column_types)
+    if rows is not None:
+        return iter(rows)
+
+    parts = parallel.map_chunks(table_data, _filter_chunk, where)
+    if parts is not None:
+        return (table_data[start + offset]
+                for start, offsets in parts for offset in offsets)
+    return filter(_compile_where(where, compact.is_compact(table_data)),
+                  table_data)
+
+
+def _filter_chunk(rows, where):
+    """Номера подходящих строк части таблицы (выполняется в отдельном процессе)."""
+    predicate = _compile_where(where, compact.is_compact(rows))
+    return [offset for offset, row in enumerate(rows) if predicate(row)]
+
+
+def _scan_segments(table_name, scheme, files, where, columns=None):
+    """Проверяет условие по сегментам таблицы, не загружая ее целиком.
+
+    Сегменты, в которых по min/max столбцов (или по хэшу столбца
+    разбиения) нет подходящих строк, не читаются. Если строк в
+    оставшихся сегментах много, сегменты просматриваются в нескольких
+    процессах. Строки из журнала проверяются отдельно и заменяют свои
+    версии из сегментов. where=None выбирает все строки.
+    """
+    cleared, changes = log_changes(table_name)
+    numbers = None
+    if where is not None:
+        numbers = segments.candidate_segments(where, scheme)
+    matching = [] if cleared else [
+        (path, stats) for number, path, stats in files
+        if (numbers is None or number in numbers)
+        and (where is None or segments.may_match(where, stats))]
+    rows_count = sum(stats["rows"] for _, stats in matching)
+    increment("segments.skipped", len(files) - len(matching))
+    increment("rows.loaded", rows_count)
+
+    paths = [path for path, _ in matching]
+    replaced = frozenset(changes)
+    predicate = _compile_where(where) if where is not None else None
+    changed = sorted((row for row in changes.values()
+                      if row is not None
+                      and (predicate is None or predicate(row))),
+                     key=itemgetter("ID"))
+
+    parts = parallel.map_items(paths, _scan_segment, where, replaced, columns,
+                               rows=rows_count)
+    if parts is None:
+        # Сегменты читаются по мере перебора строк
+        parts = (_scan_segment(path, where, replaced, columns)
+                 for path in paths)
+    if scheme["column"] != "ID":
+        # Сегменты по хэшу не упорядочены между собой по ID
+        return iter(sorted(itertools.chain(changed, *parts),
+                           key=itemgetter("ID")))
+    return heapq.merge(itertools.chain.from_iterable(parts), changed,
+                       key=itemgetter("ID"))
+
+
+def _scan_segment(path, where, replaced, columns=None):
+    """Подходящие строки одного сегмента (может выполняться в отдельном процессе).
+
+    Строки с ID из replaced пропускаются: их версия лежит в журнале.
+    Из файла читаются только столбцы columns (None - все). Возвращаются
+    копии строк кэша сегментов - их можно изменять.
+    """
+    predicate = _compile_where(where) if where is not None else None
+    return [dict(row) for row in load_segment(path, columns)
+            if row["ID"] not in replaced
+            and (predicate is None or predicate(row))]
+
+
+@timed("filter")
+def _find_rows(metadata, table_name, where_clause, columns=None):
+    """Возвращает список строк, подходящих под условие WHERE."""
+    return list(_iter_matching(metadata, table_name, where_clause, columns))
+
+
+def _normalize_where(where_clause):
+    """Приводит условие WHERE к виду, пригодному для ключа кэша."""
+    if not where_clause:
+        return None
+
+    where = _where_tree(where_clause)
+    if where[0] in ("and", "or"):
+        children = (_normalize_where(node) for node in where[1])
+        return (where[0], tuple(sorted(children, key=repr)))
+    return where
 
 
 @handle_db_errors
 @log_time
-def select(table_name, where_clause=None, cacher=None):
-    """Выбирает записи из таблицы."""
-    table_data = load_table_data(table_name)
+def select(metadata, table_name, where_clause=None, cacher=None,
+           columns=None):
+    """Выбирает записи из таблицы.
+
+    columns - список столбцов результата (None - все столбцы). Строки
+    урезаются до них еще до записи в кэш запросов.
+    """
+    _check_table(metadata, table_name)
+    _check_columns(_column_types(metadata, table_name), columns)
+
+    def run_select():
+        if not where_clause and columns is None:
+            return load_table_data(table_name)
+
+        rows = _iter_select(metadata, table_name, where_clause,
+                            _read_columns(columns, where_clause))
+        return list(_project(rows, columns))
+
+    if cacher is None:
+        return run_select()
+
+    # Сигнатура таблицы в ключе защищает от устаревших результатов, даже
+    # если запись прошла мимо engine или ее сделал другой процесс
+    key = (table_name, table_signature(table_name),
+           _normalize_where(where_clause),
+           tuple(columns) if columns is not None else None)
+    return cacher(key, run_select)
+
+
+def _iter_select(metadata, table_name, where_clause, columns=None):
+    """Возвращает итератор по записям таблицы, подходящим под условие.
+
+    columns - столбцы, которые достаточно прочитать (см. _read_columns).
+    """
+    if where_clause:
+        return _iter_matching(metadata, table_name, where_clause, columns)
+    if columns is None:
+        return iter(load_table_data(table_name))
+
+    segmented = get_segment_files(table_name)
+    if segmented is not None:
+        return _scan_segments(table_name, *segmented, None, columns=columns)
+    return iter(load_table_columns(table_name, columns))
 
-    if not where_clause:
-        return table_data
 
-    # фильтр по условию
-    filtered_data = []
-    for row in table_data:
-        match = True
-        for col, val in where_clause.items():
-            if str(row.get(col)) != str(val):
-                match = False
-                break
-        if match:
-            filtered_data.append(row)
+def _iter_by_sorted_index(metadata, table_name, where_clause, column,
+                          descending):
+    """Перебирает записи в порядке упорядоченного индекса столбца.
 
-    return filtered_data
+    Строки читаются порциями по ID, поэтому для ORDER BY ... LIMIT k
+    достаточно прочитать первые k подходящих строк.
+    """
+    predicate = None
+    if where_clause:
+        predicate = _compile_where(_typed_where(
+            _where_tree(where_clause), _column_types(metadata, table_name)))
+
+    ids = indexes.iter_sorted(table_name, column, descending)
+    return _fetch_in_order(table_name, ids, predicate)
+
+
+def _fetch_in_order(table_name, ids, predicate):
+    """Читает строки порциями в порядке ID из итератора ids."""
+    while chunk := list(itertools.islice(ids, ORDER_FETCH_SIZE)):
+        for row in get_rows_by_id(table_name, chunk):
+            if predicate is None or predicate(row):
+                yield row
+
+
+def _order_rows(rows, column, descending, stop):
+    """Упорядочивает записи по столбцу, при равенстве - по ID.
+
+    Если известно, сколько записей понадобится, вместо полной
+    сортировки в куче держатся только stop лучших записей.
+    """
+    def key(row):
+        return row[column], row["ID"]
+
+    if stop is None:
+        return sorted(rows, key=key, reverse=descending)
+    if descending:
+        return heapq.nlargest(stop, rows, key=key)
+    return heapq.nsmallest(stop, rows, key=key)
+
+
+@handle_db_errors
+def select_iter(metadata, table_name, where_clause=None, cacher=None,
+                limit=None, offset=0, order_by=None, columns=None):
+    """Возвращает итератор по записям таблицы для потокового вывода.
+
+    Записи отдаются по одной, поэтому первые из них доступны сразу, а
+    LIMIT и OFFSET не требуют собирать весь результат в список.
+    Выборки с условием WHERE идут через кэш запросов. order_by - пара
+    (столбец, по убыванию); по столбцу с упорядоченным индексом записи
+    читаются сразу в нужном порядке. columns - список столбцов
+    результата: колоночный и сегментированный форматы читают с диска
+    только их (и столбцы условия и сортировки).
+    """
+    _check_table(metadata, table_name)
+    column_types = _column_types(metadata, table_name)
+    _check_columns(column_types, columns)
+    stop = offset + limit if limit is not None else None
+
+    if order_by is not None:
+        column, descending = order_by
+        if column not in column_types:
+            raise KeyError(f'Столбец "{column}" не найден.')
+
+        settings = _table_settings(metadata, table_name)
+        if column in settings.get("sorted_indexes", []):
+            rows = _iter_by_sorted_index(metadata, table_name, where_clause,
+                                         column, descending)
+            return _project(itertools.islice(rows, offset, stop), columns)
+
+    if where_clause and cacher is not None:
+        # В кэше хранятся строки, урезанные до столбцов результата и
+        # сортировки
+        kept = columns
+        if columns is not None and order_by is not None:
+            kept = list(dict.fromkeys([*columns, column, "ID"]))
+        rows = select(metadata, table_name, where_clause, cacher, kept)
+        if rows is None:
+            return None
+    else:
+        rows = _iter_select(metadata, table_name, where_clause,
+                            _read_columns(columns, where_clause, order_by))
+
+    if order_by is not None:
+        rows = _order_rows(rows, column, descending, stop)
+
+    return _project(itertools.islice(rows, offset, stop), columns)
+
+
+def _resolve_join_column(name, tables, column_types):
+    """Находит таблицу столбца в запросе с соединением.
+
+    name - "таблица.столбец" или просто "столбец", если он есть только
+    в одной из таблиц. Возвращает пару (таблица, столбец).
+    """
+    table, dot, col = name.partition(".")
+    if dot:
+        if table not in tables or col not in column_types[table]:
+            raise KeyError(f'Столбец "{name}" не найден.')
+        return table, col
+
+    owners = [table for table in tables if name in column_types[table]]
+    if not owners:
+        raise KeyError(f'Столбец "{name}" не найден.')
+    if len(owners) > 1:
+        raise ValueError(f'Столбец "{name}" есть в обеих таблицах, '
+                         f'укажите таблицу: {owners[0]}.{name}')
+    return owners[0], name
+
+
+def _qualify_where(where, tables, column_types):
+    """Заменяет в дереве условия имена столбцов на "таблица.столбец"."""
+    kind = where[0]
+    if kind in ("and", "or"):
+        return (kind, tuple(_qualify_where(node, tables, column_types)
+                            for node in where[1]))
+    table, col = _resolve_join_column(where[1], tables, column_types)
+    return (kind, f"{table}.{col}") + tuple(where[2:])
+
+
+def _where_tables(where):
+    """Множество таблиц, столбцы которых входят в условие."""
+    if where[0] in ("and", "or"):
+        return set().union(*(_where_tables(node) for node in where[1]))
+    return {where[1].split(".", 1)[0]}
+
+
+def _unqualify_where(where):
+    """Убирает имя таблицы из имен столбцов условия."""
+    kind = where[0]
+    if kind in ("and", "or"):
+        return (kind, tuple(_unqualify_where(node) for node in where[1]))
+    return (kind, where[1].split(".", 1)[1]) + tuple(where[2:])
+
+
+def _split_join_where(where, tables):
+    """Делит условие запроса с соединением на части.
+
+    Части AND, которые касаются одной таблицы, проверяются при чтении
+    этой таблицы (с индексами), остальные - на соединенных строках.
+    Возвращает (условия по таблицам, условие на соединенных строках).
+    """
+    pushed = {table: [] for table in tables}
+    residual = []
+    for node in (where[1] if where[0] == "and" else (where,)):
+        used = _where_tables(node)
+        if len(used) == 1:
+            pushed[used.pop()].append(_unqualify_where(node))
+        else:
+            residual.append(node)
+
+    def combine(nodes):
+        if not nodes:
+            return None
+        return nodes[0] if len(nodes) == 1 else ("and", tuple(nodes))
+
+    return ({table: combine(nodes) for table, nodes in pushed.items()},
+            combine(residual))
+
+
+def _join_lookup(metadata, table_name, column):
+    """Функция значение -> ID строк по готовому индексу столбца (или None)."""
+    settings = _table_settings(metadata, table_name)
+    if column == "ID":
+        return lambda value: [value]
+    if column in settings.get("indexes", []):
+        return lambda value: indexes.lookup(table_name, column, value)
+    if column in settings.get("sorted_indexes", []):
+        return lambda value: indexes.lookup_range(table_name, column,
+                                                  value, value)
+    return None
+
+
+@handle_db_errors
+@timed("join")
+def join(metadata, left, right, left_on, right_on, where_clause=None,
+         limit=None, offset=0, order_by=None, columns=None):
+    """Соединяет две таблицы по равенству столбцов (hash join).
+
+    left_on и right_on - столбцы условия ON ("таблица.столбец" или имя,
+    которое есть только в одной таблице). Хэш-таблица строится по
+    меньшей таблице, а большая просматривается потоком. Если у столбца
+    соединения большой таблицы есть индекс (или это ID), а другая
+    таблица много меньше, индекс заменяет хэш-таблицу, и строки большой
+    таблицы читаются только для совпадений.
+    Условие WHERE по одной таблице проверяется при ее чтении.
+    columns - столбцы результата (имена как в left_on); из таблиц
+    читаются только они и столбцы соединения, условия и сортировки.
+
+    Возвращает итератор по строкам "таблица.столбец" -> значение:
+    сначала столбцы left, затем right.
+    """
+    _check_table(metadata, left)
+    _check_table(metadata, right)
+    if left == right:
+        raise ValueError("Соединение таблицы с самой собой не поддерживается.")
+
+    tables = (left, right)
+    column_types = {table: _column_types(metadata, table) for table in tables}
+    on = [_resolve_join_column(name, tables, column_types)
+          for name in (left_on, right_on)]
+    if {table for table, _ in on} != set(tables):
+        raise ValueError("Условие ON должно связывать столбцы обеих таблиц.")
+    keys = dict(on)
+    if column_types[left][keys[left]] != column_types[right][keys[right]]:
+        raise TypeError(f'Типы столбцов {left}.{keys[left]} и '
+                        f'{right}.{keys[right]} не совпадают.')
+
+    joined_types = {f"{table}.{col}": col_type for table in tables
+                    for col, col_type in column_types[table].items()}
+
+    pushed = {table: None for table in tables}
+    residual = None
+    if where_clause:
+        where = _qualify_where(_where_tree(where_clause), tables, column_types)
+        pushed, residual = _split_join_where(where, tables)
+
+    if order_by is not None:
+        table, col = _resolve_join_column(order_by[0], tables, column_types)
+        order_by = (f"{table}.{col}", order_by[1])
+
+    read = {table: None for table in tables}
+    if columns is not None:
+        columns = ["{}.{}".format(*_resolve_join_column(name, tables,
+                                                        column_types))
+                   for name in columns]
+        used = set(columns)
+        if residual is not None:
+            used |= _where_columns(residual)
+        if order_by is not None:
+            used.add(order_by[0])
+        for table in tables:
+            needed = {name.split(".", 1)[1] for name in used
+                      if name.split(".", 1)[0] == table}
+            needed |= {keys[table], "ID"}
+            if pushed[table] is not None:
+                needed |= _where_columns(pushed[table])
+            read[table] = tuple(sorted(needed))
+
+    if residual is not None:
+        residual = _compile_where(_typed_where(residual, joined_types))
+
+    sizes = {table: _row_count(metadata, table) for table in tables}
+    build = min(tables, key=sizes.get)
+    lookup = None
+    for table in sorted(tables, key=sizes.get, reverse=True):
+        other = right if table == left else left
+        table_lookup = _join_lookup(metadata, table, keys[table])
+        if (table_lookup is not None
+                and sizes[other] * JOIN_INDEX_RATIO <= sizes[table]):
+            # По индексу ищем пары для строк маленькой таблицы, не
+            # читая большую целиком
+            build, lookup = table, table_lookup
+            break
+    probe = right if build == left else left
+
+    if lookup is not None:
+        predicate = None
+        if pushed[build] is not None:
+            predicate = _compile_where(_typed_where(pushed[build],
+                                                    column_types[build]))
+
+        def matches(value):
+            rows = get_rows_by_id(build, lookup(value))
+            if predicate is None:
+                return rows
+            return [row for row in rows if predicate(row)]
+    else:
+        hash_table = {}
+        for row in _iter_select(metadata, build, pushed[build], read[build]):
+            hash_table.setdefault(row[keys[build]], []).append(row)
+
+        def matches(value):
+            return hash_table.get(value, ())
+
+    # Условие большой таблицы проверяется здесь, а не при выводе строк
+    probe_rows = _iter_select(metadata, probe, pushed[probe], read[probe])
+
+    def joined_rows():
+        for probe_row in probe_rows:
+            for build_row in matches(probe_row[keys[probe]]):
+                pair = {probe: probe_row, build: build_row}
+                row = {f"{table}.{col}": value for table in tables
+                       for col, value in pair[table].items()}
+                if residual is None or residual(row):
+                    yield row
+
+    rows = joined_rows()
+    stop = offset + limit if limit is not None else None
+    if order_by is not None:
+        column, descending = order_by
+        key = itemgetter(column)
+        if stop is None:
+            rows = sorted(rows, key=key, reverse=descending)
+        elif descending:
+            rows = heapq.nlargest(stop, rows, key=key)
+        else:
+            rows = heapq.nsmallest(stop, rows, key=key)
+
+    return _project(itertools.islice(rows, offset, stop), columns)
+
+
+def _merge_sum(left, right):
+    """Складывает частичные суммы (None - сумма пустой части)."""
+    if left is None or right is None:
+        return right if left is None else left
+    return left + right
+
+
+def _merge_avg(left, right):
+    """Объединяет частичные пары (сумма, количество)."""
+    if left is None or right is None:
+        return right if left is None else left
+    return left[0] + right[0], left[1] + right[1]
+
+
+# Агрегатные функции: (начальное состояние, шаг, объединение, итог).
+# Шаг получает состояние и значение столбца, объединение сводит
+# состояния двух частей таблицы, итог превращает состояние в результат
+AGGREGATES = {
+    "count": (0, lambda state, value: state + 1, lambda a, b: a + b, None),
+    "sum": (None, lambda state, value: value if state is None else state + value,
+            _merge_sum, None),
+    "min": (None, lambda state, value: value if state is None or value < state
+            else state, lambda a, b: b if a is None or (b is not None and b < a)
+            else a, None),
+    "max": (None, lambda state, value: value if state is None or value > state
+            else state, lambda a, b: b if a is None or (b is not None and b > a)
+            else a, None),
+    "avg": (None, lambda state, value: (value, 1) if state is None
+            else (state[0] + value, state[1] + 1), _merge_avg,
+            lambda state: state[0] / state[1] if state is not None else None),
+}
+
+# Функции, которые имеют смысл только для чисел
+NUMERIC_AGGREGATES = ("sum", "avg")
+
+
+def _check_aggregates(metadata, table_name, items, group_by):
+    """Проверяет список выборки и столбцы группировки."""
+    column_types = _column_types(metadata, table_name)
+    for col in group_by:
+        if col not in column_types:
+            raise KeyError(f'Столбец "{col}" не найден.')
+
+    for func, col in items:
+        if func is None:
+            if col not in group_by:
+                raise ValueError(f'Столбец "{col}" должен входить в GROUP BY.')
+            continue
+        if col == "*":
+            continue
+        if col not in column_types:
+            raise KeyError(f'Столбец "{col}" не найден.')
+        if func in NUMERIC_AGGREGATES and column_types[col] != "int":
+            raise ValueError(f'Функция {func} применима только к столбцам int.')
+
+    if not any(func for func, _ in items):
+        raise ValueError("В списке выборки нет агрегатных функций.")
+
+
+def _aggregate_states(rows, items, group_by):
+    """Вычисляет состояния агрегатов по группам за один проход по строкам.
+
+    Состояния функций хранятся в словаре по ключу группы, поэтому
+    строки не нужно ни сортировать, ни держать в памяти.
+    """
+    key_of = (itemgetter(*group_by) if len(group_by) > 1
+              else (lambda row: (row[group_by[0]],)) if group_by
+              else (lambda row: ()))
+
+    aggregates = [(AGGREGATES[func], col) for func, col in items
+                  if func is not None]
+    initial = [init for (init, _, _, _), _ in aggregates]
+    steps = [(step, itemgetter(col) if col != "*" else (lambda row: None))
+             for (_, step, _, _), col in aggregates]
+
+    groups = {}
+    if not group_by:
+        # Без группировки результат есть и у пустой выборки
+        groups[()] = list(initial)
+
+    for row in rows:
+        key = key_of(row)
+        states = groups.get(key)
+        if states is None:
+            states = groups[key] = list(initial)
+        for i, (step, get) in enumerate(steps):
+            states[i] = step(states[i], get(row))
+    return groups
+
+
+def _merge_states(parts, items):
+    """Объединяет состояния агрегатов, посчитанные по частям таблицы.
+
+    Части идут в порядке строк, поэтому группы остаются в порядке
+    первого появления, как при просмотре в одном процессе.
+    """
+    merges = [AGGREGATES[func][2] for func, _ in items if func is not None]
+    groups = {}
+    for part in parts:
+        for key, states in part.items():
+            merged = groups.get(key)
+            if merged is None:
+                groups[key] = states
+            else:
+                groups[key] = [merge(a, b)
+                               for merge, a, b in zip(merges, merged, states)]
+    return groups
+
+
+def _finish_groups(groups, items, group_by):
+    """Превращает состояния агрегатов в строки результата."""
+    finals = [AGGREGATES[func][3] for func, _ in items if func is not None]
+    result = []
+    for key, states in groups.items():
+        values = iter(final(state) if final else state
+                      for state, final in zip(states, finals))
+        result.append([key[group_by.index(col)] if func is None else next(values)
+                       for func, col in items])
+    return result
+
+
+def _hash_aggregate(rows, items, group_by):
+    """Вычисляет агрегаты хэш-группировкой за один проход по строкам."""
+    return _finish_groups(_aggregate_states(rows, items, group_by),
+                          items, group_by)
+
+
+def _aggregate_chunk(rows, where, items, group_by):
+    """Состояния агрегатов по части таблицы (выполняется в отдельном процессе)."""
+    if where is not None:
+        rows = filter(_compile_where(where, compact.is_compact(rows)), rows)
+    return _aggregate_states(rows, items, group_by)
+
+
+def _parallel_aggregate(metadata, table_name, items, where_clause, group_by):
+    """Вычисляет агрегаты по частям таблицы в нескольких процессах.
+
+    Возвращает None, если таблица мала или условие разрешается индексом.
+    """
+    where = None
+    if where_clause:
+        where = _typed_where(_where_tree(where_clause),
+                             _column_types(metadata, table_name))
+        settings = _table_settings(metadata, table_name)
+        if _candidate_ids(table_name, where, settings) is not None:
+            return None
+
+    parts = parallel.map_chunks(load_table_data(table_name), _aggregate_chunk,
+                                where, items, group_by)
+    if parts is None:
+        return None
+    groups = _merge_states((part for _, part in parts), items)
+    return _finish_groups(groups, items, group_by)
+
+
+def _vectorized_aggregate(metadata, table_name, items, where_clause, group_by):
+    """Вычисляет агрегаты массивами NumPy или возвращает None.
+
+    Условия, которые разрешаются индексом, выгоднее проверить построчно
+    по найденным строкам.
+    """
+    column_types = _column_types(metadata, table_name)
+    where = None
+    if where_clause:
+        where = _typed_where(_where_tree(where_clause), column_types)
+        settings = _table_settings(metadata, table_name)
+        if _candidate_ids(table_name, where, settings) is not None:
+            return None
+
+    return vectorized.aggregate(table_name, load_table_data(table_name), items,
+                                where, group_by, column_types)
+
+
+@handle_db_errors
+@timed("aggregate")
+def aggregate(metadata, table_name, items, where_clause=None, group_by=(),
+              order_by=None, limit=None, offset=0):
+    """Вычисляет COUNT/SUM/MIN/MAX/AVG по таблице с группировкой.
+
+    items - список пар (функция, столбец) из parser.parse_select_list.
+    COUNT без условия и группировки берется из метаданных таблицы без
+    чтения строк. Возвращает список строк результата.
+    """
+    _check_table(metadata, table_name)
+    group_by = list(group_by)
+    _check_aggregates(metadata, table_name, items, group_by)
+
+    names = [col if func is None else f"{func}({col})" for func, col in items]
+    if not where_clause and not group_by and all(func == "count"
+                                                 for func, _ in items):
+        # Пустых значений в таблицах нет, поэтому COUNT(столбец) = COUNT(*)
+        rows = _row_count(metadata, table_name)
+        result = [[rows] * len(items)]
+    else:
+        result = _vectorized_aggregate(metadata, table_name, items,
+                                       where_clause, group_by)
+        if result is None:
+            result = _parallel_aggregate(metadata, table_name, items,
+                                         where_clause, group_by)
+        if result is None:
+            result = _hash_aggregate(
+                _iter_select(metadata, table_name, where_clause), items, group_by)
+
+    result = [dict(zip(names, values)) for values in result]
+    if order_by is not None:
+        column, descending = order_by
+        if column not in names:
+            raise KeyError(f'Столбец "{column}" не найден в результате.')
+        result.sort(key=itemgetter(column), reverse=descending)
+
+    stop = offset + limit if limit is not None else None
+    return result[offset:stop]
 
 
 @handle_db_errors
 def update(metadata, table_name, set_clause, where_clause):
     """Обновляет записи в таблице."""
-    if table_name not in metadata:
-        raise KeyError(f'Таблица "{table_name}" не существует.')
-
-    table_data = load_table_data(table_name)
-    updated_count = 0
+    _check_table(metadata, table_name)
+    if "ID" in set_clause:
+        # ID - ключ строки в журнале и индексах
+        raise ValueError("Столбец ID изменять нельзя.")
+    updated_rows = []
 
     # Получаем схему для проверки типов
     columns_schema = {}
@@ -168,71 +1215,232 @@ def update(metadata, table_name, set_clause, where_clause):
             col_name, col_type = col_schema.split(":")
             columns_schema[col_name] = col_type
 
-    for row in table_data:
-        # Проверяем условие WHERE
-        match = True
-        for col, val in where_clause.items():
-            if str(row.get(col)) != str(val):
-                match = False
-                break
-
-        if match:
-            # Обновляем поля согласно SET
-            for col, new_val in set_clause.items():
-                if col in columns_schema:
-                    converted_value = _convert_value(new_val, columns_schema[col])
-                    row[col] = converted_value
-            updated_count += 1
-
-    if updated_count > 0:
-        save_table_data(table_name, table_data)
-        print(f'Обновлено {updated_count} записей в таблице "{table_name}".')
+    # Преобразуем значения SET один раз, до изменения строк:
+    # строки таблицы общие с кэшем и не должны меняться частично
+    new_values = {col: _convert_value(new_val, columns_schema[col])
+                  for col, new_val in set_clause.items()
+                  if col in columns_schema}
 
-    return table_data
+    for row in _find_rows(metadata, table_name, where_clause):
+        # Обновляем поля согласно SET
+        row.update(new_values)
+        updated_rows.append(row)
+
+    if updated_rows:
+        # Найденные строки - это строки загруженной таблицы, если она
+        # в кэше, поэтому ее данные уже содержат изменения
+        rows_before = _stored_row_count(metadata, table_name)
+        write_table_changes(table_name, peek_table_data(table_name),
+                            [{"op": "update", "row": row} for row in updated_rows])
+        _update_row_count(metadata, table_name, rows_before, 0)
+        print(f'Обновлено {len(updated_rows)} записей в таблице "{table_name}".')
+
+    return updated_rows
 
 
 @handle_db_errors
 @confirm_action("удаление записей")
-def delete(table_name, where_clause):
+def delete(metadata, table_name, where_clause):
     """Удаляет записи из таблицы."""
-    table_data = load_table_data(table_name)
+    _check_table(metadata, table_name)
 
+    rows_before = _stored_row_count(metadata, table_name)
     if not where_clause:
         # Если нет условия, удаляем все
-        deleted_count = len(table_data)
+        deleted_count = _row_count(metadata, table_name)
+        rows_before = deleted_count
         table_data = []
+        records = [{"op": "clear"}]
     else:
         # Удаляем по условию
-        new_data = []
-        for row in table_data:
-            match = True
-            for col, val in where_clause.items():
-                if str(row.get(col)) != str(val):
-                    match = False
-                    break
-
-            if not match:
-                new_data.append(row)
+        matched = _find_rows(metadata, table_name, where_clause)
+        records = [{"op": "delete", "id": row["ID"]} for row in matched]
 
-        deleted_count = len(table_data) - len(new_data)
-        table_data = new_data
+        table_data = peek_table_data(table_name)
+        if matched and table_data is not None:
+            deleted_ids = {row["ID"] for row in matched}
+            table_data = [row for row, row_id
+                          in zip(table_data, compact.row_ids(table_data))
+                          if row_id not in deleted_ids]
+        deleted_count = len(matched)
 
     if deleted_count > 0:
-        save_table_data(table_name, table_data)
+        write_table_changes(table_name, table_data, records)
+        _update_row_count(metadata, table_name, rows_before, -deleted_count)
         print(f'Удалено {deleted_count} записей из таблицы "{table_name}".')
 
-    return table_data
+    return deleted_count
 
 
 @handle_db_errors
 def info_table(metadata, table_name):
     """Выводит информацию о таблице."""
-    if table_name not in metadata:
-        raise KeyError(f'Таблица "{table_name}" не существует.')
-
-    # Загружаем данные таблицы
-    table_data = load_table_data(table_name)
+    _check_table(metadata, table_name)
 
     print(f'Таблица: {table_name}')
     print(f'Столбцы: {", ".join(metadata[table_name])}')
-    print(f'Количество записей: {len(table_data)}')
+    print(f'Формат хранения: {get_table_storage(table_name)}')
+    manifest = get_segment_manifest(table_name)
+    if manifest is not None:
+        print(f'Сегментов: {len(manifest["segments"])} '
+              f'({segments.describe_scheme(manifest["scheme"])})')
+    print(f'Количество записей: {_row_count(metadata, table_name)}')
+
+
+@handle_db_errors
+def memory_report(metadata, table_name=None):
+    """Оценивает память, занятую загруженными в кэш таблицами.
+
+    Возвращает строки отчета: число записей, вид строк (slots - компактные
+    строки, dict - словари) и оценки памяти сейчас и в виде словарей.
+    """
+    if table_name is not None:
+        _check_table(metadata, table_name)
+        tables = [table_name]
+    else:
+        tables = [table for table in metadata if table != SERVICE_KEY]
+
+    report = []
+    for table in tables:
+        table_data = peek_table_data(table)
+        if table_data is None:
+            continue
+        size, dict_size = compact.estimate_size(table_data)
+        kind = "slots" if compact.is_compact(table_data) else "dict"
+        report.append({"Таблица": table,
+                       "Записей": len(table_data),
+                       "Строки": kind,
+                       "Память, КБ": round(size / 1024, 1),
+                       "В словарях, КБ": round(dict_size / 1024, 1)})
+    return report
+
+
+@handle_db_errors
+def compact_table(metadata, table_name):
+    """Сжимает журнал изменений таблицы в файл данных."""
+    _check_no_transaction("compact")
+    _check_table(metadata, table_name)
+
+    table_data = compact_table_log(table_name)
+    _remember_row_count(metadata, table_name, len(table_data))
+    print(f'Таблица "{table_name}" сжата, записей: {len(table_data)}.')
+    return table_data
+
+
+@handle_db_errors
+def create_index(metadata, table_name, column, kind="hash"):
+    """Создает индекс по столбцу таблицы.
+
+    Хэш-индекс ускоряет поиск по равенству, упорядоченный (sorted) -
+    сравнения, диапазоны и ORDER BY.
+    """
+    _check_no_transaction("create_index")
+    _check_table(metadata, table_name)
+
+    column_types = _column_types(metadata, table_name)
+    if column not in column_types:
+        raise KeyError(f'Столбец "{column}" не найден в таблице "{table_name}".')
+    if kind not in INDEX_SETTINGS:
+        raise ValueError(f'Некорректный вид индекса: {kind}. '
+                         f'Допустимые: {", ".join(INDEX_SETTINGS)}')
+    if kind == "sorted" and column_types[column] not in SORTED_INDEX_TYPES:
+        raise ValueError('Упорядоченный индекс строится только по столбцам '
+                         f'типов {", ".join(SORTED_INDEX_TYPES)}')
+
+    settings = _edit_table_settings(metadata, table_name)
+    table_indexes = settings.setdefault(INDEX_SETTINGS[kind], [])
+    if column in table_indexes:
+        raise ValueError(f'Индекс {kind} по столбцу "{column}" уже существует.')
+
+    keys_count = indexes.create_index(table_name, column, kind)
+    table_indexes.append(column)
+    print(f'Индекс {kind} по столбцу "{column}" таблицы "{table_name}" создан, '
+          f'различных значений: {keys_count}.')
+    return metadata
+
+
+@handle_db_errors
+def set_scan_mode(mode=None):
+    """Устанавливает или выводит режим просмотра таблиц."""
+    if mode is not None:
+        vectorized.set_mode(mode)
+
+    numpy_state = "установлен" if vectorized.available() else "не установлен"
+    print(f'Режим просмотра таблиц: {vectorized.get_mode()} '
+          f'(NumPy {numpy_state}).')
+    return vectorized.get_mode()
+
+
+@handle_db_errors
+def set_parallel(workers=None, min_rows=None):
+    """Настраивает или выводит параметры параллельного просмотра таблиц."""
+    parallel.configure(workers, min_rows)
+
+    workers, min_rows = parallel.get_settings()
+    print(f'Процессов для просмотра: {workers}, '
+          f'параллельно просматриваются таблицы от {min_rows} записей.')
+    return workers, min_rows
+
+
+@handle_db_errors
+def set_storage(metadata, table_name, storage):
+    """Переводит таблицу в другой формат хранения."""
+    _check_no_transaction("set_storage")
+    _check_table(metadata, table_name)
+
+    table_data = convert_table_storage(table_name, storage)
+    _remember_row_count(metadata, table_name, len(table_data))
+    print(f'Таблица "{table_name}" хранится в формате {storage}, '
+          f'записей: {len(table_data)}.')
+    return table_data
+
+
+@handle_db_errors
+def partition_table(metadata, table_name, column="ID", size=None):
+    """Разбивает таблицу на сегменты по диапазонам ID или по хэшу столбца.
+
+    Запись в сегментированную таблицу переписывает только измененные
+    сегменты, а поиск пропускает сегменты по min/max их столбцов.
+    """
+    _check_no_transaction("partition")
+    _check_table(metadata, table_name)
+    if column not in _column_types(metadata, table_name):
+        raise KeyError(f'Столбец "{column}" не найден в таблице "{table_name}".')
+
+    scheme = segments.make_scheme(column, size)
+    table_data = convert_table_storage(table_name, "segmented", scheme)
+    _remember_row_count(metadata, table_name, len(table_data))
+    manifest = get_segment_manifest(table_name)
+    print(f'Таблица "{table_name}" разбита на сегменты '
+          f'({segments.describe_scheme(scheme)}), '
+          f'сегментов: {len(manifest["segments"])}, '
+          f'записей: {len(table_data)}.')
+    return table_data
+
+
+@handle_db_errors
+def begin(metadata):
+    """Открывает транзакцию."""
+    begin_transaction(metadata)
+    print("Транзакция открыта. Изменения будут записаны командой commit.")
+    return metadata
+
+
+@handle_db_errors
+def commit(metadata):
+    """Фиксирует транзакцию: каждая измененная таблица пишется один раз."""
+    tables = commit_transaction(metadata)
+
+    # Файлы таблиц изменились - обновляем сохраненное количество строк
+    for table_name in tables:
+        _update_row_count(metadata, table_name, None, 0)
+    print(f'Транзакция зафиксирована, изменено таблиц: {len(tables)}.')
+    return metadata
+
+
+@handle_db_errors
+def rollback():
+    """Отменяет транзакцию и возвращает метаданные на момент ее начала."""
+    metadata = rollback_transaction()
+    print("Транзакция отменена.")
+    return metadata
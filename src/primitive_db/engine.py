@@ -1,11 +1,23 @@
+import json
 import shlex
-
-import prompt
-from prettytable import PrettyTable
-
-from ..decorators import create_cacher
-from . import core, utils
-from .parser import parse_set, parse_where
+import time
+
+# prompt и prettytable импортируются при первом использовании: скриптам
+# без вывода таблиц они не нужны, а импорт замедляет запуск
+from .. import metrics
+from ..decorators import confirm, create_cacher
+from . import core, locking, utils
+from .constants import SELECT_PAGE_SIZE
+from .parser import (
+    parse_group,
+    parse_join,
+    parse_limit,
+    parse_order,
+    parse_select_list,
+    parse_set,
+    parse_where,
+    split_words,
+)
 
 
 def print_help():
@@ -22,57 +34,208 @@ def print_help():
     print("<command> select from <имя_таблицы> "
           "where <столбец> = <значение> - прочитать записи по условию")
     print("<command> select from <имя_таблицы> - прочитать все записи")
+    print("<command> select <столбец1>, <столбец2> from <имя_таблицы> ... - "
+          "вывести только указанные столбцы")
+    print("<command> select from <имя_таблицы> ... limit <N> offset <M> - "
+          "прочитать часть записей")
+    print("<command> select from <имя_таблицы> ... order by <столбец> "
+          "[asc|desc] - упорядочить записи")
+    print("<command> select from <таблица1> join <таблица2> on "
+          "<таблица1>.<столбец> = <таблица2>.<столбец> [where ...] - "
+          "соединить таблицы")
+    print("<command> select count(*), avg(<столбец>) from <имя_таблицы> "
+          "... [group by <столбец>] - агрегатные функции")
+    print("  доступны count, sum, min, max и avg")
+    print("  в условии WHERE доступны =, !=, <, <=, >, >=, IN (...), "
+          "AND, OR и скобки")
     print("<command> update <имя_таблицы> set <столбец1> = <новое_значение1> "
           "where <столбец_условия> = <значение_условия> - обновить запись")
     print("<command> delete from <имя_таблицы> "
           "where <столбец> = <значение> - удалить запись")
     print("<command> info <имя_таблицы> - вывести информацию о таблице")
+    print("<command> import <имя_таблицы> <файл.csv|файл.jsonl> - "
+          "загрузить записи из файла")
+    print("<command> create_index <имя_таблицы> <столбец> [hash|sorted] - "
+          "создать индекс (sorted - для диапазонов и сортировки)")
+    print("<command> compact <имя_таблицы> - сжать журнал изменений таблицы")
+    print("<command> set_storage <имя_таблицы> "
+          "<json|columnar|records|segmented> - сменить формат хранения таблицы")
+    print("<command> partition <имя_таблицы> [<столбец> [<размер>]] - "
+          "разбить таблицу на сегменты (по ID - диапазонами из <размер> "
+          "записей, по другому столбцу - хэшем на <размер> сегментов)")
+    print("<command> begin / commit / rollback - транзакция: изменения "
+          "копятся в памяти и записываются одним COMMIT")
+    print("<command> scan_mode [auto|numpy|python] - режим просмотра таблиц "
+          "(numpy - векторные фильтры и агрегаты)")
+    print("<command> parallel [<процессов> [<мин_записей>]] - параллельный "
+          "просмотр больших таблиц")
+    print("<command> cache_stats - статистика кэша запросов")
+    print("<command> memory [<имя_таблицы>] - память, занятая загруженными "
+          "таблицами")
+    print("<command> stats [reset|export <файл.json>] - счетчики и время "
+          "команд и фаз обработки")
+    print("<command> profile [cpu|memory|off] - профилирование "
+          "(cProfile / tracemalloc)")
     print("\nОбщие команды:")
     print("<command> exit - выход из программы")
     print("<command> help - справочная информация\n")
 
 
-def run():
-    print("***Операции с данными***")
-    print_help()
+@metrics.timed("render")
+def print_rows(rows, page_size=SELECT_PAGE_SIZE):
+    """Выводит записи страницами по мере их получения.
 
-    # Создаем кэш для select запросов
-    cacher = create_cacher()
+    Записи select отдаются лениво, поэтому время их проверки входит в
+    фазу render.
+    """
+    from prettytable import PrettyTable
 
-    while True:
-        # загрузить актуальные метаданные
-        metadata = utils.load_metadata()
+    table = None
+    count = 0
 
-        # Получаем команду от пользователя
-        user_input = prompt.string(">>>Введите команду: ").strip()
+    for row in rows:
+        if table is None:
+            # получаем заголовки из первой записи страницы
+            table = PrettyTable()
+            table.field_names = list(row.keys())
 
-        if not user_input:
-            continue
+        table.add_row([row[h] for h in table.field_names])
+        count += 1
 
-        try:
-            args = shlex.split(user_input)
-        except ValueError:
-            print("Ошибка в синтаксисе команды. Попробуйте снова.")
-            continue
+        if count % page_size == 0:
+            print(table)
+            table = None
 
-        if not args:
-            continue
+    if table is not None:
+        print(table)
+    if count == 0:
+        print("Нет данных для отображения.")
+    metrics.increment("rows.rendered", count)
 
-        command = args[0].lower()
 
-        # Обработка команд
-        if command == "exit":
-            print("Выход из программы.")
-            break
+def print_stats(snapshot):
+    """Выводит снимок метрик: время команд и фаз, затем счетчики."""
+    if not snapshot["histograms"] and not snapshot["counters"]:
+        print("Замеров пока нет.")
+        return
+
+    if snapshot["histograms"]:
+        from prettytable import PrettyTable
 
-        elif command == "help":
+        table = PrettyTable()
+        table.field_names = ["метрика", "вызовов", "всего, мс", "среднее",
+                             "p50", "p95", "p99", "макс"]
+        table.align["метрика"] = "l"
+        for name, summary in snapshot["histograms"].items():
+            table.add_row([name, summary["count"]] + [
+                f"{summary[key]:.3f}" for key in ("total_ms", "mean_ms", "p50_ms",
+                                                  "p95_ms", "p99_ms", "max_ms")])
+        print(table)
+
+    for name, value in snapshot["counters"].items():
+        print(f"{name}: {value}")
+    if snapshot["profiling"] is not None:
+        print(f'Включено профилирование: {snapshot["profiling"]} '
+              f'(отчет - команда profile)')
+
+
+def read_commands():
+    """Читает команды пользователя в интерактивном режиме."""
+    import prompt
+
+    while True:
+        try:
+            yield prompt.string(">>>Введите команду: ")
+        except EOFError:
+            # Ввод закончился (Ctrl+D) - выходим как по exit
+            return
+
+
+def script_commands(lines):
+    """Команды из строк скрипта без комментариев и завершающих ";"."""
+    for line in lines:
+        line = line.strip().rstrip(";").strip()
+        if line and not line.startswith(("#", "--")):
+            yield line
+
+
+def shutdown(metadata, changed=True):
+    """Завершает работу: отменяет открытую транзакцию и сбрасывает файлы.
+
+    changed - сессия меняла метаданные (например, запомненное количество
+    строк таблиц). Они сохраняются под исключительной блокировкой и только
+    если файл метаданных с их загрузки не менял другой процесс.
+    """
+    if utils.in_transaction():
+        print("Незафиксированная транзакция отменена.")
+        metadata = core.rollback()
+    if changed and metadata is not None:
+        try:
+            with locking.command_lock("exit"):
+                if utils.load_metadata() is metadata:
+                    utils.save_metadata(metadata)
+        except TimeoutError:
+            pass
+    utils.sync_files()
+
+
+def _metadata_state(metadata):
+    """Слепок метаданных, по которому видно, изменила ли их команда."""
+    return json.dumps(metadata, sort_keys=True)
+
+
+@metrics.timed("parse")
+def parse_command(user_input):
+    """Разбивает строку команды на аргументы (None - пустая или ошибка)."""
+    user_input = user_input.strip()
+    if not user_input:
+        return None
+
+    try:
+        args = shlex.split(user_input)
+    except ValueError:
+        print("Ошибка в синтаксисе команды. Попробуйте снова.")
+        return None
+    return args or None
+
+
+def _where_str(args, words, count):
+    """Текст условия WHERE: count слов после первого слова where.
+
+    Слова берутся из исходной строки (words), где у строк остались
+    кавычки: в args строку "War and Peace" не отличить от условия.
+    """
+    source = words if words is not None else args
+    start = [word.lower() for word in source].index("where") + 1
+    return " ".join(source[start:start + count])
+
+
+def execute(session, args, text=None):
+    """Выполняет одну команду (кроме exit).
+
+    session - словарь с метаданными ("metadata") и кэшем select запросов
+    ("cacher"), измененные командой метаданные записываются в него же.
+    text - исходная строка команды, из нее берется условие WHERE.
+    """
+    words = split_words(text) if text is not None else None
+    if words is not None and len(words) != len(args):
+        # Экранирование разбило строку иначе, чем shlex
+        words = None
+    command = args[0].lower()
+    metadata = session["metadata"]
+    cacher = session["cacher"]
+    start_time = time.perf_counter()
+
+    # Обработка команд
+    try:
+        if command == "help":
             print_help()
 
         elif command == "create_table":
             if len(args) < 3:
                 print("Ошибка: Недостаточно аргументов. "
                       "Формат: create_table <имя> <столбец1:тип> <столбец2:тип> ...")
-                continue
+                return
             table_name = args[1]
             columns = args[2:]
             new_metadata = core.create_table(metadata, table_name, columns)
@@ -87,21 +250,169 @@ def run():
             if len(args) != 2:
                 print("Ошибка: Неверное количество аргументов. "
                       "Формат: drop_table <имя>")
-                continue
+                return
             table_name = args[1]
             new_metadata = core.drop_table(metadata, table_name)
             if new_metadata is not None and table_name not in new_metadata:
                 metadata = new_metadata
                 utils.save_metadata(metadata)
+                cacher.invalidate(table_name)
 
         elif command == "info":
             if len(args) != 2:
                 print("Ошибка: Неверное количество аргументов. "
                       "Формат: info <имя_таблицы>")
-                continue
+                return
             table_name = args[1]
             core.info_table(metadata, table_name)
 
+        elif command == "import":
+            if len(args) != 3:
+                print("Ошибка: Неверное количество аргументов. "
+                      "Формат: import <имя_таблицы> <файл.csv|файл.jsonl>")
+                return
+            table_name = args[1]
+            if core.import_table(metadata, table_name, args[2]) is not None:
+                # сохраняем счетчик ID таблицы
+                utils.save_metadata(metadata)
+            cacher.invalidate(table_name)
+
+        elif command == "create_index":
+            if len(args) not in (3, 4):
+                print("Ошибка: Неверное количество аргументов. "
+                      "Формат: create_index <имя_таблицы> <столбец> "
+                      "[hash|sorted]")
+                return
+            table_name = args[1]
+            kind = args[3].lower() if len(args) == 4 else "hash"
+            new_metadata = core.create_index(metadata, table_name, args[2], kind)
+            if new_metadata is not None:
+                metadata = new_metadata
+                utils.save_metadata(metadata)
+
+        elif command == "compact":
+            if len(args) != 2:
+                print("Ошибка: Неверное количество аргументов. "
+                      "Формат: compact <имя_таблицы>")
+                return
+            table_name = args[1]
+            core.compact_table(metadata, table_name)
+            cacher.invalidate(table_name)
+
+        elif command == "set_storage":
+            if len(args) != 3:
+                print("Ошибка: Неверное количество аргументов. "
+                      "Формат: set_storage <имя_таблицы> "
+                      "<json|columnar|records|segmented>")
+                return
+            table_name = args[1]
+            core.set_storage(metadata, table_name, args[2])
+            cacher.invalidate(table_name)
+
+        elif command == "partition":
+            if not 2 <= len(args) <= 4:
+                print("Ошибка: Неверное количество аргументов. "
+                      "Формат: partition <имя_таблицы> [<столбец> [<размер>]]")
+                return
+            table_name = args[1]
+            column = args[2] if len(args) >= 3 else "ID"
+            try:
+                size = int(args[3]) if len(args) == 4 else None
+            except ValueError:
+                print("Ошибка: Размер должен быть целым числом")
+                return
+            core.partition_table(metadata, table_name, column, size)
+            cacher.invalidate(table_name)
+
+        elif command in ("begin", "commit", "rollback"):
+            if len(args) != 1:
+                print(f"Ошибка: Команда {command} не принимает аргументов")
+                return
+            if command == "begin":
+                core.begin(metadata)
+            elif command == "commit":
+                core.commit(metadata)
+            else:
+                new_metadata = core.rollback()
+                if new_metadata is not None:
+                    metadata = new_metadata
+                cacher.invalidate()
+
+        elif command == "scan_mode":
+            if len(args) > 2:
+                print("Ошибка: Неверное количество аргументов. "
+                      "Формат: scan_mode [auto|numpy|python]")
+                return
+            core.set_scan_mode(args[1].lower() if len(args) == 2 else None)
+
+        elif command == "parallel":
+            if len(args) > 3:
+                print("Ошибка: Неверное количество аргументов. "
+                      "Формат: parallel [<процессов> [<мин_записей>]]")
+                return
+            try:
+                values = [int(arg) for arg in args[1:]]
+            except ValueError:
+                print("Ошибка: Параметры должны быть целыми числами")
+                return
+            core.set_parallel(*values)
+
+        elif command == "memory":
+            if len(args) > 2:
+                print("Ошибка: Неверное количество аргументов. "
+                      "Формат: memory [<имя_таблицы>]")
+                return
+            report = core.memory_report(metadata,
+                                        args[1] if len(args) == 2 else None)
+            if report == []:
+                print("Нет загруженных таблиц.")
+            elif report is not None:
+                print_rows(report)
+
+        elif command == "cache_stats":
+            stats = cacher.stats()
+            print(f'Попаданий: {stats["hits"]}, промахов: {stats["misses"]}, '
+                  f'вытеснено: {stats["evictions"]}, '
+                  f'записей: {stats["size"]}/{stats["max_size"]}')
+
+        elif command == "stats":
+            action = args[1].lower() if len(args) > 1 else None
+            if action is None and len(args) == 1:
+                print_stats(metrics.snapshot())
+            elif action == "reset" and len(args) == 2:
+                metrics.reset()
+                print("Метрики сброшены.")
+            elif action == "export" and len(args) == 3:
+                try:
+                    metrics.export(args[2])
+                except OSError as e:
+                    print(f"Ошибка: Не удалось записать файл. {e}")
+                    return
+                print(f"Метрики записаны в файл {args[2]}.")
+            else:
+                print("Ошибка: Формат: stats [reset|export <файл.json>]")
+
+        elif command == "profile":
+            if len(args) > 2:
+                print("Ошибка: Неверное количество аргументов. "
+                      "Формат: profile [cpu|memory|off]")
+                return
+            kind = args[1].lower() if len(args) == 2 else None
+            if kind is None:
+                report = metrics.profiling_report()
+                print(report if report is not None
+                      else "Профилирование выключено.")
+            elif kind == "off":
+                report = metrics.stop_profiling()
+                print(report if report is not None
+                      else "Профилирование не было включено.")
+            elif kind in metrics.PROFILE_KINDS:
+                metrics.start_profiling(kind)
+                print(f"Профилирование {kind} включено. Отчет - команда "
+                      f"profile, выключение - profile off.")
+            else:
+                print("Ошибка: Формат: profile [cpu|memory|off]")
+
         elif command == "insert":
             # проверка базового формат: insert into <table> values (...)
             if (len(args) < 4 or args[1].lower() != "into"
@@ -109,7 +420,7 @@ def run():
                 print("Ошибка: Неверный формат. "
                       "Должно быть: insert into "
                       "<таблица> values (...)")
-                continue
+                return
 
             table_name = args[2]
 
@@ -130,50 +441,104 @@ def run():
                 values = [v.strip() for v in values_str.split(",") if v.strip()]
 
             # вызов insert
-            core.insert(metadata, table_name, values)
+            if core.insert(metadata, table_name, values) is not None:
+                # сохраняем счетчик ID таблицы
+                utils.save_metadata(metadata)
+            cacher.invalidate(table_name)
 
         elif command == "select":
-            # Формат: select from <table> [where ...]
+            # Формат: select [<список выборки>] from <table> [where ...]
+            # [group by ...] [order by <col> [desc]] [limit N] [offset M]
+            try:
+                args, limit, offset = parse_limit(args)
+            except ValueError:
+                print("Ошибка: LIMIT и OFFSET должны быть "
+                      "неотрицательными целыми числами")
+                return
+            try:
+                args, order_by = parse_order(args)
+            except ValueError:
+                print("Ошибка: Формат сортировки: order by <столбец> [asc|desc]")
+                return
+            try:
+                args, group_by = parse_group(args)
+            except ValueError:
+                print("Ошибка: Формат группировки: group by <столбец>[, ...]")
+                return
+
+            select_items = None
+            lowered = [arg.lower() for arg in args]
+            if len(args) > 1 and lowered[1] != "from" and "from" in lowered:
+                # Список выборки между select и from
+                from_idx = lowered.index("from")
+                select_items = parse_select_list(" ".join(args[1:from_idx]))
+                if not select_items:
+                    print("Ошибка: Некорректный список выборки")
+                    return
+                args = args[:1] + args[from_idx:]
+
             if len(args) < 3 or args[1].lower() != "from":
                 print("Ошибка: Неверный формат. "
                       "Должно быть: select from <таблица> [where ...]")
-                continue
+                return
 
             table_name = args[2]
 
+            try:
+                args, join = parse_join(args)
+            except ValueError:
+                print("Ошибка: Формат соединения: join <таблица> on "
+                      "<таблица1>.<столбец> = <таблица2>.<столбец>")
+                return
+
             if len(args) > 4 and args[3].lower() == "where":
                 # Есть условие WHERE
-                where_str = " ".join(args[4:])
+                where_str = _where_str(args, words, len(args) - 4)
                 where_clause = parse_where(where_str)
                 if not where_clause:
                     print("Ошибка: Некорректное условие WHERE")
-                    continue
+                    return
 
-                data = core.select(table_name, where_clause, cacher)
             else:
                 # без WHERE
-                data = core.select(table_name, None, cacher)
+                where_clause = None
+
+            # Список выборки без агрегатов - проекция на столбцы
+            columns = None
+            if (select_items is not None and not group_by
+                    and all(func is None for func, _ in select_items)):
+                columns = [col for _, col in select_items]
+                select_items = None
+
+            if join is not None:
+                if select_items is not None or group_by:
+                    print("Ошибка: Агрегатные функции и GROUP BY с JOIN "
+                          "не поддерживаются")
+                    return
+                rows = core.join(metadata, table_name, *join, where_clause,
+                                 limit, offset, order_by, columns)
+            elif select_items is not None or group_by:
+                if select_items is None:
+                    print("Ошибка: Для GROUP BY нужен список выборки")
+                    return
+                rows = core.aggregate(metadata, table_name, select_items,
+                                      where_clause, group_by, order_by,
+                                      limit, offset)
+            else:
+                rows = core.select_iter(metadata, table_name, where_clause,
+                                        cacher, limit, offset, order_by,
+                                        columns)
 
             # вывод результата через PrettyTable
-            if data:
-                # получаем заголовки из первой записи
-                headers = list(data[0].keys())
-                table = PrettyTable()
-                table.field_names = headers
-
-                for row in data:
-                    table.add_row([row[h] for h in headers])
-
-                print(table)
-            else:
-                print("Нет данных для отображения.")
+            if rows is not None:
+                print_rows(rows)
 
         elif command == "update":
             # Формат: update <table> set ... where ...
             if len(args) < 6:
                 print("Ошибка: Неверный формат. "
                       "Должно быть: update <таблица> set ... where ...")
-                continue
+                return
 
             table_name = args[1]
 
@@ -189,49 +554,102 @@ def run():
 
             if set_idx == -1 or where_idx == -1:
                 print("Ошибка: Отсутствуют SET или WHERE в команде UPDATE")
-                continue
+                return
 
             # парсинг SET
             set_str = " ".join(args[set_idx + 1:where_idx])
             set_clause = parse_set(set_str)
             if not set_clause:
                 print("Ошибка: Некорректное условие SET")
-                continue
+                return
 
             # парсинг WHERE
-            where_str = " ".join(args[where_idx + 1:])
+            where_str = _where_str(args, words, len(args) - where_idx - 1)
             where_clause = parse_where(where_str)
             if not where_clause:
                 print("Ошибка: Некорректное условие WHERE")
-                continue
+                return
 
             # вызываем update
             core.update(metadata, table_name, set_clause, where_clause)
+            cacher.invalidate(table_name)
 
         elif command == "delete":
             if len(args) < 3 or args[1].lower() != "from":
                 print("Ошибка: Неверный формат. "
                       "Должно быть: delete from <таблица> [where ...]")
-                continue
+                return
 
             table_name = args[2]
 
             if len(args) > 4 and args[3].lower() == "where":
-                where_str = " ".join(args[4:])
+                where_str = _where_str(args, words, len(args) - 4)
                 where_clause = parse_where(where_str)
                 if not where_clause:
                     print("Ошибка: Некорректное условие WHERE")
-                    continue
+                    return
 
-                core.delete(table_name, where_clause)
+                core.delete(metadata, table_name, where_clause)
             else:
                 # Без условия WHERE - удаляем все
-                confirm = prompt.string("Вы уверены, что хотите удалить "
-                                        "ВСЕ записи из таблицы? (yes/no): ")
-                if confirm.lower() == "yes":
-                    core.delete(table_name, None)
+                if confirm("Вы уверены, что хотите удалить "
+                           "ВСЕ записи из таблицы? (yes/no): "):
+                    core.delete(metadata, table_name, None)
                 else:
                     print("Операция отменена.")
+            cacher.invalidate(table_name)
 
         else:
             print(f"Функции '{command}' нет. Попробуйте снова.")
+            # Неизвестные команды учитываются вместе
+            command = "unknown"
+    finally:
+        session["metadata"] = metadata
+        metrics.observe(f"command.{command}", time.perf_counter() - start_time)
+
+
+def run(lines=None):
+    """Выполняет команды базы данных.
+
+    Без lines работает интерактивно. lines - строки скрипта: команды
+    выполняются подряд без приветствия, метаданные и таблицы остаются
+    в памяти между командами.
+    """
+    interactive = lines is None
+    if interactive:
+        print("***Операции с данными***")
+        print("Введите help для списка команд.")
+        commands = read_commands()
+    else:
+        commands = script_commands(lines)
+
+    # Создаем кэш для select запросов. Метаданные загружаются перед каждой
+    # командой под блокировкой базы
+    session = {"metadata": None, "cacher": create_cacher()}
+    changed = False
+
+    for user_input in commands:
+        args = parse_command(user_input)
+        if args is None:
+            continue
+
+        if args[0].lower() == "exit":
+            shutdown(session["metadata"], changed)
+            print("Выход из программы.")
+            return
+
+        # Команда выполняется под блокировкой файлов базы, поэтому другие
+        # процессы не пишут в те же таблицы одновременно с ней
+        try:
+            with locking.command_lock(args[0].lower()):
+                if not utils.in_transaction():
+                    # загрузить актуальные метаданные
+                    session["metadata"] = utils.load_metadata()
+                state = _metadata_state(session["metadata"])
+                execute(session, args, user_input)
+                changed |= _metadata_state(session["metadata"]) != state
+        except TimeoutError as e:
+            print(f"Ошибка: {e}")
+
+    # Скрипт закончился без команды exit
+    shutdown(session["metadata"], changed)
@@ -0,0 +1,245 @@
+import atexit
+import bisect
+import json
+import os
+from operator import itemgetter
+
+from .compact import row_ids
+from .constants import DATA_DIR
+from .utils import (
+    atomic_save,
+    in_transaction,
+    load_table_data,
+    register_change_listener,
+    table_signature,
+    table_state,
+)
+
+# Виды индексов и расширения их файлов: хэш-индекс ищет по равенству,
+# упорядоченный - по диапазонам и отдает строки в порядке значений
+INDEX_KINDS = {"hash": ".idx", "sorted": ".sidx"}
+
+# Индексы в памяти: (таблица, столбец, вид) -> состояние индекса
+_indexes = {}
+
+_entry_value = itemgetter(0)
+
+
+def _index_path(table_name, column, kind="hash"):
+    """Путь к файлу индекса столбца."""
+    return f"{DATA_DIR}{table_name}.{column}{INDEX_KINDS[kind]}"
+
+
+def _index_key(value):
+    """Ключ хэш-индекса для значения (сравнение идет по строковому виду)."""
+    return str(value)
+
+
+def _new_index(kind, signature):
+    """Создает пустое состояние индекса."""
+    # hash: entries - ключ -> {ID: None}; sorted: entries - список пар
+    # (значение, ID) по возрастанию. keys: ID -> ключ или значение
+    entries = {} if kind == "hash" else []
+    return {"kind": kind, "signature": signature, "entries": entries,
+            "keys": {}, "dirty": False}
+
+
+def _add(index, row_id, value):
+    """Добавляет строку со значением столбца в индекс."""
+    if index["kind"] == "hash":
+        value = _index_key(value)
+        index["entries"].setdefault(value, {})[row_id] = None
+    else:
+        bisect.insort(index["entries"], (value, row_id))
+    index["keys"][row_id] = value
+
+
+def _remove(index, row_id):
+    """Удаляет ID строки из индекса."""
+    if row_id not in index["keys"]:
+        return
+    value = index["keys"].pop(row_id)
+
+    entries = index["entries"]
+    if index["kind"] == "hash":
+        ids = entries[value]
+        del ids[row_id]
+        if not ids:
+            del entries[value]
+    else:
+        del entries[bisect.bisect_left(entries, (value, row_id))]
+
+
+def _fill(index, pairs):
+    """Заполняет индекс парами (значение, ID)."""
+    if index["kind"] == "hash":
+        for value, row_id in pairs:
+            _add(index, row_id, value)
+    else:
+        index["entries"] = sorted(pairs)
+        index["keys"] = {row_id: value for value, row_id in index["entries"]}
+
+
+def _build_index(table_name, column, kind):
+    """Строит индекс по текущим данным таблицы."""
+    table_data = load_table_data(table_name)
+    index = _new_index(kind, table_signature(table_name))
+    _fill(index, list(zip([row.get(column) for row in table_data],
+                          row_ids(table_data))))
+    index["dirty"] = True
+    return index
+
+
+def _load_index(table_name, column, kind):
+    """Загружает индекс с диска, если он соответствует файлам таблицы."""
+    try:
+        with open(_index_path(table_name, column, kind), 'r',
+                  encoding='utf-8') as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+    # Файлы таблицы менялись после сохранения индекса
+    if data.get("state") != table_state(table_name):
+        return None
+
+    index = _new_index(kind, table_signature(table_name))
+    if kind == "hash":
+        _fill(index, [(key, row_id) for key, ids in data["entries"].items()
+                      for row_id in ids])
+    else:
+        _fill(index, [(value, row_id) for value, row_id in data["entries"]])
+    return index
+
+
+def _get_index(table_name, column, kind="hash"):
+    """Возвращает актуальный индекс, загружая или перестраивая его."""
+    index = _indexes.get((table_name, column, kind))
+    if index is not None and index["signature"] == table_signature(table_name):
+        return index
+
+    index = _load_index(table_name, column, kind)
+    if index is None:
+        index = _build_index(table_name, column, kind)
+    _indexes[(table_name, column, kind)] = index
+    return index
+
+
+def _write_index_file(filepath, data):
+    """Записывает индекс в JSON-файл."""
+    with open(filepath, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def save_index(table_name, column, kind="hash"):
+    """Сохраняет индекс на диск вместе с сигнатурой файлов таблицы."""
+    index = _indexes.get((table_name, column, kind))
+    if index is None or index["signature"] != table_signature(table_name):
+        return
+    if in_transaction():
+        # Индекс содержит еще не записанные в файлы изменения
+        return
+
+    if kind == "hash":
+        entries = {key: list(ids) for key, ids in index["entries"].items()}
+    else:
+        entries = index["entries"]
+    data = {"state": table_state(table_name), "entries": entries}
+    atomic_save(_index_path(table_name, column, kind), _write_index_file, data)
+    index["dirty"] = False
+
+
+def save_indexes():
+    """Сохраняет на диск все измененные индексы."""
+    for (table_name, column, kind), index in list(_indexes.items()):
+        if index["dirty"]:
+            save_index(table_name, column, kind)
+
+
+def create_index(table_name, column, kind="hash"):
+    """Строит индекс по столбцу и сохраняет его на диск.
+
+    Возвращает количество различных значений столбца.
+    """
+    index = _build_index(table_name, column, kind)
+    _indexes[(table_name, column, kind)] = index
+    save_index(table_name, column, kind)
+    return len(set(index["keys"].values()))
+
+
+def drop_indexes(table_name, columns, kind="hash"):
+    """Удаляет индексы таблицы из памяти и с диска."""
+    for column in columns:
+        _indexes.pop((table_name, column, kind), None)
+        try:
+            os.remove(_index_path(table_name, column, kind))
+        except FileNotFoundError:
+            pass
+
+
+def lookup(table_name, column, value):
+    """Возвращает ID строк со значением value в столбце, по возрастанию."""
+    index = _get_index(table_name, column)
+    return sorted(index["entries"].get(_index_key(value), ()))
+
+
+def lookup_range(table_name, column, low=None, high=None,
+                 include_low=True, include_high=True):
+    """Возвращает ID строк со значением столбца в диапазоне, по возрастанию.
+
+    Границы ищутся двоичным поиском по упорядоченному индексу, None
+    означает отсутствие границы.
+    """
+    entries = _get_index(table_name, column, "sorted")["entries"]
+
+    start, end = 0, len(entries)
+    if low is not None:
+        find = bisect.bisect_left if include_low else bisect.bisect_right
+        start = find(entries, low, key=_entry_value)
+    if high is not None:
+        find = bisect.bisect_right if include_high else bisect.bisect_left
+        end = find(entries, high, key=_entry_value)
+
+    return sorted(row_id for _, row_id in entries[start:end])
+
+
+def iter_sorted(table_name, column, descending=False):
+    """Перебирает ID строк в порядке значений столбца.
+
+    Строки с равными значениями идут по ID в том же направлении.
+    """
+    entries = _get_index(table_name, column, "sorted")["entries"]
+    # Перебираем копию: индекс может измениться, пока вывод не закончен
+    ordered = entries[::-1] if descending else entries[:]
+    return (row_id for _, row_id in ordered)
+
+
+def _on_table_change(table_name, records, old_signature, new_signature):
+    """Поддерживает индексы таблицы в актуальном состоянии при записи."""
+    for (name, column, kind), index in list(_indexes.items()):
+        if name != table_name:
+            continue
+
+        # Индекс устарел или таблица изменилась целиком - перестроим позже
+        if records is None or index["signature"] != old_signature:
+            del _indexes[(name, column, kind)]
+            continue
+
+        for record in records:
+            op = record["op"]
+            if op in ("insert", "update"):
+                row = record["row"]
+                _remove(index, row["ID"])
+                _add(index, row["ID"], row.get(column))
+            elif op == "delete":
+                _remove(index, record["id"])
+            elif op == "clear":
+                index["entries"].clear()
+                index["keys"].clear()
+
+        index["signature"] = new_signature
+        index["dirty"] = True
+
+
+register_change_listener(_on_table_change)
+atexit.register(save_indexes)
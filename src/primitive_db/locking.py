@@ -0,0 +1,86 @@
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: рекомендательных блокировок flock нет
+    fcntl = None
+
+from .constants import LOCK_FILE, LOCK_TIMEOUT
+from .utils import in_transaction, recover_transaction, transaction_interrupted
+
+# Команды, которые только читают данные и не мешают друг другу
+READ_COMMANDS = {"help", "list_tables", "info", "select", "cache_stats",
+                 "memory", "stats", "profile"}
+
+_lock_file = None
+# Кто держит блокировку дольше одной команды: None, "transaction" или
+# "server"
+_held_by = None
+
+
+def _acquire(exclusive):
+    """Захватывает блокировку файла базы, ожидая не дольше LOCK_TIMEOUT."""
+    global _lock_file
+
+    if fcntl is None:
+        return
+    if _lock_file is None:
+        _lock_file = open(LOCK_FILE, 'a')
+
+    operation = (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | fcntl.LOCK_NB
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while True:
+        try:
+            fcntl.flock(_lock_file, operation)
+            return
+        except BlockingIOError:
+            if time.monotonic() >= deadline:
+                raise TimeoutError("База данных занята другим процессом.")
+            time.sleep(0.01)
+
+
+def _release():
+    """Освобождает блокировку файла базы."""
+    if fcntl is not None and _lock_file is not None:
+        fcntl.flock(_lock_file, fcntl.LOCK_UN)
+
+
+def pin_exclusive():
+    """Захватывает базу до конца работы процесса (режим сервера)."""
+    global _held_by
+
+    _acquire(exclusive=True)
+    recover_transaction()
+    _held_by = "server"
+
+
+@contextmanager
+def command_lock(command):
+    """Блокирует базу на время команды.
+
+    Читающие команды разных процессов выполняются одновременно, а
+    изменяющие - по одной. Открытая командой begin транзакция держит
+    блокировку до commit или rollback. Прерванный COMMIT доводится до
+    конца под исключительной блокировкой, даже перед читающей командой.
+    """
+    global _held_by
+
+    if _held_by == "server":
+        yield
+        return
+
+    recover = False
+    if _held_by is None:
+        recover = command not in READ_COMMANDS or transaction_interrupted()
+        _acquire(exclusive=recover)
+    try:
+        if recover:
+            recover_transaction()
+        yield
+    finally:
+        if in_transaction():
+            _held_by = "transaction"
+        else:
+            _held_by = None
+            _release()
@@ -1,9 +1,83 @@
 #!/usr/bin/env python3
+import argparse
+import sys
+
+from ..decorators import set_auto_confirm
 from . import engine
+from .constants import SERVER_PORT
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="database", description="Примитивная база данных")
+    parser.add_argument("-f", "--file",
+                        help="выполнить команды из файла ('-' - из stdin)")
+    parser.add_argument("-y", "--yes", action="store_true",
+                        help="подтверждать удаление без вопросов")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--serve", action="store_true",
+                      help="запустить сервер для нескольких клиентов")
+    mode.add_argument("--connect", action="store_true",
+                      help="выполнять команды на запущенном сервере")
+    parser.add_argument("--socket", metavar="PATH",
+                        help="Unix-сокет сервера вместо TCP-порта")
+    parser.add_argument("--port", type=int, default=SERVER_PORT,
+                        help=f"TCP-порт сервера на localhost "
+                             f"(по умолчанию {SERVER_PORT})")
+    args = parser.parse_args(argv)
+
+    if args.yes:
+        set_auto_confirm(True)
+
+    if args.serve:
+        if args.file is not None:
+            parser.error("--serve нельзя совмещать с --file")
+        # Спросить подтверждение у клиента сервер не может
+        if not args.yes:
+            set_auto_confirm(False)
+        from . import server
+
+        server.serve(args.socket, args.port)
+        return
+
+    if args.connect:
+        _run_client(parser, args)
+        return
+
+    if args.file is None:
+        engine.run()
+        return
+
+    # В пакетном режиме спросить некого: без --yes удаление отменяется
+    if not args.yes:
+        set_auto_confirm(False)
+
+    if args.file == "-":
+        engine.run(sys.stdin)
+        return
+
+    try:
+        with open(args.file, 'r', encoding='utf-8') as f:
+            engine.run(f)
+    except FileNotFoundError:
+        parser.error(f"файл {args.file} не найден")
+
 
+def _run_client(parser, args):
+    """Выполняет команды из файла или интерактивные команды на сервере."""
+    # Сервер и asyncio нужны только в режимах --serve и --connect
+    from . import server
 
-def main():
-    engine.run()
+    if args.file is None:
+        server.run_client(args.socket, args.port)
+    elif args.file == "-":
+        server.run_client(args.socket, args.port, sys.stdin)
+    else:
+        try:
+            with open(args.file, 'r', encoding='utf-8') as f:
+                server.run_client(args.socket, args.port, f)
+        except FileNotFoundError:
+            parser.error(f"файл {args.file} не найден")
 
 
 if __name__ == "__main__":
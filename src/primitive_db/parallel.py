@@ -0,0 +1,118 @@
+import os
+import threading
+
+from .constants import PARALLEL_MIN_ROWS, PARALLEL_WORKERS
+from .utils import stop_sync_timer
+
+_workers = PARALLEL_WORKERS or os.cpu_count() or 1
+_min_rows = PARALLEL_MIN_ROWS
+
+# Строки просматриваемой таблицы. При запуске процессов через fork они
+# достаются процессам-исполнителям без копирования через pickle
+_shared_rows = None
+# Одновременно выполняется один параллельный просмотр: исполнители
+# разделяют _shared_rows
+_scan_lock = threading.Lock()
+
+
+def get_settings():
+    """Возвращает (число процессов, минимальное число строк)."""
+    return _workers, _min_rows
+
+
+def configure(workers=None, min_rows=None):
+    """Настраивает параллельный просмотр таблиц."""
+    global _workers, _min_rows
+
+    if workers is not None:
+        if workers < 1:
+            raise ValueError("Число процессов должно быть не меньше 1.")
+        _workers = workers
+    if min_rows is not None:
+        if min_rows < 0:
+            raise ValueError("Порог строк не может быть отрицательным.")
+        _min_rows = min_rows
+
+
+def _context():
+    """Способ запуска процессов: fork, если он доступен и безопасен.
+
+    fork копирует только вызвавший поток, поэтому блокировки, которые в
+    этот момент держат другие потоки (например, state_lock в режиме
+    сервера), в исполнителе останутся захваченными навсегда. При
+    нескольких потоках исполнители запускаются через forkserver или spawn.
+    Таймер отложенного fsync не в счет: записи сбрасываются сразу.
+    """
+    # multiprocessing и concurrent.futures импортируются только для
+    # больших таблиц: их импорт заметно замедляет запуск
+    import multiprocessing
+
+    stop_sync_timer()
+    methods = multiprocessing.get_all_start_methods()
+    if "fork" in methods and threading.active_count() == 1:
+        return multiprocessing.get_context("fork")
+    if "forkserver" in methods:
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+def _run_chunk(func, start, end, rows, args):
+    """Выполняет func над частью строк в процессе-исполнителе."""
+    if rows is None:
+        rows = _shared_rows[start:end]
+    return func(rows, *args)
+
+
+def map_chunks(rows, func, *args):
+    """Выполняет func(часть строк, *args) параллельно по частям таблицы.
+
+    func должна быть функцией уровня модуля. Возвращает список пар
+    (номер первой строки части, результат) в порядке строк, либо None,
+    если таблица меньше порога и ее выгоднее просмотреть в одном процессе.
+    """
+    global _shared_rows
+
+    if _workers < 2 or len(rows) < max(_min_rows, _workers):
+        return None
+
+    context = _context()
+    shared = context.get_start_method() == "fork"
+    size = -(-len(rows) // _workers)
+    bounds = [(start, min(start + size, len(rows)))
+              for start in range(0, len(rows), size)]
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with _scan_lock:
+        _shared_rows = rows
+        try:
+            with ProcessPoolExecutor(max_workers=len(bounds),
+                                     mp_context=context) as executor:
+                futures = [executor.submit(_run_chunk, func, start, end,
+                                           None if shared else rows[start:end],
+                                           args)
+                           for start, end in bounds]
+                return [(start, future.result())
+                        for (start, _), future in zip(bounds, futures)]
+        finally:
+            _shared_rows = None
+
+
+def map_items(items, func, *args, rows=0):
+    """Выполняет func(элемент, *args) для каждого элемента в нескольких процессах.
+
+    Элементы - небольшие описания работы (например, пути к файлам),
+    которые передаются исполнителям через pickle. rows - сколько строк
+    затронет вся работа: с ним сравнивается порог параллельного
+    просмотра. Возвращает список результатов в порядке элементов или
+    None, если работу выгоднее выполнить в одном процессе.
+    """
+    if _workers < 2 or len(items) < 2 or rows < max(_min_rows, _workers):
+        return None
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=min(_workers, len(items)),
+                             mp_context=_context()) as executor:
+        futures = [executor.submit(func, item, *args) for item in items]
+        return [future.result() for future in futures]
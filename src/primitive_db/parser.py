@@ -1,23 +1,161 @@
+import re
 
+from ..metrics import timed
 
-def parse_where(where_str):
-    """Парсит условие WHERE в словарь."""
-    if not where_str:
-        return None
+# Лексемы условия WHERE: строки в кавычках, операторы и скобки, слова
+WHERE_TOKEN = re.compile(
+    r"""\s*(?:("[^"]*"|'[^']*')|(<=|>=|!=|<>|=|<|>|\(|\)|,)|([^\s=<>!(),]+))"""
+)
+COMPARISON_OPS = {"=", "!=", "<>", "<", "<=", ">", ">="}
+WHERE_KEYWORDS = {"and", "or", "in"}
+
+# Слово команды, как в shlex.split, но с сохраненными кавычками
+COMMAND_WORD = re.compile(r"""(?:"[^"]*"|'[^']*'|[^\s"']+)+""")
+
+# Элемент списка выборки: агрегатная функция или имя столбца
+SELECT_ITEM = re.compile(r"^(?:(\w+)\s*\(\s*(\*|\w+)\s*\)|(\w+(?:\.\w+)?))$")
+AGGREGATE_FUNCTIONS = {"count", "sum", "min", "max", "avg"}
 
+# Условие соединения таблиц: <столбец> = <столбец>
+JOIN_CONDITION = re.compile(r"^([\w.]+)\s*=\s*([\w.]+)$")
+
+
+def _tokenize_where(where_str):
+    """Разбивает условие WHERE на лексемы (тип, значение)."""
+    tokens = []
+    position = 0
     where_str = where_str.strip()
+    while position < len(where_str):
+        match = WHERE_TOKEN.match(where_str, position)
+        if not match or match.end() == position:
+            raise ValueError(f"Не удалось разобрать: {where_str[position:]}")
+        quoted, symbol, word = match.groups()
+        if quoted is not None:
+            tokens.append(("value", quoted[1:-1]))
+        elif symbol is not None:
+            tokens.append(("symbol", symbol))
+        elif word.lower() in WHERE_KEYWORDS:
+            tokens.append(("keyword", word.lower()))
+        else:
+            tokens.append(("word", word))
+        position = match.end()
+    return tokens
+
+
+class _WhereParser:
+    """Рекурсивный разбор условия WHERE в дерево из кортежей.
+
+    ("cmp", столбец, оператор, значение), ("in", столбец, (значения, ...)),
+    ("and", (условия, ...)), ("or", (условия, ...)). Значения остаются
+    строками, к типам столбцов их приводит core.
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        """Возвращает текущую лексему, не сдвигаясь."""
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return (None, None)
+
+    def take(self, kind=None, value=None):
+        """Забирает текущую лексему, проверяя ее тип и значение."""
+        token = self.peek()
+        if token[0] is None or (kind and token[0] != kind) \
+                or (value and token[1] != value):
+            raise ValueError(f"Неожиданная лексема: {token[1]}")
+        self.position += 1
+        return token
+
+    def parse(self):
+        """Разбирает условие целиком."""
+        node = self.parse_or()
+        if self.peek()[0] is not None:
+            raise ValueError(f"Лишняя лексема: {self.peek()[1]}")
+        return node
 
-    if "=" in where_str:
-        parts = where_str.split("=", 1)
-        col = parts[0].strip()
-        val = parts[1].strip()
+    def parse_or(self):
+        """условие OR условие ..."""
+        nodes = [self.parse_and()]
+        while self.peek() == ("keyword", "or"):
+            self.take()
+            nodes.append(self.parse_and())
+        return nodes[0] if len(nodes) == 1 else ("or", tuple(nodes))
 
-        # преобразование будет в _convert_value
-        return {col: val}
+    def parse_and(self):
+        """условие AND условие ..."""
+        nodes = [self.parse_term()]
+        while self.peek() == ("keyword", "and"):
+            self.take()
+            nodes.append(self.parse_term())
+        return nodes[0] if len(nodes) == 1 else ("and", tuple(nodes))
 
-    return None
+    def parse_term(self):
+        """Сравнение, IN или условие в скобках."""
+        if self.peek() == ("symbol", "("):
+            self.take()
+            node = self.parse_or()
+            self.take("symbol", ")")
+            return node
 
+        column = self.take("word")[1]
+        if self.peek() == ("keyword", "in"):
+            self.take()
+            self.take("symbol", "(")
+            values = [self.parse_value()]
+            while self.peek() == ("symbol", ","):
+                self.take()
+                values.append(self.parse_value())
+            self.take("symbol", ")")
+            return ("in", column, tuple(values))
 
+        kind, op = self.take("symbol")
+        if op not in COMPARISON_OPS:
+            raise ValueError(f"Неизвестный оператор: {op}")
+        return ("cmp", column, "!=" if op == "<>" else op, self.parse_value())
+
+    def parse_value(self):
+        """Значение в кавычках или без них."""
+        kind, value = self.peek()
+        if kind == "value":
+            self.take()
+            return value
+
+        # Значение без кавычек может состоять из нескольких слов
+        words = [self.take("word")[1]]
+        while self.peek()[0] == "word":
+            words.append(self.take()[1])
+        return " ".join(words)
+
+
+def split_words(command_str):
+    """Разбивает команду на слова, не снимая кавычки со строк.
+
+    Слова совпадают со словами shlex.split, кроме экранирования
+    обратной косой чертой.
+    """
+    return COMMAND_WORD.findall(command_str)
+
+
+@timed("parse")
+def parse_where(where_str):
+    """Парсит условие WHERE в дерево условий.
+
+    Поддерживаются =, !=, <, <=, >, >=, IN (...), AND, OR и скобки.
+    При синтаксической ошибке возвращает None.
+    """
+    if not where_str or not where_str.strip():
+        return None
+
+    try:
+        return _WhereParser(_tokenize_where(where_str)).parse()
+    except ValueError:
+        return None
+
+
+@timed("parse")
 def parse_set(set_str):
     """Парсит условие SET в словарь."""
     if not set_str:
@@ -37,3 +175,117 @@ def parse_set(set_str):
         result[col.strip()] = val.strip()
 
     return result
+
+
+@timed("parse")
+def parse_limit(args):
+    """Отделяет LIMIT и OFFSET от остальных аргументов команды.
+
+    Возвращает (оставшиеся аргументы, limit, offset). Некорректное
+    значение приводит к ValueError.
+    """
+    rest = []
+    limit = None
+    offset = 0
+
+    i = 0
+    while i < len(args):
+        word = args[i].lower()
+        if word in ("limit", "offset") and i + 1 < len(args):
+            value = int(args[i + 1])
+            if value < 0:
+                raise ValueError(f"Отрицательное значение {word.upper()}")
+            if word == "limit":
+                limit = value
+            else:
+                offset = value
+            i += 2
+        else:
+            rest.append(args[i])
+            i += 1
+
+    return rest, limit, offset
+
+
+@timed("parse")
+def parse_order(args):
+    """Отделяет ORDER BY <столбец> [ASC|DESC] от остальных аргументов.
+
+    Возвращает (оставшиеся аргументы, порядок), где порядок - пара
+    (столбец, по убыванию) или None. Без столбца - ValueError.
+    """
+    for i in range(len(args) - 1):
+        if args[i].lower() == "order" and args[i + 1].lower() == "by":
+            if i + 2 >= len(args):
+                raise ValueError("Не указан столбец ORDER BY")
+
+            end = i + 3
+            descending = False
+            if end < len(args) and args[end].lower() in ("asc", "desc"):
+                descending = args[end].lower() == "desc"
+                end += 1
+            return args[:i] + args[end:], (args[i + 2], descending)
+
+    return args, None
+
+
+@timed("parse")
+def parse_select_list(select_str):
+    """Разбирает список выборки вида "city, count(*), avg(age)".
+
+    Возвращает список пар (функция, столбец), где функция - None для
+    обычного столбца, либо None при ошибке.
+    """
+    items = []
+    for part in select_str.split(","):
+        match = SELECT_ITEM.match(part.strip())
+        if not match:
+            return None
+        func, col, plain = match.groups()
+        if plain is not None:
+            items.append((None, plain))
+            continue
+
+        func = func.lower()
+        if func not in AGGREGATE_FUNCTIONS or (col == "*" and func != "count"):
+            return None
+        items.append((func, col))
+    return items
+
+
+@timed("parse")
+def parse_group(args):
+    """Отделяет GROUP BY <столбец>[, <столбец> ...] в конце аргументов.
+
+    Возвращает (оставшиеся аргументы, список столбцов группировки).
+    Без столбцов - ValueError.
+    """
+    for i in range(len(args) - 1):
+        if args[i].lower() == "group" and args[i + 1].lower() == "by":
+            columns = [col.strip() for col in " ".join(args[i + 2:]).split(",")]
+            if not all(columns):
+                raise ValueError("Не указаны столбцы GROUP BY")
+            return args[:i], columns
+
+    return args, []
+
+
+@timed("parse")
+def parse_join(args):
+    """Отделяет JOIN <таблица> ON <столбец> = <столбец> после имени таблицы.
+
+    args - аргументы вида select from <таблица> ... Возвращает (оставшиеся
+    аргументы, соединение), где соединение - тройка (таблица, столбец,
+    столбец) или None. При ошибке формата - ValueError.
+    """
+    if len(args) < 4 or args[3].lower() != "join":
+        return args, None
+
+    lowered = [arg.lower() for arg in args]
+    if len(args) < 7 or lowered[5] != "on":
+        raise ValueError("Не указано условие ON")
+    end = lowered.index("where") if "where" in lowered else len(args)
+    match = JOIN_CONDITION.match(" ".join(args[6:end]).strip())
+    if not match:
+        raise ValueError("Некорректное условие ON")
+    return args[:3] + args[end:], (args[4], match.group(1), match.group(2))
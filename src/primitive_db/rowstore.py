@@ -0,0 +1,309 @@
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+from .compact import to_dict
+
+# Файл данных (.rec): MAGIC и записи вида <длина><JSON>. Записи - те же
+# операции, что и в журнале таблицы, новые версии строк дописываются в
+# конец файла.
+MAGIC = b"PDBREC1\n"
+FRAME = struct.Struct("<I")
+
+# Файл индекса (.rix): MAGIC, заголовок, затем пары (ID, смещение
+# записи), отсортированные по ID. Смещение -1 означает удаленную строку.
+# Заголовок: размер файла данных, конец последней целой записи в нем,
+# число живых строк и число пар. Индекс всегда можно перестроить по данным.
+INDEX_MAGIC = b"PDBRIX2\n"
+INDEX_HEADER = struct.Struct("<qqqq")
+ENTRY = struct.Struct("<qq")
+ENTRIES_START = len(INDEX_MAGIC) + INDEX_HEADER.size
+
+
+def index_path(filepath):
+    """Путь к файлу индекса для файла данных."""
+    return os.path.splitext(filepath)[0] + ".rix"
+
+
+def _encode(record):
+    """Кодирует запись с префиксом длины."""
+    data = json.dumps(record, ensure_ascii=False, separators=(",", ":"),
+                      default=to_dict).encode("utf-8")
+    return FRAME.pack(len(data)) + data
+
+
+def _read_record(data, offset):
+    """Читает запись по смещению в файле данных."""
+    (size,) = FRAME.unpack_from(data, offset)
+    start = offset + FRAME.size
+    return json.loads(data[start:start + size].decode("utf-8"))
+
+
+def _write_index(filepath, data_size, data_end, entries):
+    """Полностью записывает файл индекса.
+
+    Индекс пишется во временный файл и заменяет прежний переименованием:
+    его перестраивают и читающие команды, которые выполняются
+    одновременно, а прерванная запись не должна оставить половину пар.
+    """
+    live = sum(1 for _, offset in entries if offset >= 0)
+    path = index_path(filepath)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".",
+                                     suffix=".rix.tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(INDEX_MAGIC)
+            f.write(INDEX_HEADER.pack(data_size, data_end, live, len(entries)))
+            for entry in entries:
+                f.write(ENTRY.pack(*entry))
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def _rebuild_index(filepath):
+    """Строит индекс заново, просматривая весь файл данных.
+
+    Оборванная после сбоя последняя запись пропускается: конец последней
+    целой записи сохраняется в заголовке, и append_records отрезает хвост.
+    """
+    offsets = {}
+    with open(filepath, "rb") as f:
+        data = f.read()
+
+    position = len(MAGIC)
+    while position + FRAME.size <= len(data):
+        (size,) = FRAME.unpack_from(data, position)
+        if position + FRAME.size + size > len(data):
+            # Оборванная последняя запись после сбоя
+            break
+        record = _read_record(data, position)
+        op = record["op"]
+        if op in ("insert", "update"):
+            offsets[record["row"]["ID"]] = position
+        elif op == "delete":
+            offsets.pop(record["id"], None)
+        elif op == "clear":
+            offsets.clear()
+        position += FRAME.size + size
+
+    _write_index(filepath, len(data), position, sorted(offsets.items()))
+
+
+def _read_header(index_file):
+    """Заголовок индекса или None, если индекс не целый."""
+    head = index_file.read(ENTRIES_START)
+    if len(head) < ENTRIES_START or not head.startswith(INDEX_MAGIC):
+        return None
+    header = INDEX_HEADER.unpack_from(head, len(INDEX_MAGIC))
+    index_size = os.fstat(index_file.fileno()).st_size
+    if index_size != ENTRIES_START + header[3] * ENTRY.size:
+        return None
+    return header
+
+
+def _ensure_index(filepath):
+    """Проверяет, что индекс соответствует файлу данных и не оборван."""
+    data_size = os.path.getsize(filepath)
+    try:
+        with open(index_path(filepath), "rb") as f:
+            header = _read_header(f)
+    except FileNotFoundError:
+        header = None
+
+    if header is None or header[0] != data_size:
+        _rebuild_index(filepath)
+
+
+def _find_entry(index, row_id):
+    """Двоичный поиск записи индекса по ID, возвращает ее номер или -1."""
+    low = 0
+    high = (len(index) - ENTRIES_START) // ENTRY.size
+    while low < high:
+        middle = (low + high) // 2
+        entry_id, _ = ENTRY.unpack_from(index, ENTRIES_START + middle * ENTRY.size)
+        if entry_id < row_id:
+            low = middle + 1
+        elif entry_id > row_id:
+            high = middle
+        else:
+            return middle
+    return -1
+
+
+def _map(f):
+    """Отображает файл в память только для чтения."""
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def remove_index(filepath):
+    """Удаляет файл индекса для файла данных."""
+    try:
+        os.remove(index_path(filepath))
+    except FileNotFoundError:
+        pass
+
+
+def write_table(filepath, rows):
+    """Записывает таблицу в файл записей, отбрасывая старые версии строк."""
+    entries = []
+    with open(filepath, "wb") as f:
+        f.write(MAGIC)
+        for row in rows:
+            entries.append((row["ID"], f.tell()))
+            f.write(_encode({"op": "insert", "row": row}))
+        data_size = f.tell()
+
+    _write_index(filepath, data_size, data_size, sorted(entries))
+
+
+def read_table(filepath):
+    """Читает все живые строки таблицы в порядке ID."""
+    _ensure_index(filepath)
+
+    rows = []
+    with open(filepath, "rb") as data_file, \
+            open(index_path(filepath), "rb") as index_file:
+        data = _map(data_file)
+        index = index_file.read()
+        for position in range(ENTRIES_START, len(index), ENTRY.size):
+            _, offset = ENTRY.unpack_from(index, position)
+            if offset >= 0:
+                rows.append(_read_record(data, offset)["row"])
+        data.close()
+    return rows
+
+
+def fetch_rows(filepath, ids):
+    """Читает строки по ID, затрагивая только нужные страницы файлов."""
+    if not os.path.exists(filepath):
+        return []
+    _ensure_index(filepath)
+
+    rows = []
+    with open(filepath, "rb") as data_file, \
+            open(index_path(filepath), "rb") as index_file:
+        data = _map(data_file)
+        index = _map(index_file)
+        for row_id in ids:
+            number = _find_entry(index, row_id)
+            if number < 0:
+                continue
+            _, offset = ENTRY.unpack_from(index,
+                                          ENTRIES_START + number * ENTRY.size)
+            if offset >= 0:
+                rows.append(_read_record(data, offset)["row"])
+        index.close()
+        data.close()
+    return rows
+
+
+def count_rows(filepath):
+    """Возвращает число строк из заголовка индекса."""
+    if not os.path.exists(filepath):
+        return 0
+    _ensure_index(filepath)
+
+    with open(index_path(filepath), "rb") as f:
+        head = f.read(ENTRIES_START)
+    return INDEX_HEADER.unpack_from(head, len(INDEX_MAGIC))[2]
+
+
+def last_id(filepath):
+    """Наибольший ID в индексе (0 - строк нет), без чтения данных."""
+    if not os.path.exists(filepath):
+        return 0
+    _ensure_index(filepath)
+
+    with open(index_path(filepath), "rb") as f:
+        entries_count = _read_header(f)[3]
+        if not entries_count:
+            return 0
+        f.seek(ENTRIES_START + (entries_count - 1) * ENTRY.size)
+        return ENTRY.unpack(f.read(ENTRY.size))[0]
+
+
+def append_records(filepath, records):
+    """Дописывает изменения в файл данных и обновляет индекс на месте.
+
+    Оборванная при сбое последняя запись файла данных сначала
+    отрезается, иначе новые записи оказались бы за ней и файл перестал
+    бы читаться.
+    """
+    if not os.path.exists(filepath):
+        write_table(filepath, [])
+    _ensure_index(filepath)
+
+    with open(filepath, "r+b") as data_file, \
+            open(index_path(filepath), "r+b") as index_file:
+        data_size, data_end, live, entries_count = _read_header(index_file)
+        if data_end < data_size:
+            data_file.truncate(data_end)
+        data_file.seek(data_end)
+        last_id = None
+        if entries_count:
+            index_file.seek(ENTRIES_START + (entries_count - 1) * ENTRY.size)
+            last_id, _ = ENTRY.unpack(index_file.read(ENTRY.size))
+
+        # Отображение индекса в память создается только для поиска
+        index_map = None
+        rebuild = False
+
+        for record in records:
+            offset = data_file.tell()
+            data_file.write(_encode(record))
+
+            op = record["op"]
+            if op == "clear":
+                if index_map is not None:
+                    index_map.close()
+                    index_map = None
+                index_file.flush()
+                index_file.truncate(ENTRIES_START)
+                entries_count = live = 0
+                last_id = None
+                continue
+
+            row_id = record["id"] if op == "delete" else record["row"]["ID"]
+            if op != "delete" and (last_id is None or row_id > last_id):
+                # Новые ID растут, поэтому индекс остается упорядоченным
+                index_file.seek(ENTRIES_START + entries_count * ENTRY.size)
+                index_file.write(ENTRY.pack(row_id, offset))
+                entries_count += 1
+                live += 1
+                last_id = row_id
+                if index_map is not None:
+                    index_map.close()
+                    index_map = None
+                continue
+
+            if index_map is None:
+                index_file.flush()
+                index_map = _map(index_file)
+            number = _find_entry(index_map, row_id)
+            if number >= 0:
+                position = ENTRIES_START + number * ENTRY.size
+                _, old_offset = ENTRY.unpack_from(index_map, position)
+                new_offset = -1 if op == "delete" else offset
+                live += (new_offset >= 0) - (old_offset >= 0)
+                index_file.seek(position)
+                index_file.write(ENTRY.pack(row_id, new_offset))
+            elif op != "delete":
+                # ID меньше последнего - порядок индекса нарушится
+                rebuild = True
+
+        if index_map is not None:
+            index_map.close()
+        data_size = data_file.tell()
+        index_file.seek(len(INDEX_MAGIC))
+        index_file.write(INDEX_HEADER.pack(data_size, data_size, live,
+                                           entries_count))
+
+    if rebuild:
+        _rebuild_index(filepath)
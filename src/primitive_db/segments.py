@@ -0,0 +1,228 @@
+import json
+import os
+import zlib
+
+from . import columnar
+from .compact import column_getter, row_ids
+from .constants import SEGMENT_COUNT, SEGMENT_ROWS
+
+# Каталог таблицы содержит файлы сегментов и манифест. Файл сегмента
+# после записи не меняется: измененный сегмент пишется под новым именем,
+# и только запись манифеста делает его видимым. Поэтому сбой посреди
+# записи оставляет таблицу в прошлом состоянии. Сегменты хранятся в
+# колоночном формате, поэтому из них можно читать отдельные столбцы.
+MANIFEST = "manifest.json"
+
+
+def manifest_path(dirpath):
+    """Путь к манифесту сегментированной таблицы."""
+    return os.path.join(dirpath, MANIFEST)
+
+
+def make_scheme(column="ID", size=None):
+    """Схема разбиения таблицы на сегменты.
+
+    По ID строки делятся на диапазоны по size записей (по умолчанию
+    SEGMENT_ROWS), по другому столбцу - по хэшу значения на size
+    сегментов (по умолчанию SEGMENT_COUNT).
+    """
+    if size is not None and size < 1:
+        raise ValueError("Размер сегмента должен быть положительным.")
+    if column == "ID":
+        return {"column": "ID", "size": size or SEGMENT_ROWS}
+    return {"column": column, "count": size or SEGMENT_COUNT}
+
+
+def describe_scheme(scheme):
+    """Описание схемы разбиения для вывода пользователю."""
+    if scheme["column"] == "ID":
+        return f'диапазоны ID по {scheme["size"]} записей'
+    return f'хэш столбца "{scheme["column"]}" на {scheme["count"]} сегментов'
+
+
+def segment_of(scheme, row):
+    """Номер сегмента, в котором хранится строка."""
+    if scheme["column"] == "ID":
+        return (row["ID"] - 1) // scheme["size"]
+    # Встроенный hash() строк меняется между запусками - нужен постоянный
+    value = str(row[scheme["column"]]).encode("utf-8")
+    return zlib.crc32(value) % scheme["count"]
+
+
+def read_manifest(dirpath):
+    """Читает манифест таблицы (FileNotFoundError, если его нет)."""
+    with open(manifest_path(dirpath), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_manifest(filepath, manifest):
+    """Записывает манифест таблицы."""
+    with open(filepath, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=4, ensure_ascii=False)
+
+
+def read_segment(filepath, columns=None):
+    """Читает строки одного сегмента (только столбцы columns, если заданы).
+
+    Строки - словари: сегменты кэшируются для просмотров, которые
+    копируют найденные строки, а словарь копируется быстрее.
+    """
+    return columnar.read_table(filepath, columns, compact=False)
+
+
+def write_segment(filepath, rows):
+    """Записывает строки одного сегмента."""
+    columnar.write_table(filepath, rows)
+
+
+def unused_files(dirpath, manifest):
+    """Файлы каталога, на которые манифест не ссылается.
+
+    Это прежние версии переписанных сегментов и файлы, оставшиеся от
+    записи, прерванной до переключения манифеста.
+    """
+    used = {stats["file"] for stats in manifest["segments"].values()}
+    used.add(MANIFEST)
+    return [os.path.join(dirpath, name) for name in os.listdir(dirpath)
+            if name not in used]
+
+
+def segment_files(dirpath, manifest):
+    """Список (номер, путь к файлу, статистика) сегментов по возрастанию номеров."""
+    return sorted((int(number), os.path.join(dirpath, stats["file"]), stats)
+                  for number, stats in manifest["segments"].items())
+
+
+def read_table(dirpath):
+    """Читает строки всех сегментов таблицы в порядке ID."""
+    manifest = read_manifest(dirpath)
+    rows = []
+    for _, path, _ in segment_files(dirpath, manifest):
+        rows.extend(columnar.read_table(path))
+    if manifest["scheme"]["column"] != "ID":
+        # Каждый сегмент упорядочен по ID - сортировка лишь сливает их
+        rows.sort(key=lambda row: row["ID"])
+    return rows
+
+
+def _segment_stats(rows):
+    """Статистика сегмента: число строк, отпечаток набора ID, min/max."""
+    ids = row_ids(rows)
+    id_xor = 0
+    for row_id in ids:
+        id_xor ^= row_id
+
+    minimum, maximum = {}, {}
+    for name in rows[0]:
+        values = list(map(column_getter(rows, name), rows))
+        minimum[name] = min(values)
+        maximum[name] = max(values)
+    return {"rows": len(rows), "id_sum": sum(ids), "id_xor": id_xor,
+            "min": minimum, "max": maximum}
+
+
+def plan_write(dirpath, rows, scheme=None, touched=None):
+    """Раскладывает строки по сегментам и решает, какие из них переписать.
+
+    Сегмент переписывается, если изменился набор его ID (вставка,
+    удаление, переход строки в другой сегмент) или в нем есть строки из
+    touched - ID строк, измененных на месте. touched=None переписывает
+    все сегменты. Без scheme сохраняется схема из манифеста.
+
+    Возвращает (новый манифест, {номер: строки} для записи).
+    """
+    try:
+        old = read_manifest(dirpath)
+    except FileNotFoundError:
+        old = None
+
+    if scheme is None:
+        scheme = old["scheme"] if old is not None else make_scheme()
+    old_segments = {}
+    if old is not None:
+        old_segments = old["segments"]
+        if old["scheme"] != scheme:
+            touched = None
+    version = old["version"] + 1 if old is not None else 1
+
+    groups = {}
+    for row in rows:
+        groups.setdefault(segment_of(scheme, row), []).append(row)
+
+    segments, writes = {}, {}
+    for number in sorted(groups):
+        group = groups[number]
+        stats = _segment_stats(group)
+        previous = old_segments.get(str(number))
+        if (touched is None or previous is None
+                or (previous["rows"], previous["id_sum"], previous["id_xor"])
+                != (stats["rows"], stats["id_sum"], stats["id_xor"])
+                or any(row["ID"] in touched for row in group)):
+            stats["file"] = f"{number}-{version}.col"
+            writes[number] = group
+        else:
+            stats["file"] = previous["file"]
+            stats["bytes"] = previous["bytes"]
+        segments[str(number)] = stats
+
+    manifest = {"version": version, "scheme": scheme, "segments": segments}
+    return manifest, writes
+
+
+def candidate_segments(where, scheme):
+    """Номера сегментов, где могут быть строки под условием, или None.
+
+    Для разбиения по хэшу столбца равенство и IN по этому столбцу
+    указывают сегменты точно; None - условие сегменты не ограничивает.
+    """
+    kind = where[0]
+    if kind in ("and", "or"):
+        parts = [candidate_segments(node, scheme) for node in where[1]]
+        if kind == "and":
+            parts = [part for part in parts if part is not None]
+            return set.intersection(*parts) if parts else None
+        if any(part is None for part in parts):
+            return None
+        return set().union(*parts)
+
+    col = where[1]
+    if scheme["column"] == "ID" or col != scheme["column"]:
+        return None
+    if kind == "in":
+        return {segment_of(scheme, {col: value}) for value in where[2]}
+    if where[2] == "=":
+        return {segment_of(scheme, {col: where[3]})}
+    return None
+
+
+def may_match(where, stats):
+    """Может ли в сегменте быть строка под условием (по min/max столбцов).
+
+    where - типизированное дерево условия из core. False означает, что
+    сегмент можно не читать.
+    """
+    kind = where[0]
+    if kind == "and":
+        return all(may_match(node, stats) for node in where[1])
+    if kind == "or":
+        return any(may_match(node, stats) for node in where[1])
+
+    col = where[1]
+    low, high = stats["min"].get(col), stats["max"].get(col)
+    if low is None or high is None:
+        return True
+    if kind == "in":
+        return any(low <= value <= high for value in where[2])
+
+    op, value = where[2], where[3]
+    if op == "=":
+        return low <= value <= high
+    if op == "!=":
+        return not low == high == value
+    if op == "<":
+        return low < value
+    if op == "<=":
+        return low <= value
+    if op == ">":
+        return high > value
+    return high >= value
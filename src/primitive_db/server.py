@@ -0,0 +1,276 @@
+import asyncio
+import io
+import os
+import signal
+import socket
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from ..decorators import create_cacher
+from . import engine, locking, utils
+from .constants import SERVER_HOST, SERVER_PORT, SERVER_WORKERS, SERVICE_KEY
+
+# Строка, которой сервер заканчивает ответ на каждую команду
+END_OF_RESPONSE = "\0"
+
+# Команды, меняющие схему или настройки всей базы: выполняются, когда
+# других команд нет
+GLOBAL_COMMANDS = {"create_table", "drop_table", "scan_mode", "parallel"}
+
+# Транзакции держат состояние процесса, общее для всех клиентов
+TRANSACTION_COMMANDS = {"begin", "commit", "rollback"}
+
+# Максимальная длина строки команды, байт
+MAX_COMMAND_SIZE = 16 * 1024 * 1024
+
+
+class _ThreadOutput:
+    """Замена sys.stdout, собирающая вывод команды каждого потока отдельно."""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+
+    def write(self, text):
+        buffer = getattr(self._local, "buffer", None)
+        return (buffer or self._stream).write(text)
+
+    def flush(self):
+        if getattr(self._local, "buffer", None) is None:
+            self._stream.flush()
+
+    def capture(self, func, *args):
+        """Вызывает func(*args) и возвращает (результат, текст вывода)."""
+        self._local.buffer = io.StringIO()
+        try:
+            result = func(*args)
+            return result, self._local.buffer.getvalue()
+        finally:
+            self._local.buffer = None
+
+
+class _ReadWriteLock:
+    """Блокировка asyncio: много читателей или один писатель.
+
+    Ждущий писатель не пропускает новых читателей вперед себя.
+    """
+
+    def __init__(self):
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+        self._changed = asyncio.Condition()
+
+    async def acquire(self, exclusive):
+        async with self._changed:
+            if not exclusive:
+                await self._changed.wait_for(
+                    lambda: not self._writer and not self._waiting_writers)
+                self._readers += 1
+                return
+
+            self._waiting_writers += 1
+            try:
+                await self._changed.wait_for(
+                    lambda: not self._writer and not self._readers)
+            finally:
+                self._waiting_writers -= 1
+            self._writer = True
+
+    async def release(self, exclusive):
+        async with self._changed:
+            if exclusive:
+                self._writer = False
+            else:
+                self._readers -= 1
+            self._changed.notify_all()
+
+
+class _Server:
+    """Состояние сервера: таблицы в памяти и блокировки команд.
+
+    Читающие команды выполняются параллельно, изменяющие - по одной и
+    только когда их таблицы не читаются. Команды из GLOBAL_COMMANDS
+    ждут завершения всех остальных.
+    """
+
+    def __init__(self, output):
+        self.output = output
+        self.session = {"metadata": utils.load_metadata(),
+                        "cacher": create_cacher()}
+        self.executor = ThreadPoolExecutor(SERVER_WORKERS)
+        self.global_lock = _ReadWriteLock()
+        # Изменяющие команды выполняются по одной: они пишут в общие
+        # метаданные
+        self.write_lock = _ReadWriteLock()
+        self.table_locks = {}
+
+    def _locks_for(self, command, args):
+        """Блокировки команды в порядке захвата: (блокировка, эксклюзивно)."""
+        if command in GLOBAL_COMMANDS:
+            return [(self.global_lock, True)]
+
+        locks = [(self.global_lock, False)]
+        exclusive = command not in locking.READ_COMMANDS
+        if exclusive:
+            locks.append((self.write_lock, True))
+
+        # Таблицы команды - аргументы, совпадающие с именами таблиц.
+        # Сортировка задает общий порядок захвата и исключает взаимную
+        # блокировку команд
+        metadata = self.session["metadata"]
+        tables = sorted({arg for arg in args[1:]
+                         if arg in metadata and arg != SERVICE_KEY})
+        locks += [(self.table_locks.setdefault(table, _ReadWriteLock()),
+                   exclusive) for table in tables]
+        return locks
+
+    async def execute(self, args, line):
+        """Выполняет команду под ее блокировками и возвращает ее вывод."""
+        command = args[0].lower()
+        if command in TRANSACTION_COMMANDS:
+            return "Ошибка: Транзакции в режиме сервера недоступны.\n"
+
+        acquired = []
+        try:
+            for lock, exclusive in self._locks_for(command, args):
+                await lock.acquire(exclusive)
+                acquired.append((lock, exclusive))
+
+            loop = asyncio.get_running_loop()
+            _, text = await loop.run_in_executor(
+                self.executor, self.output.capture, engine.execute,
+                self.session, args, line)
+            return text
+        finally:
+            for lock, exclusive in reversed(acquired):
+                await lock.release(exclusive)
+
+    async def handle_client(self, reader, writer):
+        """Выполняет команды клиента, пока тот не отключится или не выйдет."""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                line = line.decode("utf-8", "replace")
+                args, text = self.output.capture(engine.parse_command, line)
+                if args is not None and args[0].lower() == "exit":
+                    await _respond(writer, "Выход из программы.\n")
+                    break
+                if args is not None:
+                    text += await self.execute(args, line)
+                await _respond(writer, text)
+        except (ConnectionError, ValueError):
+            # Клиент оборвал соединение или прислал слишком длинную строку
+            pass
+        finally:
+            writer.close()
+
+
+async def _respond(writer, text):
+    """Отправляет клиенту вывод команды с маркером конца ответа."""
+    if text and not text.endswith("\n"):
+        text += "\n"
+    writer.write(f"{text}{END_OF_RESPONSE}\n".encode("utf-8"))
+    await writer.drain()
+
+
+async def _serve(server, socket_path, port):
+    """Принимает подключения, пока сервер не остановят."""
+    if socket_path is not None:
+        listener = await asyncio.start_unix_server(
+            server.handle_client, socket_path, limit=MAX_COMMAND_SIZE)
+        print(f"Сервер базы данных слушает сокет {socket_path}")
+    else:
+        listener = await asyncio.start_server(
+            server.handle_client, SERVER_HOST, port, limit=MAX_COMMAND_SIZE)
+        print(f"Сервер базы данных слушает {SERVER_HOST}:{port}")
+    print("Для остановки нажмите Ctrl+C.")
+
+    # SIGTERM останавливает сервер так же, как Ctrl+C
+    stopped = asyncio.Event()
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM,
+                                                      stopped.set)
+    except NotImplementedError:  # Windows
+        pass
+
+    async with listener:
+        await stopped.wait()
+
+
+def serve(socket_path=None, port=SERVER_PORT):
+    """Запускает сервер базы данных на Unix-сокете или TCP-порту localhost.
+
+    Сервер держит таблицы в памяти и выполняет команды нескольких
+    клиентов одновременно. Пока он работает, файлы базы заблокированы
+    для других процессов.
+    """
+    try:
+        locking.pin_exclusive()
+    except TimeoutError as e:
+        print(f"Ошибка: {e}")
+        return
+
+    output = _ThreadOutput(sys.stdout)
+    sys.stdout = output
+    server = _Server(output)
+    try:
+        asyncio.run(_serve(server, socket_path, port))
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print(f"Ошибка: Не удалось запустить сервер. {e}")
+    finally:
+        server.executor.shutdown()
+        engine.shutdown(server.session["metadata"])
+        sys.stdout = output._stream
+        if socket_path is not None and os.path.exists(socket_path):
+            os.remove(socket_path)
+        print("Сервер остановлен.")
+
+
+def _connect(socket_path, port):
+    """Открывает соединение с сервером."""
+    if socket_path is not None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(socket_path)
+        return sock
+    return socket.create_connection((SERVER_HOST, port))
+
+
+def run_client(socket_path=None, port=SERVER_PORT, lines=None):
+    """Отправляет команды серверу и выводит его ответы.
+
+    Без lines команды читаются интерактивно, иначе - из строк скрипта.
+    """
+    try:
+        sock = _connect(socket_path, port)
+    except OSError as e:
+        print(f"Ошибка: Не удалось подключиться к серверу. {e}")
+        return
+
+    if lines is None:
+        print("***Операции с данными (сервер)***")
+        commands = engine.read_commands()
+    else:
+        commands = engine.script_commands(lines)
+
+    with sock, sock.makefile("rw", encoding="utf-8", newline="\n") as stream:
+        for user_input in commands:
+            stream.write(user_input.replace("\n", " ") + "\n")
+            stream.flush()
+
+            for line in stream:
+                if line.rstrip("\n") == END_OF_RESPONSE:
+                    break
+                print(line, end="")
+            else:
+                print("Сервер закрыл соединение.")
+                return
+
+            if user_input.strip().lower() == "exit":
+                return
@@ -1,42 +1,1112 @@
+import atexit
+import copy
+import csv
+import itertools
 import json
 import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
 
-from .constants import DATA_DIR, META_FILE
+from ..metrics import increment, phase, timed
+from . import columnar, compact, rowstore, segments
+from .constants import (
+    DATA_DIR,
+    DEFAULT_STORAGE,
+    FSYNC_INTERVAL_MS,
+    FSYNC_POLICY,
+    META_FILE,
+    SEGMENT_CACHE_BUDGET,
+    TABLE_CACHE_BUDGET,
+    TRANSACTION_FILE,
+    WAL_COMPACT_THRESHOLD,
+    WAL_ENABLED,
+)
+
+# Сколько байт журнала читать за раз при поиске конца последней записи
+LOG_TAIL_CHUNK = 4096
+
+# Защищает кэши и очереди модуля, когда команды выполняются в нескольких
+# потоках (режим сервера)
+state_lock = threading.RLock()
+# Открытые файлы журналов: имя таблицы -> файл
+_log_files = {}
+# Файлы, записанные после последнего fsync (политика "interval")
+_pending_sync = set()
+_last_sync_time = time.monotonic()
+# Таймер, который сбросит их, если новых записей не будет
+_sync_timer = None
+# Количество записей в журнале каждой таблицы
+_log_sizes = {}
+
+# LRU-кэш таблиц: имя таблицы -> (сигнатура, данные, вес)
+_table_cache = OrderedDict()
+_table_cache_weight = 0
+# Счетчик записей в каждую таблицу из этого процесса
+_generations = {}
+# Кэш метаданных: путь к файлу -> (сигнатура, данные)
+_metadata_cache = {}
+# Карты ID -> строка: имя таблицы -> (сигнатура, словарь)
+_row_maps = {}
+# Наибольшие ID таблиц: имя таблицы -> (сигнатура, ID)
+_max_ids = {}
+# Функции, которые вызываются после каждого изменения таблицы
+_change_listeners = []
+# Формат хранения каждой таблицы: имя таблицы -> имя формата
+_table_storage = {}
+# Манифесты сегментированных таблиц: имя таблицы -> (сигнатура, манифест)
+_manifests = {}
+# LRU-кэш прочитанных сегментов: путь -> (сигнатура, строки)
+_segment_cache = OrderedDict()
+_segment_cache_weight = 0
+# Открытая транзакция: None или словарь с копией метаданных на момент
+# BEGIN, данными измененных таблиц и накопленными записями изменений
+_transaction = None
+
+
+def _file_signature(filepath):
+    """Возвращает (mtime, размер) файла или None, если файла нет."""
+    try:
+        stat = os.stat(filepath)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _fsync_path(path):
+    """Сбрасывает на диск файл или каталог по пути."""
+    flags = os.O_RDONLY
+    if hasattr(os, "O_DIRECTORY") and os.path.isdir(path):
+        flags |= os.O_DIRECTORY
+    try:
+        fd = os.open(path, flags)
+    except (FileNotFoundError, PermissionError):
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        # Некоторые системы не поддерживают fsync каталогов
+        pass
+    finally:
+        os.close(fd)
+
+
+def sync_files():
+    """Сбрасывает на диск все файлы, записанные после прошлого fsync."""
+    global _last_sync_time, _sync_timer
+
+    with state_lock:
+        if _sync_timer is not None:
+            _sync_timer.cancel()
+            _sync_timer = None
+        directories = set()
+        for path in _pending_sync:
+            _fsync_path(path)
+            directories.add(os.path.dirname(path) or ".")
+        for directory in directories:
+            _fsync_path(directory)
+
+        _pending_sync.clear()
+        _last_sync_time = time.monotonic()
+
+
+def stop_sync_timer():
+    """Сбрасывает отложенные записи сразу и дожидается конца таймера fsync.
+
+    Вызывается перед fork: в дочернем процессе остается только вызвавший
+    поток, а живой поток таймера помешал бы запустить его через fork.
+    """
+    timer = _sync_timer
+    if timer is None:
+        return
+    sync_files()
+    if timer is not threading.current_thread():
+        timer.join()
+
+
+def _written(path):
+    """Применяет политику fsync к только что записанному файлу.
+
+    При политике "interval" файл сбрасывается не позже чем через
+    FSYNC_INTERVAL_MS: следующей записью или, если ее не будет, таймером.
+    """
+    global _sync_timer
+
+    if FSYNC_POLICY == "never":
+        return
+
+    with state_lock:
+        _pending_sync.add(path)
+        delay = FSYNC_INTERVAL_MS / 1000 - (time.monotonic() - _last_sync_time)
+        if FSYNC_POLICY == "always" or delay <= 0:
+            sync_files()
+        elif _sync_timer is None:
+            _sync_timer = threading.Timer(delay, sync_files)
+            _sync_timer.daemon = True
+            _sync_timer.start()
+
+
+def _temp_path(filepath):
+    """Путь к временному файлу рядом с целевым."""
+    root, extension = os.path.splitext(filepath)
+    return f"{root}.tmp{extension}"
+
+
+def atomic_save(filepath, save, data):
+    """Записывает файл через временный файл и переименование.
+
+    save(path, data) пишет данные во временный файл, который затем
+    атомарно заменяет целевой, поэтому сбой посреди записи оставляет
+    прежнюю версию файла целой.
+    """
+    temp_path = _temp_path(filepath)
+    try:
+        save(temp_path, data)
+        if FSYNC_POLICY == "always":
+            _fsync_path(temp_path)
+        os.replace(temp_path, filepath)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    _written(filepath)
+
+
+def _save_json(filepath, data):
+    """Записывает данные в JSON-файл."""
+    with open(filepath, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=4, ensure_ascii=False,
+                  default=compact.to_dict)
 
 
 def load_metadata(filepath=META_FILE):
-    """Загружает метаданные из JSON-файла."""
+    """Загружает метаданные из JSON-файла.
+
+    Прерванный COMMIT доводится до конца не здесь, а под исключительной
+    блокировкой базы (см. locking.command_lock).
+    """
+    signature = _file_signature(filepath)
+    cached = _metadata_cache.get(filepath)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
     try:
         with open(filepath, 'r', encoding='utf-8') as f:
             data = json.load(f)
-        return data
     except FileNotFoundError:
-        return {}
+        data = {}
+
+    increment("metadata.reads")
+    _metadata_cache[filepath] = (signature, data)
+    return data
 
 
 def save_metadata(data, filepath=META_FILE):
-    """Сохраняет метаданные в JSON-файл."""
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+    """Сохраняет метаданные в JSON-файл.
+
+    Внутри транзакции метаданные записываются только при COMMIT.
+    """
+    if _transaction is not None:
+        return
+    with state_lock, phase("serialize"):
+        atomic_save(filepath, _save_json, data)
+        _metadata_cache[filepath] = (_file_signature(filepath), data)
+
+
+def _load_json(filepath):
+    """Читает снимок таблицы в формате JSON."""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def read_import_file(filepath):
+    """Построчно читает записи из CSV (с заголовком) или JSONL файла.
+
+    Возвращает генератор словарей столбец -> значение.
+    """
+    if filepath.endswith(".csv"):
+        with open(filepath, 'r', encoding='utf-8', newline='') as f:
+            yield from csv.DictReader(f)
+    elif filepath.endswith(".jsonl"):
+        with open(filepath, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        raise ValueError(f'Неподдерживаемый формат файла: {filepath}. '
+                         f'Допустимые: .csv, .jsonl')
+
+
+# Форматы хранения снимков таблиц: имя -> (расширение, чтение, запись)
+STORAGE_BACKENDS = {
+    "json": (".json", _load_json, _save_json),
+    "columnar": (".col", columnar.read_table, columnar.write_table),
+    "records": (".rec", rowstore.read_table, rowstore.write_table),
+    # Каталог сегментов: пишется по сегментам, см. _write_segments
+    "segmented": (".seg", segments.read_table, None),
+}
+
+# Форматы, которые сами дописывают изменения и читают строки по ID
+RANDOM_ACCESS_STORAGES = {"records"}
+
+
+def get_table_storage(table_name):
+    """Возвращает формат хранения таблицы по файлу ее снимка."""
+    storage = _table_storage.get(table_name)
+    if storage is None:
+        storage = DEFAULT_STORAGE
+        for name, (extension, _, _) in STORAGE_BACKENDS.items():
+            if os.path.exists(f"{DATA_DIR}{table_name}{extension}"):
+                storage = name
+                break
+        _table_storage[table_name] = storage
+    return storage
+
+
+def _table_path(table_name, storage=None):
+    """Путь к файлу снимка таблицы."""
+    extension = STORAGE_BACKENDS[storage or get_table_storage(table_name)][0]
+    return f"{DATA_DIR}{table_name}{extension}"
+
+
+def _snapshot_file(table_name):
+    """Файл, который меняется при каждой записи снимка таблицы.
+
+    У сегментированной таблицы это манифест: он пишется последним.
+    """
+    storage = get_table_storage(table_name)
+    filepath = _table_path(table_name, storage)
+    if storage == "segmented":
+        return segments.manifest_path(filepath)
+    return filepath
+
+
+def _log_path(table_name):
+    """Путь к файлу журнала таблицы."""
+    return f"{DATA_DIR}{table_name}.log"
+
+
+def _read_log(table_name):
+    """Читает записи журнала таблицы (None, если журнала нет).
+
+    Оборванная последняя строка (сбой посреди записи) пропускается.
+    Испорченная строка в середине журнала - ошибка: записи после нее
+    нельзя молча потерять.
+    """
+    filepath = _log_path(table_name)
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            lines = f.read().split("\n")
+    except FileNotFoundError:
+        return None
+
+    records = []
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError:
+            if number == len(lines) or not any(
+                    rest.strip() for rest in lines[number:]):
+                break
+            raise ValueError(f"Журнал {filepath} поврежден "
+                             f"в строке {number}.") from None
+    return records
+
+
+def _trim_torn_tail(filepath):
+    """Обрезает журнал до последней записи, завершенной переводом строки.
+
+    Без этого новая запись после сбоя дописалась бы в одну строку с
+    оборванной и была бы потеряна при чтении журнала.
+    """
+    try:
+        f = open(filepath, 'rb+')
+    except FileNotFoundError:
+        return
+    with f:
+        size = f.seek(0, os.SEEK_END)
+        end = size
+        while end > 0:
+            start = max(0, end - LOG_TAIL_CHUNK)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b"\n")
+            if newline != -1:
+                end = start + newline + 1
+                break
+            end = start
+        if end != size:
+            f.truncate(end)
+
+
+def _replay_log(table_name, table_data):
+    """Применяет записи журнала к снимку таблицы.
+
+    Каждая запись задает итоговое состояние строки, поэтому повторное
+    применение журнала к уже сжатому снимку ничего не ломает.
+    """
+    records = _read_log(table_name)
+    if records is None:
+        _log_sizes[table_name] = 0
+        return table_data
+
+    rows = dict(zip(compact.row_ids(table_data), table_data))
+    apply_records(rows, records)
+    _log_sizes[table_name] = len(records)
+    return list(rows.values())
+
+
+def log_changes(table_name):
+    """Изменения из журнала поверх снимка таблицы.
+
+    Возвращает (очищалась ли таблица, словарь ID -> итоговая строка или
+    None для удаленной). Если таблица очищалась, строки снимка не нужны.
+    """
+    rows = {}
+    cleared = False
+    for record in _read_log(table_name) or ():
+        op = record["op"]
+        if op in ("insert", "update"):
+            rows[record["row"]["ID"]] = record["row"]
+        elif op == "delete":
+            rows[record["id"]] = None
+        elif op == "clear":
+            rows.clear()
+            cleared = True
+    return cleared, rows
+
+
+def apply_records(rows, records):
+    """Применяет записи об изменениях к словарю ID -> строка."""
+    for record in records:
+        op = record["op"]
+        if op in ("insert", "update"):
+            row = record["row"]
+            rows[row["ID"]] = row
+        elif op == "delete":
+            rows.pop(record["id"], None)
+        elif op == "clear":
+            rows.clear()
+
+
+def table_signature(table_name):
+    """Сигнатура состояния таблицы для проверки актуальности кэша."""
+    return (_generations.get(table_name, 0),
+            _file_signature(_snapshot_file(table_name)),
+            _file_signature(_log_path(table_name)))
+
+
+def table_state(table_name):
+    """Сигнатура файлов таблицы в виде, пригодном для записи в JSON."""
+    return [list(sig) if sig is not None else None
+            for sig in table_signature(table_name)[1:]]
+
+
+def get_segment_manifest(table_name):
+    """Манифест сегментированной таблицы или None для других форматов."""
+    if get_table_storage(table_name) != "segmented":
+        return None
+    filepath = _snapshot_file(table_name)
+    signature = _file_signature(filepath)
+    if signature is None:
+        return None
+
+    cached = _manifests.get(table_name)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    manifest = segments.read_manifest(os.path.dirname(filepath))
+    _manifests[table_name] = (signature, manifest)
+    return manifest
+
+
+def get_segment_files(table_name):
+    """Схема разбиения и файлы сегментов таблицы или None.
+
+    Файлы - список (номер, путь, статистика) по возрастанию номеров. None
+    означает, что таблица не сегментирована или уже загружена в память
+    и читать сегменты по отдельности незачем.
+    """
+    manifest = get_segment_manifest(table_name)
+    if manifest is None or peek_table_data(table_name) is not None:
+        return None
+    return manifest["scheme"], segments.segment_files(
+        _table_path(table_name, "segmented"), manifest)
+
+
+def load_segment(filepath, columns=None):
+    """Читает строки сегмента, по возможности из кэша сегментов.
+
+    columns - кортеж нужных столбцов (None - все). Строки из кэша общие
+    для всех вызовов, поэтому изменять их нельзя.
+    """
+    global _segment_cache_weight
+
+    key = (filepath, columns)
+    signature = _file_signature(filepath)
+    with state_lock:
+        cached = _segment_cache.get(key)
+        if cached is not None and cached[0] == signature:
+            _segment_cache.move_to_end(key)
+            return cached[1]
+
+    rows = segments.read_segment(filepath, columns)
+    with state_lock:
+        old = _segment_cache.pop(key, None)
+        if old is not None:
+            _segment_cache_weight -= old[0][1]
+        if signature is not None and signature[1] <= SEGMENT_CACHE_BUDGET:
+            _segment_cache[key] = (signature, rows)
+            _segment_cache_weight += signature[1]
+            while _segment_cache_weight > SEGMENT_CACHE_BUDGET:
+                _, (evicted, _) = _segment_cache.popitem(last=False)
+                _segment_cache_weight -= evicted[1]
+    return rows
+
+
+def _fetch_segment_rows(table_name, ids):
+    """Читает строки с указанными ID только из нужных сегментов."""
+    wanted = set(ids)
+    cleared, changes = log_changes(table_name)
+    found = {row_id: row for row_id, row in changes.items()
+             if row_id in wanted}
+
+    files = [] if cleared else get_segment_files(table_name)[1]
+    low, high = min(wanted, default=0), max(wanted, default=0)
+    for _, path, stats in files:
+        if stats["max"]["ID"] < low or stats["min"]["ID"] > high:
+            continue
+        if not any(stats["min"]["ID"] <= row_id <= stats["max"]["ID"]
+                   for row_id in wanted):
+            continue
+        for row in load_segment(path):
+            if row["ID"] in wanted and row["ID"] not in changes:
+                # Копия: найденные строки изменяют на месте
+                found[row["ID"]] = dict(row)
+    return [found[row_id] for row_id in ids
+            if found.get(row_id) is not None]
+
+
+def _cache_table(table_name, data):
+    """Кладет данные таблицы в кэш, вытесняя давно не используемые."""
+    global _table_cache_weight
+
+    signature = table_signature(table_name)
+    # Вес записи оцениваем по размеру файлов таблицы на диске
+    weight = sum(sig[1] for sig in signature[1:] if sig is not None)
+    manifest = get_segment_manifest(table_name)
+    if manifest is not None:
+        weight += sum(stats["bytes"] for stats in manifest["segments"].values())
+
+    with state_lock:
+        old = _table_cache.pop(table_name, None)
+        if old is not None:
+            _table_cache_weight -= old[2]
+
+        if weight > TABLE_CACHE_BUDGET:
+            return
+
+        _table_cache[table_name] = (signature, data, weight)
+        _table_cache_weight += weight
+
+        while _table_cache_weight > TABLE_CACHE_BUDGET:
+            _, (_, _, evicted_weight) = _table_cache.popitem(last=False)
+            _table_cache_weight -= evicted_weight
+
+
+def invalidate_table_cache(table_name=None):
+    """Сбрасывает кэш одной таблицы или всех таблиц."""
+    global _table_cache_weight
+
+    with state_lock:
+        if table_name is None:
+            _table_cache.clear()
+            _table_cache_weight = 0
+            _row_maps.clear()
+            return
+
+        old = _table_cache.pop(table_name, None)
+        if old is not None:
+            _table_cache_weight -= old[2]
+    _generations[table_name] = _generations.get(table_name, 0) + 1
+    _notify_change(table_name, None, None)
+
+
+def register_change_listener(listener):
+    """Регистрирует функцию, вызываемую после изменения таблицы.
+
+    listener(table_name, records, old_signature, new_signature) получает
+    записи об изменениях (None - данные изменились целиком) и сигнатуры
+    таблицы до и после записи.
+    """
+    _change_listeners.append(listener)
+
+
+def _notify_change(table_name, records, old_signature):
+    """Сообщает о записи в таблицу карте ID и подписчикам."""
+    new_signature = table_signature(table_name)
+
+    cached = _row_maps.get(table_name)
+    if cached is not None:
+        if records is not None and cached[0] == old_signature:
+            apply_records(cached[1], records)
+            _row_maps[table_name] = (new_signature, cached[1])
+        else:
+            del _row_maps[table_name]
+
+    cached = _max_ids.get(table_name)
+    if cached is not None:
+        if records is not None and cached[0] == old_signature:
+            inserted = [record["row"]["ID"] for record in records
+                        if record["op"] == "insert"]
+            _max_ids[table_name] = (new_signature, max([cached[1], *inserted]))
+        else:
+            del _max_ids[table_name]
+
+    for listener in _change_listeners:
+        listener(table_name, records, old_signature, new_signature)
+
+
+def peek_table_data(table_name):
+    """Возвращает данные таблицы из кэша, не читая файлы (или None)."""
+    if _transaction is not None and table_name in _transaction["tables"]:
+        return _transaction["tables"][table_name]
+    cached = _table_cache.get(table_name)
+    if cached is not None and cached[0] == table_signature(table_name):
+        return cached[1]
+    return None
+
+
+def get_rows_by_id(table_name, ids):
+    """Возвращает строки с указанными ID (несуществующие пропускаются).
+
+    Если таблица еще не загружена и хранится в формате с доступом по ID,
+    читаются только нужные записи файла, а если она сегментирована -
+    только сегменты, в диапазон ID которых попадают искомые.
+    """
+    cached = _row_maps.get(table_name)
+    if cached is None or cached[0] != table_signature(table_name):
+        storage = get_table_storage(table_name)
+        if (storage in RANDOM_ACCESS_STORAGES
+                and peek_table_data(table_name) is None):
+            with phase("load"):
+                rows = rowstore.fetch_rows(_table_path(table_name, storage), ids)
+            increment("rows.loaded", len(rows))
+            return rows
+        if get_segment_files(table_name) is not None:
+            with phase("load"):
+                rows = _fetch_segment_rows(table_name, ids)
+            increment("rows.loaded", len(rows))
+            return rows
+
+    row_map = get_row_map(table_name)
+    return [row_map[row_id] for row_id in ids if row_id in row_map]
+
+
+def count_table_rows(table_name):
+    """Возвращает количество строк таблицы, по возможности не читая ее."""
+    table_data = peek_table_data(table_name)
+    if table_data is not None:
+        return len(table_data)
+
+    storage = get_table_storage(table_name)
+    if storage in RANDOM_ACCESS_STORAGES:
+        return rowstore.count_rows(_table_path(table_name, storage))
+    manifest = get_segment_manifest(table_name)
+    if manifest is not None and _file_signature(_log_path(table_name)) is None:
+        return sum(stats["rows"] for stats in manifest["segments"].values())
+    return len(load_table_data(table_name))
+
+
+def get_row_map(table_name):
+    """Возвращает словарь ID -> строка для таблицы.
+
+    Словарь строится один раз и дальше поддерживается по записям об
+    изменениях, поэтому поиск строки по ID не требует просмотра таблицы.
+    """
+    signature = table_signature(table_name)
+    cached = _row_maps.get(table_name)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    table_data = load_table_data(table_name)
+    row_map = dict(zip(compact.row_ids(table_data), table_data))
+    _row_maps[table_name] = (signature, row_map)
+    return row_map
+
+
+def max_row_id(table_name):
+    """Наибольший ID, записанный в таблицу мимо снимка (0 - таких нет).
+
+    Таблица не загружается: ID берутся из индекса файла записей, из
+    статистики сегментов и из вставок журнала. ID строк снимка JSON и
+    колоночного формата сюда не входят - их учитывает счетчик next_id,
+    а вот вставки журнала могли не дойти до метаданных из-за сбоя.
+    Удаленные строки могут оставаться в оценке - их ID все равно не
+    используются повторно.
+    """
+    signature = table_signature(table_name)
+    cached = _max_ids.get(table_name)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    storage = get_table_storage(table_name)
+    if storage in RANDOM_ACCESS_STORAGES:
+        high = rowstore.last_id(_table_path(table_name, storage))
+    else:
+        ids = [record["row"]["ID"] for record in _read_log(table_name) or ()
+               if record["op"] == "insert"]
+        manifest = get_segment_manifest(table_name)
+        if manifest is not None:
+            ids += [stats["max"]["ID"]
+                    for stats in manifest["segments"].values()]
+        high = max(ids, default=0)
+    _max_ids[table_name] = (signature, high)
+    return high
+
+
+def load_table_columns(table_name, columns):
+    """Загружает строки таблицы только с нужными столбцами.
+
+    Колоночный формат читает с диска лишь блоки столбцов columns, и
+    такие неполные строки в кэш таблиц не попадают. Если таблица уже в
+    памяти или хранится построчно, возвращаются полные строки.
+    """
+    storage = get_table_storage(table_name)
+    if storage != "columnar" or peek_table_data(table_name) is not None:
+        return load_table_data(table_name)
+
+    with phase("load"):
+        try:
+            data = columnar.read_table(_table_path(table_name, storage),
+                                       columns)
+        except FileNotFoundError:
+            data = []
+        # Строки из журнала полные - лишние столбцы отбросит проекция
+        data = _replay_log(table_name, data)
+    increment("rows.loaded", len(data))
+    return data
 
 
 def load_table_data(table_name):
-    """Загружает данные таблицы из файла."""
+    """Загружает данные таблицы из файла.
+
+    Внутри транзакции измененные таблицы берутся из ее данных.
+    """
+    if _transaction is not None and table_name in _transaction["tables"]:
+        return _transaction["tables"][table_name]
+    with state_lock:
+        cached = _table_cache.get(table_name)
+        if cached is not None and cached[0] == table_signature(table_name):
+            _table_cache.move_to_end(table_name)
+            return cached[1]
+
     # Создаем директорию data, если её нет
     os.makedirs(DATA_DIR, exist_ok=True)
-    filepath = f"{DATA_DIR}{table_name}.json"
+    storage = get_table_storage(table_name)
+    load = STORAGE_BACKENDS[storage][1]
+
+    with phase("load"):
+        try:
+            data = load(_table_path(table_name, storage))
+        except FileNotFoundError:
+            data = []
+
+        data = _replay_log(table_name, data)
+        # В памяти строки хранятся компактно, имена столбцов - в классе
+        data = compact.compact_rows(data)
+    increment("rows.loaded", len(data))
+    _cache_table(table_name, data)
+    return data
+
+
+def _touched_ids(table_name, records):
+    """ID строк, вставленных или измененных после прошлого снимка.
+
+    Берутся из records и из журнала таблицы; None - изменения неизвестны.
+    """
+    if records is None:
+        return None
+    touched = set()
+    for record in itertools.chain(records, _read_log(table_name) or ()):
+        if record["op"] in ("insert", "update"):
+            touched.add(record["row"]["ID"])
+    return touched
+
+
+def _write_segments(table_name, data, touched, scheme=None):
+    """Записывает сегменты таблицы, изменившиеся после прошлого снимка.
+
+    Новые версии сегментов пишутся в новые файлы, затем манифест
+    переключается на них, и только после этого старые файлы удаляются.
+    """
+    dirpath = _table_path(table_name, "segmented")
+    os.makedirs(dirpath, exist_ok=True)
+    manifest, writes = segments.plan_write(dirpath, data, scheme, touched)
+    for number, rows in writes.items():
+        stats = manifest["segments"][str(number)]
+        filepath = os.path.join(dirpath, stats["file"])
+        atomic_save(filepath, segments.write_segment, rows)
+        stats["bytes"] = os.path.getsize(filepath)
+    atomic_save(segments.manifest_path(dirpath), segments.write_manifest,
+                manifest)
+    increment("segments.written", len(writes))
+
+    for filepath in segments.unused_files(dirpath, manifest):
+        try:
+            os.remove(filepath)
+        except FileNotFoundError:
+            pass
+
+
+@timed("serialize")
+def _write_snapshot(table_name, data, records=None, scheme=None):
+    """Записывает полный снимок таблицы и удаляет ее журнал.
+
+    Сегментированная таблица переписывает только сегменты, затронутые
+    records и журналом (records=None - все сегменты).
+    """
+    os.makedirs(DATA_DIR, exist_ok=True)
+    storage = get_table_storage(table_name)
+    save = STORAGE_BACKENDS[storage][2]
+    filepath = _table_path(table_name, storage)
+    if storage == "segmented":
+        _write_segments(table_name, data, _touched_ids(table_name, records),
+                        scheme)
+    elif storage in RANDOM_ACCESS_STORAGES:
+        # Индекс пишется рядом с временным файлом и переносится следом;
+        # если сбой случится между переименованиями, индекс перестроится
+        atomic_save(filepath, save, data)
+        index_path = rowstore.index_path(filepath)
+        os.replace(rowstore.index_path(_temp_path(filepath)), index_path)
+        _written(index_path)
+    else:
+        atomic_save(filepath, save, data)
+
+    # Снимок уже содержит все изменения из журнала
+    remove_table_log(table_name)
+    _generations[table_name] = _generations.get(table_name, 0) + 1
+    _cache_table(table_name, data)
+
+
+def save_table_data(table_name, data, records=None):
+    """Сохраняет данные таблицы в файл.
 
+    records - записи об изменениях относительно прошлого состояния, по
+    ним обновляются производные структуры (карта ID, индексы). Без них
+    эти структуры будут построены заново при следующем обращении.
+    """
+    if _transaction is not None:
+        _buffer_changes(table_name, data, records)
+        return
+
+    old_signature = table_signature(table_name)
+    _write_snapshot(table_name, data, records)
+    _notify_change(table_name, records, old_signature)
+
+
+def _same_file(f, filepath):
+    """Проверяет, что открытый файл по-прежнему лежит по пути filepath."""
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        return data
+        return os.path.samestat(os.fstat(f.fileno()), os.stat(filepath))
     except FileNotFoundError:
-        return []
+        return False
 
 
-def save_table_data(table_name, data):
-    """Сохраняет данные таблицы в файл."""
-    os.makedirs(DATA_DIR, exist_ok=True)
-    filepath = f"{DATA_DIR}{table_name}.json"
+@timed("serialize")
+def append_table_log(table_name, records):
+    """Дописывает записи об изменениях в журнал таблицы.
+
+    fsync выполняется согласно FSYNC_POLICY.
+    """
+    if not records:
+        return
+
+    f = _log_files.get(table_name)
+    if f is not None and not _same_file(f, _log_path(table_name)):
+        # Журнал сжал или удалил другой процесс - пишем в новый файл
+        f.close()
+        f = None
+    if f is None:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        _trim_torn_tail(_log_path(table_name))
+        f = open(_log_path(table_name), 'a', encoding='utf-8')
+        _log_files[table_name] = f
+
+    for record in records:
+        f.write(json.dumps(record, ensure_ascii=False,
+                           default=compact.to_dict) + "\n")
+    f.flush()
+    _written(_log_path(table_name))
+
+    _log_sizes[table_name] = _log_sizes.get(table_name, 0) + len(records)
+
+
+def write_table_changes(table_name, table_data, records):
+    """Сохраняет изменения таблицы в журнал или полным снимком.
+
+    table_data - данные таблицы уже с изменениями или None, если таблица
+    не загружена. Форматы с доступом по ID получают изменения напрямую.
+    Когда журнал становится длиннее WAL_COMPACT_THRESHOLD записей,
+    таблица сжимается в снимок. Внутри транзакции изменения только
+    накапливаются в памяти.
+    """
+    if _transaction is not None:
+        if table_data is None:
+            rows = {row["ID"]: row for row in load_table_data(table_name)}
+            apply_records(rows, records)
+            table_data = list(rows.values())
+        _buffer_changes(table_name, table_data, records)
+        return
+
+    old_signature = table_signature(table_name)
+    storage = get_table_storage(table_name)
+
+    if storage in RANDOM_ACCESS_STORAGES:
+        filepath = _table_path(table_name, storage)
+        rowstore.append_records(filepath, records)
+        _written(filepath)
+        _written(rowstore.index_path(filepath))
+        _updated_in_place(table_name, table_data)
+    elif not WAL_ENABLED:
+        if table_data is None:
+            rows = {row["ID"]: row for row in load_table_data(table_name)}
+            apply_records(rows, records)
+            table_data = list(rows.values())
+        _write_snapshot(table_name, table_data, records)
+    else:
+        append_table_log(table_name, records)
+        if _log_sizes[table_name] >= WAL_COMPACT_THRESHOLD:
+            if table_data is None:
+                # Журнал уже содержит новые записи
+                table_data = load_table_data(table_name)
+            _write_snapshot(table_name, table_data, records)
+        else:
+            _updated_in_place(table_name, table_data)
+
+    _notify_change(table_name, records, old_signature)
+
+
+def _updated_in_place(table_name, table_data):
+    """Отмечает запись в файлы таблицы без полного снимка."""
+    _generations[table_name] = _generations.get(table_name, 0) + 1
+    if table_data is not None:
+        _cache_table(table_name, table_data)
+
+
+def remove_table_log(table_name):
+    """Закрывает и удаляет журнал таблицы."""
+    f = _log_files.pop(table_name, None)
+    if f is not None:
+        f.close()
+    _log_sizes[table_name] = 0
+
+    try:
+        os.remove(_log_path(table_name))
+    except FileNotFoundError:
+        pass
+
+
+def _remove_snapshot(table_name, storage):
+    """Удаляет файл снимка таблицы в указанном формате."""
+    filepath = _table_path(table_name, storage)
+    if storage == "segmented":
+        shutil.rmtree(filepath, ignore_errors=True)
+        _manifests.pop(table_name, None)
+        return
+    if storage in RANDOM_ACCESS_STORAGES:
+        rowstore.remove_index(filepath)
+    try:
+        os.remove(filepath)
+    except FileNotFoundError:
+        pass
+
+
+def remove_table_data(table_name):
+    """Удаляет файлы данных таблицы во всех форматах и ее журнал."""
+    for storage in STORAGE_BACKENDS:
+        _remove_snapshot(table_name, storage)
+    _table_storage.pop(table_name, None)
+    remove_table_log(table_name)
+
+
+def convert_table_storage(table_name, storage, scheme=None):
+    """Переводит таблицу в другой формат хранения.
+
+    scheme - схема разбиения сегментированной таблицы (см.
+    segments.make_scheme); с ней таблица переразбивается, даже если уже
+    хранится по сегментам.
+    """
+    if storage not in STORAGE_BACKENDS:
+        raise ValueError(f'Неизвестный формат хранения: {storage}. '
+                         f'Допустимые: {", ".join(STORAGE_BACKENDS)}')
+
+    old_storage = get_table_storage(table_name)
+    table_data = load_table_data(table_name)
+    if storage == old_storage and scheme is None:
+        return table_data
+
+    old_signature = table_signature(table_name)
+    _table_storage[table_name] = storage
+    try:
+        _write_snapshot(table_name, table_data, scheme=scheme)
+    except Exception:
+        _table_storage[table_name] = old_storage
+        raise
+
+    if storage != old_storage:
+        _remove_snapshot(table_name, old_storage)
+
+    # Содержимое таблицы не меняется, меняется только ее сигнатура
+    _notify_change(table_name, [], old_signature)
+    return table_data
+
+
+def compact_table_log(table_name):
+    """Сжимает журнал таблицы в файл снимка."""
+    table_data = load_table_data(table_name)
+    # Содержимое таблицы не меняется, меняется только ее сигнатура
+    save_table_data(table_name, table_data, records=[])
+    return table_data
+
+
+def in_transaction():
+    """Проверяет, открыта ли транзакция."""
+    return _transaction is not None
+
+
+def begin_transaction(metadata):
+    """Открывает транзакцию: дальнейшие изменения копятся в памяти."""
+    global _transaction
+
+    if _transaction is not None:
+        raise ValueError("Транзакция уже открыта.")
+    _transaction = {"metadata": copy.deepcopy(metadata), "tables": {},
+                    "records": {}}
+
+
+def _buffer_changes(table_name, table_data, records):
+    """Запоминает изменения таблицы в открытой транзакции.
+
+    records=None означает, что при COMMIT таблица пишется снимком.
+    """
+    old_signature = table_signature(table_name)
+    _transaction["tables"][table_name] = table_data
+
+    pending = _transaction["records"]
+    if records is None:
+        pending[table_name] = None
+    elif pending.setdefault(table_name, []) is not None:
+        pending[table_name].extend(records)
+
+    _generations[table_name] = _generations.get(table_name, 0) + 1
+    _notify_change(table_name, records, old_signature)
+
+
+def _save_journal(filepath, data):
+    """Записывает журнал транзакции в компактный JSON."""
     with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+        json.dump(data, f, ensure_ascii=False, default=compact.to_dict)
+
+
+def _apply_journal(journal, tables=None):
+    """Записывает изменения транзакции в таблицы и метаданные.
+
+    Записи журнала задают итоговое состояние строк, поэтому повторное
+    применение после сбоя дает тот же результат.
+    """
+    tables = tables or {}
+    for table_name, change in journal["tables"].items():
+        if "rows" in change:
+            save_table_data(table_name, change["rows"])
+        else:
+            write_table_changes(table_name, tables.get(table_name),
+                                change["records"])
+
+    save_metadata(journal["metadata"])
+    sync_files()
+    try:
+        os.remove(TRANSACTION_FILE)
+    except FileNotFoundError:
+        pass
+    _fsync_path(os.path.dirname(os.path.abspath(TRANSACTION_FILE)))
+
+
+def commit_transaction(metadata):
+    """Фиксирует транзакцию, записывая каждую измененную таблицу один раз.
+
+    Сначала на диск (с fsync) пишется журнал со всеми изменениями и
+    метаданными - он и есть точка фиксации. Если запись таблиц прервется,
+    при следующем запуске транзакция будет доведена по журналу.
+    Возвращает имена измененных таблиц.
+    """
+    global _transaction
+
+    if _transaction is None:
+        raise ValueError("Нет открытой транзакции.")
+    transaction = _transaction
+
+    changes = {}
+    for table_name, records in transaction["records"].items():
+        if records is None:
+            changes[table_name] = {"rows": transaction["tables"][table_name]}
+        else:
+            changes[table_name] = {"records": records}
+
+    journal = {"metadata": metadata, "tables": changes}
+    atomic_save(TRANSACTION_FILE, _save_journal, journal)
+    _fsync_path(TRANSACTION_FILE)
+    _fsync_path(os.path.dirname(os.path.abspath(TRANSACTION_FILE)))
+
+    _transaction = None
+    _apply_journal(journal, transaction["tables"])
+    return list(changes)
+
+
+def rollback_transaction():
+    """Отменяет транзакцию и возвращает метаданные на момент BEGIN."""
+    global _transaction
+
+    if _transaction is None:
+        raise ValueError("Нет открытой транзакции.")
+    transaction = _transaction
+    _transaction = None
+
+    # Строки в кэше могли измениться на месте - читаем таблицы заново
+    for table_name in transaction["tables"]:
+        invalidate_table_cache(table_name)
+
+    # Кэшированные метаданные тоже менялись на месте
+    metadata = transaction["metadata"]
+    _metadata_cache[META_FILE] = (_file_signature(META_FILE), metadata)
+    return metadata
+
+
+def transaction_interrupted():
+    """Проверяет, остался ли журнал прерванного COMMIT."""
+    return os.path.exists(TRANSACTION_FILE)
+
+
+def recover_transaction():
+    """Доводит до конца транзакцию, COMMIT которой был прерван.
+
+    Вызывается только под исключительной блокировкой базы: иначе другой
+    процесс может в это время сам выполнять COMMIT по тому же журналу.
+    Возвращает True, если транзакция была восстановлена.
+    """
+    try:
+        with open(TRANSACTION_FILE, 'r', encoding='utf-8') as f:
+            journal = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        # Журнал, записанный не полностью, не переименовывается в
+        # TRANSACTION_FILE, поэтому транзакции будто и не было
+        return False
+
+    _apply_journal(journal)
+    return True
+
+
+atexit.register(sync_files)
@@ -0,0 +1,310 @@
+import bisect
+import operator
+
+from .compact import column_getter
+from .constants import SCAN_MODE, VECTORIZE_MIN_ROWS
+from .utils import table_signature
+
+# auto - NumPy для больших таблиц, если он установлен; numpy - всегда,
+# python - только построчная проверка
+SCAN_MODES = ("auto", "numpy", "python")
+
+COMPARE = {"=": operator.eq, "!=": operator.ne, "<": operator.lt,
+           "<=": operator.le, ">": operator.gt, ">=": operator.ge}
+
+INT64_MIN = -(1 << 63)
+INT64_MAX = (1 << 63) - 1
+
+_mode = SCAN_MODE
+
+# NumPy - необязательная зависимость. Импортируется при первой проверке
+# available(): на его импорт уходит заметная часть времени запуска
+np = None
+_numpy_checked = False
+
+# Столбцы таблиц в виде массивов:
+# таблица -> (сигнатура, данные таблицы, {столбец: массивы столбца})
+_columns = {}
+
+
+def available():
+    """Проверяет, установлен ли NumPy (при первом вызове импортирует его)."""
+    global np, _numpy_checked
+
+    if not _numpy_checked:
+        _numpy_checked = True
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+    return np is not None
+
+
+def get_mode():
+    """Возвращает текущий режим просмотра таблиц."""
+    return _mode
+
+
+def set_mode(mode):
+    """Устанавливает режим просмотра таблиц."""
+    global _mode
+
+    if mode not in SCAN_MODES:
+        raise ValueError(f'Некорректный режим: {mode}. '
+                         f'Допустимые: {", ".join(SCAN_MODES)}')
+    if mode == "numpy" and not available():
+        raise ValueError("NumPy не установлен, доступен только режим python.")
+    _mode = mode
+
+
+def _usable(table_data):
+    """Проверяет, стоит ли обрабатывать таблицу массивами NumPy."""
+    if _mode == "python":
+        return False
+    if _mode != "numpy" and len(table_data) < VECTORIZE_MIN_ROWS:
+        return False
+    return available()
+
+
+def _encode_column(values, col_type):
+    """Переводит значения столбца в массивы NumPy.
+
+    Строки кодируются номерами в упорядоченном словаре, поэтому
+    сравнения строк сводятся к сравнениям кодов.
+    """
+    if col_type == "str":
+        dictionary, codes = np.unique(np.array(values, dtype=object),
+                                      return_inverse=True)
+        return {"type": "str", "codes": codes.reshape(-1),
+                "dictionary": dictionary.tolist()}
+
+    try:
+        array = np.array(values, dtype=bool if col_type == "bool" else np.int64)
+    except OverflowError:
+        # Число не помещается в int64 - столбец проверяется построчно
+        return None
+    return {"type": col_type, "values": array}
+
+
+def _table_columns(table_name, table_data):
+    """Возвращает кэш массивов столбцов для текущих данных таблицы."""
+    signature = table_signature(table_name)
+    cached = _columns.get(table_name)
+    if cached is None or cached[0] != signature or cached[1] is not table_data:
+        cached = _columns[table_name] = (signature, table_data, {})
+    return cached[2]
+
+
+def _column(columns, table_data, col, col_type):
+    """Возвращает массивы столбца, кодируя его при первом обращении."""
+    if col not in columns:
+        value = column_getter(table_data, col)
+        columns[col] = _encode_column([value(row) for row in table_data],
+                                      col_type)
+    return columns[col]
+
+
+def _compare_codes(column, op, value):
+    """Сравнивает строковый столбец со значением по кодам словаря."""
+    codes = column["codes"]
+    left = bisect.bisect_left(column["dictionary"], value)
+    right = bisect.bisect_right(column["dictionary"], value)
+
+    if op in ("=", "!="):
+        found = codes == left if left < right else np.zeros(len(codes), bool)
+        return found if op == "=" else ~found
+    if op == "<":
+        return codes < left
+    if op == "<=":
+        return codes < right
+    if op == ">":
+        return codes >= right
+    return codes >= left
+
+
+def _in_mask(column, values):
+    """Маска строк, значение столбца которых входит в values."""
+    if column["type"] == "str":
+        dictionary = column["dictionary"]
+        codes = [bisect.bisect_left(dictionary, val) for val in values]
+        codes = [code for code, val in zip(codes, values)
+                 if code < len(dictionary) and dictionary[code] == val]
+        return np.isin(column["codes"], codes)
+
+    if column["type"] == "int":
+        values = [val for val in values if INT64_MIN <= val <= INT64_MAX]
+    return np.isin(column["values"], values)
+
+
+def _mask(where, get_column):
+    """Вычисляет типизированное условие WHERE как булеву маску.
+
+    Возвращает None, если какой-то столбец нельзя обработать массивом.
+    """
+    kind = where[0]
+    if kind in ("and", "or"):
+        masks = [_mask(node, get_column) for node in where[1]]
+        if any(mask is None for mask in masks):
+            return None
+        combine = np.logical_and if kind == "and" else np.logical_or
+        return combine.reduce(masks)
+
+    column = get_column(where[1])
+    if column is None:
+        return None
+    if kind == "in":
+        return _in_mask(column, where[2])
+
+    op, value = where[2], where[3]
+    if column["type"] == "str":
+        return _compare_codes(column, op, value)
+    if column["type"] == "int" and not INT64_MIN <= value <= INT64_MAX:
+        return None
+    return COMPARE[op](column["values"], value)
+
+
+def _getter(table_name, table_data, column_types):
+    """Возвращает функцию столбец -> массивы столбца."""
+    columns = _table_columns(table_name, table_data)
+    return lambda col: _column(columns, table_data, col, column_types[col])
+
+
+def filter_rows(table_name, table_data, where, column_types):
+    """Отбирает строки по условию с помощью булевых масок.
+
+    where - типизированное дерево условия из core. Возвращает список
+    строк или None, если условие нужно проверять построчно.
+    """
+    if not _usable(table_data):
+        return None
+
+    mask = _mask(where, _getter(table_name, table_data, column_types))
+    if mask is None:
+        return None
+    return [table_data[i] for i in np.flatnonzero(mask).tolist()]
+
+
+def _group_ids(keys):
+    """Нумерует группы в порядке первого появления.
+
+    keys - список массивов кодов столбцов группировки. Возвращает номера
+    групп строк и позиции первых строк групп, либо None, если составной
+    ключ не помещается в int64.
+    """
+    combined = np.zeros(len(keys[0]), np.int64)
+    capacity = 1
+    for key in keys:
+        uniques, inverse = np.unique(key, return_inverse=True)
+        capacity *= max(len(uniques), 1)
+        if capacity > INT64_MAX:
+            return None
+        combined = combined * len(uniques) + inverse.reshape(-1)
+
+    _, first, inverse = np.unique(combined, return_index=True,
+                                  return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return rank[inverse.reshape(-1)], first[order]
+
+
+def _aggregate_column(func, column, group_ids, groups_count, counts):
+    """Вычисляет агрегатную функцию по группам, None - нужен построчный путь."""
+    if column["type"] == "str":
+        values = column["codes"]
+    else:
+        values = column["values"].astype(np.int64)
+
+    if func in ("sum", "avg"):
+        # Сумма в int64 не должна переполниться
+        bound = int(np.abs(values).max()) if len(values) else 0
+        if bound * len(values) > INT64_MAX:
+            return None
+        sums = np.zeros(groups_count, np.int64)
+        np.add.at(sums, group_ids, values)
+        if func == "sum":
+            return sums.tolist()
+        return [total / count for total, count in zip(sums.tolist(), counts)]
+
+    if func == "min":
+        result = np.full(groups_count, INT64_MAX, np.int64)
+        np.minimum.at(result, group_ids, values)
+    else:
+        result = np.full(groups_count, INT64_MIN, np.int64)
+        np.maximum.at(result, group_ids, values)
+
+    if column["type"] == "str":
+        return [column["dictionary"][code] for code in result.tolist()]
+    if column["type"] == "bool":
+        return [bool(value) for value in result.tolist()]
+    return result.tolist()
+
+
+def aggregate(table_name, table_data, items, where, group_by, column_types):
+    """Вычисляет агрегатные функции по столбцам как массивам.
+
+    Параметры те же, что у core.aggregate, where - типизированное дерево
+    или None. Возвращает строки результата (списки значений в порядке
+    items, группы в порядке первого появления) или None, если запрос
+    нужно выполнить построчно.
+    """
+    if not _usable(table_data):
+        return None
+    get_column = _getter(table_name, table_data, column_types)
+
+    selected = None
+    if where is not None:
+        mask = _mask(where, get_column)
+        if mask is None:
+            return None
+        selected = np.flatnonzero(mask)
+
+    rows_count = len(table_data) if selected is None else len(selected)
+    if rows_count == 0:
+        # Пустую выборку проще и быстрее посчитать построчно
+        return None
+
+    def values_of(col):
+        column = get_column(col)
+        if column is None or selected is None:
+            return column
+        return {**column, **{name: column[name][selected]
+                             for name in ("codes", "values") if name in column}}
+
+    if group_by:
+        keys = []
+        for col in group_by:
+            column = values_of(col)
+            if column is None:
+                return None
+            keys.append(column["codes"] if column["type"] == "str"
+                        else column["values"])
+        grouped = _group_ids(keys)
+        if grouped is None:
+            return None
+        group_ids, first_rows = grouped
+    else:
+        group_ids = np.zeros(rows_count, np.intp)
+        first_rows = np.zeros(1, np.intp)
+
+    groups_count = len(first_rows)
+    counts = np.bincount(group_ids, minlength=groups_count).tolist()
+
+    columns = []
+    for func, col in items:
+        if func is None:
+            # Значения группы берем из первой строки группы
+            positions = first_rows if selected is None else selected[first_rows]
+            columns.append([table_data[i][col] for i in positions.tolist()])
+        elif func == "count":
+            columns.append(counts)
+        else:
+            column = values_of(col)
+            values = (None if column is None else
+                      _aggregate_column(func, column, group_ids, groups_count,
+                                        counts))
+            if values is None:
+                return None
+            columns.append(values)
+
+    return [list(row) for row in zip(*columns)]
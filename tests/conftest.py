@@ -0,0 +1,88 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMMAND = [sys.executable, "-u", "-m", "src.primitive_db.main", "-y", "-f", "-"]
+
+
+def _environment():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        path for path in (PROJECT_ROOT, env.get("PYTHONPATH")) if path)
+    return env
+
+
+def run_db(workdir, *commands, check=True):
+    """Выполняет команды в новом процессе программы и возвращает его вывод.
+
+    Каждый вызов - отдельный запуск, поэтому между вызовами состояние
+    остается только в файлах базы, как после перезапуска.
+    """
+    result = subprocess.run(
+        COMMAND, input="\n".join(commands) + "\n", text=True, cwd=workdir,
+        env=_environment(), capture_output=True, timeout=60)
+    if check:
+        assert result.returncode == 0, result.stderr
+        assert "Traceback" not in result.stderr, result.stderr
+    return result.stdout
+
+
+class Session:
+    """Запущенный процесс программы, которому команды передаются по одной."""
+
+    def __init__(self, workdir):
+        self.process = subprocess.Popen(
+            COMMAND, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, text=True, cwd=workdir,
+            env=_environment())
+
+    def command(self, command, marker, count=1):
+        """Выполняет команду и читает вывод до count-й строки с marker."""
+        self.process.stdin.write(command + "\n")
+        self.process.stdin.flush()
+        lines = []
+        while count:
+            line = self.process.stdout.readline()
+            assert line, "процесс завершился раньше времени"
+            lines.append(line)
+            count -= marker in line
+        return "".join(lines)
+
+    def close(self):
+        """Закрывает ввод и ждет завершения процесса."""
+        output, errors = self.process.communicate(timeout=60)
+        assert self.process.returncode == 0, errors
+        assert "Traceback" not in errors, errors
+        return output
+
+
+def row_ids(output):
+    """ID строк из таблицы, которую вывела команда select."""
+    ids = []
+    for line in output.splitlines():
+        cells = [cell.strip() for cell in line.strip("|").split("|")]
+        if line.startswith("|") and cells[0].isdigit():
+            ids.append(int(cells[0]))
+    return ids
+
+
+def cells(output):
+    """Строки таблиц из вывода (вместе с заголовками) как списки ячеек."""
+    return [[cell.strip() for cell in line.strip("|").split("|")]
+            for line in output.splitlines() if line.startswith("|")]
+
+
+def write_jsonl(path, rows):
+    """Записывает строки в JSONL файл для команды import."""
+    path.write_text("".join(json.dumps(row) + "\n" for row in rows),
+                    encoding="utf-8")
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Каталог пустой базы данных."""
+    return tmp_path
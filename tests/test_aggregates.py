@@ -0,0 +1,44 @@
+import random
+
+import pytest
+from conftest import cells, run_db, write_jsonl
+
+GROUPED = ("select city, count(*), sum(age), min(age), max(age), avg(age) "
+           "from t where age > 5 group by city order by city")
+
+
+@pytest.fixture
+def rows(db):
+    rng = random.Random(13)
+    rows = [{"city": rng.choice(["a", "b", "c"]), "age": rng.randrange(60)}
+            for _ in range(300)]
+    write_jsonl(db / "rows.jsonl", rows)
+    run_db(db, "create_table t city:str age:int", "import t rows.jsonl")
+    return rows
+
+
+def _expected(rows):
+    groups = {}
+    for row in rows:
+        if row["age"] > 5:
+            groups.setdefault(row["city"], []).append(row["age"])
+    return [[city, str(len(ages)), str(sum(ages)), str(min(ages)),
+             str(max(ages)), str(sum(ages) / len(ages))]
+            for city, ages in sorted(groups.items())]
+
+
+def test_group_by(db, rows):
+    assert cells(run_db(db, GROUPED))[1:] == _expected(rows)
+
+
+def test_parallel_parts_are_merged(db, rows):
+    # Каждый из трех процессов получает часть таблицы
+    assert cells(run_db(db, "parallel 3 0", GROUPED))[1:] == _expected(rows)
+
+
+def test_whole_table_and_empty_result(db, rows):
+    output = run_db(db, "select count(*), sum(age) from t",
+                    "select count(*), avg(age) from t where age > 100")
+    assert cells(output)[1] == [str(len(rows)),
+                                str(sum(row["age"] for row in rows))]
+    assert cells(output)[3] == ["0", "None"]
@@ -0,0 +1,45 @@
+import pytest
+from conftest import cells, row_ids, run_db, write_jsonl
+
+from src.primitive_db import columnar, compact
+
+ROWS = [{"ID": 1, "name": "ёж", "age": 3, "ok": True},
+        {"ID": 2, "name": "", "age": -(2 ** 40), "ok": False},
+        {"ID": 3, "name": "ёж", "age": 0, "ok": True}]
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "t.col")
+    columnar.write_table(path, ROWS)
+
+    assert [compact.as_dict(row) for row in columnar.read_table(path)] == ROWS
+    assert [dict(row) for row in columnar.read_table(path, ("ok",))] \
+        == [{"ok": row["ok"]} for row in ROWS]
+
+
+def test_empty_table(tmp_path):
+    path = str(tmp_path / "t.col")
+    columnar.write_table(path, [])
+    assert columnar.read_table(path) == []
+
+
+def test_too_large_int_is_an_error(tmp_path):
+    with pytest.raises(ValueError):
+        columnar.write_table(str(tmp_path / "t.col"),
+                             [{"ID": 1, "age": 2 ** 70}])
+
+
+def test_columnar_table_survives_restart(db):
+    write_jsonl(db / "rows.jsonl", [{"name": f"n{i % 3}", "age": i}
+                                    for i in range(10)])
+    run_db(db, "create_table t name:str age:int", "import t rows.jsonl",
+           "set_storage t columnar", "update t set name = x where age = 4",
+           "delete from t where age > 7", "compact t")
+    assert (db / "data" / "t.col").exists()
+    assert not (db / "data" / "t.json").exists()
+
+    output = run_db(db, "select from t where name = x",
+                    "select name, age from t where age < 2")
+    assert row_ids(output) == [5]
+    assert [["n0", "0"], ["n1", "1"]] == cells(output)[-2:]
+    assert row_ids(run_db(db, "select from t")) == list(range(1, 9))
@@ -0,0 +1,33 @@
+import multiprocessing
+import time
+
+import pytest
+
+from src.primitive_db import parallel, utils
+from src.primitive_db.constants import FSYNC_INTERVAL_MS
+
+
+def test_interval_write_is_synced_without_next_write(tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(utils, "_fsync_path", synced.append)
+    path = str(tmp_path / "t.log")
+    utils.sync_files()
+
+    utils._written(path)
+    assert path not in synced
+
+    time.sleep(FSYNC_INTERVAL_MS / 1000 + 0.5)
+    assert path in synced
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(),
+                    reason="fork недоступен")
+def test_sync_timer_does_not_disable_fork(tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(utils, "_fsync_path", synced.append)
+    path = str(tmp_path / "t.log")
+    utils.sync_files()
+    utils._written(path)
+
+    assert parallel._context().get_start_method() == "fork"
+    assert path in synced
@@ -0,0 +1,48 @@
+import json
+
+from conftest import row_ids, run_db
+
+
+def test_ids_survive_lost_metadata_save(db):
+    run_db(db, "create_table t name:str")
+    meta_file = db / "db_meta.json"
+    stale = meta_file.read_text(encoding="utf-8")
+
+    run_db(db, 'insert into t values ("a")', 'insert into t values ("b")')
+    # Сбой между записью журнала и сохранением метаданных
+    meta_file.write_text(stale, encoding="utf-8")
+
+    output = run_db(db, 'insert into t values ("c")', "select from t")
+    assert row_ids(output) == [1, 2, 3]
+
+
+def test_ids_without_counter_continue_after_max(db):
+    run_db(db, "create_table t name:str", 'insert into t values ("a")',
+           'insert into t values ("b")')
+    meta_file = db / "db_meta.json"
+    metadata = json.loads(meta_file.read_text(encoding="utf-8"))
+    for settings in metadata.get("__service__", {}).values():
+        settings.pop("next_id", None)
+    meta_file.write_text(json.dumps(metadata), encoding="utf-8")
+
+    output = run_db(db, 'insert into t values ("c")', "select from t")
+    assert row_ids(output) == [1, 2, 3]
+
+
+def test_update_of_id_is_rejected(db):
+    output = run_db(db, "create_table t name:str", 'insert into t values ("a")',
+                    "update t set ID = 7 where ID = 1")
+    assert "ID изменять нельзя" in output
+    assert row_ids(run_db(db, "select from t")) == [1]
+
+
+def test_insert_does_not_load_table(db):
+    for storage in ("json", "records", "segmented"):
+        table = f"t_{storage}"
+        run_db(db, f"create_table {table} name:str",
+               f"set_storage {table} {storage}",
+               f'insert into {table} values ("a")',
+               f'insert into {table} values ("b")')
+        output = run_db(db, f'insert into {table} values ("c")', "stats")
+        assert "rows.loaded" not in output, storage
+        assert row_ids(run_db(db, f"select from {table}")) == [1, 2, 3]
@@ -0,0 +1,19 @@
+from conftest import row_ids, run_db
+
+
+def test_null_value_is_rejected(db):
+    (db / "rows.jsonl").write_text(
+        '{"name": "a", "age": 1}\n{"name": null, "age": 2}\n',
+        encoding="utf-8")
+    output = run_db(db, "create_table t name:str age:int",
+                    "import t rows.jsonl", "select from t")
+    assert "Запись 2" in output
+    assert row_ids(output) == []
+
+
+def test_missing_csv_field_is_rejected(db):
+    (db / "rows.csv").write_text("name,age\na,1\nb\n", encoding="utf-8")
+    output = run_db(db, "create_table t name:str age:int",
+                    "import t rows.csv", "select from t")
+    assert "Запись 2" in output
+    assert row_ids(output) == []
@@ -0,0 +1,15 @@
+from conftest import row_ids, run_db
+
+
+def test_bad_literal_in_probe_where_is_reported(db):
+    output = run_db(
+        db, "create_table users name:str",
+        "create_table orders user_id:int amount:int",
+        'insert into users values ("a")',
+        "insert into orders values (1, 10)",
+        "insert into orders values (1, 20)",
+        "select from users join orders on users.ID = orders.user_id "
+        "where orders.amount = abc",
+        "select from users")
+    assert "Ошибка" in output
+    assert row_ids(output) == [1]
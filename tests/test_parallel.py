@@ -0,0 +1,48 @@
+import os
+import subprocess
+import sys
+import threading
+
+from conftest import PROJECT_ROOT
+
+from src.primitive_db import parallel, utils
+
+
+def _locked_len(rows):
+    with utils.state_lock:
+        return len(rows)
+
+
+def _scan_while_locked():
+    """Параллельный просмотр, пока другой поток держит state_lock."""
+    parallel.configure(workers=2, min_rows=0)
+    locked, release = threading.Event(), threading.Event()
+
+    def hold():
+        with utils.state_lock:
+            locked.set()
+            release.wait()
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    locked.wait()
+    try:
+        parts = parallel.map_chunks(list(range(100)), _locked_len)
+    finally:
+        release.set()
+        holder.join()
+    print(sum(length for _, length in parts))
+
+
+def test_workers_do_not_inherit_locks_of_other_threads():
+    # Зависший исполнитель не должен подвесить сами тесты, поэтому
+    # просмотр выполняется в отдельном процессе
+    tests_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        [PROJECT_ROOT, tests_dir]))
+    result = subprocess.run(
+        [sys.executable, "-c",
+         "import test_parallel; test_parallel._scan_while_locked()"],
+        capture_output=True, text=True, env=env, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "100"
@@ -0,0 +1,25 @@
+from conftest import Session, row_ids, run_db
+
+# Запрос с условием: его результат попадает в кэш select запросов
+QUERY = 'select from t where name != "z"'
+
+
+def test_idle_session_keeps_tables_of_other_process(db):
+    session = Session(db)
+    session.command("list_tables", "Нет созданных таблиц")
+
+    run_db(db, "create_table t name:str", 'insert into t values ("a")')
+    session.close()
+
+    assert "t" in run_db(db, "list_tables")
+
+
+def test_select_cache_sees_writes_of_other_process(db):
+    run_db(db, "create_table t name:str", 'insert into t values ("a")')
+    session = Session(db)
+    assert row_ids(session.command(QUERY, "+\n", 3)) == [1]
+
+    run_db(db, 'insert into t values ("b")')
+    output = session.command(QUERY, "+\n", 3)
+    assert row_ids(output) == [1, 2]
+    session.close()
@@ -0,0 +1,76 @@
+import os
+
+import pytest
+from conftest import cells, row_ids, run_db
+
+from src.primitive_db import rowstore
+
+RECORDS = ("create_table t name:str age:int", "set_storage t records",
+           'insert into t values ("a", 1)', 'insert into t values ("b", 2)',
+           'insert into t values ("c", 3)')
+
+
+@pytest.fixture
+def table(tmp_path):
+    """Путь к файлу записей с пятью строками."""
+    path = str(tmp_path / "t.rec")
+    rowstore.write_table(path, [{"ID": i, "v": i * 10} for i in range(1, 6)])
+    return path
+
+
+def test_point_read_update_and_delete(db):
+    run_db(db, *RECORDS, 'update t set age = 7 where ID = 2',
+           "delete from t where ID = 1")
+    output = run_db(db, "select from t where ID = 2",
+                    "select from t where ID = 1")
+    assert row_ids(output) == [2]
+    assert ["2", "b", "7"] in cells(output)
+    assert row_ids(run_db(db, "select from t")) == [2, 3]
+
+
+def test_clear_and_insert_after_it(db):
+    run_db(db, *RECORDS, "delete from t", 'insert into t values ("d", 4)')
+    assert row_ids(run_db(db, "select from t")) == [4]
+
+
+def test_lost_index_is_rebuilt(db):
+    run_db(db, *RECORDS, "delete from t where ID = 2")
+    os.remove(db / "data" / "t.rix")
+    assert row_ids(run_db(db, "select from t")) == [1, 3]
+
+
+def test_out_of_order_insert_rebuilds_index(table):
+    rowstore.append_records(table, [{"op": "delete", "id": 3}])
+    rowstore.append_records(table, [{"op": "insert",
+                                     "row": {"ID": 3, "v": 0}}])
+    assert [row["ID"] for row in rowstore.read_table(table)] == [1, 2, 3, 4, 5]
+    assert rowstore.fetch_rows(table, [3]) == [{"ID": 3, "v": 0}]
+    assert rowstore.count_rows(table) == 5
+
+
+def test_truncated_index_is_rebuilt(table):
+    index = rowstore.index_path(table)
+    with open(index, "r+b") as f:
+        f.truncate(rowstore.ENTRIES_START + 2 * rowstore.ENTRY.size)
+
+    assert [row["ID"] for row in rowstore.read_table(table)] == [1, 2, 3, 4, 5]
+    assert rowstore.count_rows(table) == 5
+
+
+def test_append_after_torn_frame(table):
+    with open(table, "ab") as f:
+        f.write(rowstore.FRAME.pack(100) + b'{"op": "ins')
+    rowstore.append_records(table, [{"op": "insert",
+                                     "row": {"ID": 6, "v": 60}}])
+    os.remove(rowstore.index_path(table))
+
+    assert [row["ID"] for row in rowstore.read_table(table)] \
+        == [1, 2, 3, 4, 5, 6]
+
+
+def test_torn_frame_is_ignored_on_read(table):
+    with open(table, "ab") as f:
+        f.write(rowstore.FRAME.pack(100) + b'{"op": "ins')
+
+    assert rowstore.count_rows(table) == 5
+    assert rowstore.fetch_rows(table, [5]) == [{"ID": 5, "v": 50}]
@@ -0,0 +1,51 @@
+import shutil
+
+import pytest
+from conftest import cells, row_ids, run_db, write_jsonl
+
+QUERIES = ("select from t", "select from t where city = b and age < 20",
+           "select from t where ID >= 90 and ID < 110",
+           "select from t order by age desc limit 5")
+
+
+@pytest.fixture
+def db(db):
+    """Таблица из 200 строк в каталоге базы."""
+    write_jsonl(db / "rows.jsonl", [{"city": "abc"[i % 3], "age": i % 60}
+                                    for i in range(200)])
+    run_db(db, "create_table t city:str age:int", "import t rows.jsonl")
+    return db
+
+
+def test_range_segments_are_pruned(db):
+    output = run_db(db, "partition t ID 50")
+    assert "сегментов: 4" in output
+
+    output = run_db(db, "select from t where ID > 195", "stats")
+    assert row_ids(output) == [196, 197, 198, 199, 200]
+    assert "segments.skipped: 3" in output
+    assert "rows.loaded: 50" in output
+
+
+def test_hash_segments_are_pruned(db):
+    run_db(db, "partition t city")
+
+    output = run_db(db, "select from t where city = a", "stats")
+    assert row_ids(output) == list(range(1, 201, 3))
+    assert "segments.skipped: 2" in output
+
+
+@pytest.mark.parametrize("partition", ["partition t ID 50",
+                                       "partition t city"])
+def test_changes_match_unpartitioned_table(db, tmp_path_factory, partition):
+    plain = tmp_path_factory.mktemp("plain")
+    shutil.copytree(db, plain, dirs_exist_ok=True)
+    run_db(db, partition)
+
+    changes = ('insert into t values ("d", 70)',
+               "update t set age = 99 where ID = 60 or ID = 160",
+               "delete from t where city = c and age > 30")
+    expected = cells(run_db(plain, *changes, *QUERIES))
+    assert cells(run_db(db, *changes, *QUERIES)) == expected
+    # После перезапуска строки читаются из сегментов и журнала
+    assert cells(run_db(db, *QUERIES)) == cells(run_db(plain, *QUERIES))
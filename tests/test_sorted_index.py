@@ -0,0 +1,49 @@
+import random
+import shutil
+
+import pytest
+from conftest import cells, run_db, write_jsonl
+
+QUERIES = ("select from t order by age limit 5",
+           "select from t order by age desc limit 4 offset 2",
+           "select from t where age >= 40 order by age limit 3",
+           "select from t where age > 10 and age <= 30 order by age desc",
+           "select from t where age = 25",
+           "select name from t order by age desc limit 3")
+
+
+@pytest.fixture
+def db(db):
+    """Таблица с повторяющимися значениями возраста."""
+    rng = random.Random(12)
+    write_jsonl(db / "rows.jsonl", [{"name": f"n{i}", "age": rng.randrange(50)}
+                                    for i in range(200)])
+    run_db(db, "create_table t name:str age:int", "import t rows.jsonl")
+    return db
+
+
+def _results(db, *commands):
+    output = run_db(db, *commands, *QUERIES)
+    return cells(output)
+
+
+def test_index_gives_same_results_as_scan(db):
+    expected = _results(db)
+    assert len(expected) > 20
+    run_db(db, "create_index t age sorted")
+    assert (db / "data" / "t.age.sidx").exists()
+    assert _results(db) == expected
+
+
+def test_index_follows_changes(db, tmp_path_factory):
+    indexed = tmp_path_factory.mktemp("indexed")
+    shutil.copytree(db, indexed, dirs_exist_ok=True)
+    run_db(indexed, "create_index t age sorted")
+
+    changes = ('insert into t values ("new", 0)',
+               "update t set age = 49 where age = 1",
+               "delete from t where age = 2")
+    expected = _results(db, *changes)
+    assert _results(indexed, *changes) == expected
+    # Индекс, измененный прошлым процессом, читается с диска
+    assert _results(indexed) == _results(db)
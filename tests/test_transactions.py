@@ -0,0 +1,31 @@
+import json
+
+from conftest import row_ids, run_db
+
+
+def _interrupt_commit(db):
+    """Оставляет журнал COMMIT, как после сбоя до записи таблиц."""
+    run_db(db, "create_table t name:str", 'insert into t values ("a")')
+    metadata = json.loads((db / "db_meta.json").read_text(encoding="utf-8"))
+    journal = {"metadata": metadata, "tables": {"t": {"records": [
+        {"op": "update", "row": {"ID": 1, "name": "b"}},
+        {"op": "insert", "row": {"ID": 2, "name": "c"}},
+    ]}}}
+    (db / "db_transaction.json").write_text(json.dumps(journal),
+                                            encoding="utf-8")
+
+
+def test_interrupted_commit_is_replayed_before_read(db):
+    _interrupt_commit(db)
+
+    output = run_db(db, 'select from t where name != "a"')
+    assert row_ids(output) == [1, 2]
+    assert not (db / "db_transaction.json").exists()
+
+
+def test_replayed_commit_is_applied_once(db):
+    _interrupt_commit(db)
+
+    run_db(db, "select from t")
+    output = run_db(db, 'insert into t values ("d")', "select from t")
+    assert row_ids(output) == [1, 2, 3]
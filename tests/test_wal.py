@@ -0,0 +1,42 @@
+import json
+
+from conftest import row_ids, run_db
+
+
+def _log_records(db, table):
+    with open(db / "data" / f"{table}.log", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_insert_after_torn_log_tail_is_kept(db):
+    run_db(db, "create_table t name:str", 'insert into t values ("a")')
+    # Сбой посреди записи оставил оборванную последнюю строку
+    with open(db / "data" / "t.log", "a", encoding="utf-8") as f:
+        f.write('{"op": "insert", "row": {"ID": 9, "na')
+
+    output = run_db(db, 'insert into t values ("b")',
+                    'insert into t values ("c")', "select from t")
+    assert row_ids(output) == [1, 2, 3]
+
+    assert row_ids(run_db(db, "select from t")) == [1, 2, 3]
+    assert [record["row"]["ID"] for record in _log_records(db, "t")] \
+        == [1, 2, 3]
+
+
+def test_torn_final_line_is_ignored_on_read(db):
+    run_db(db, "create_table t name:str", 'insert into t values ("a")')
+    with open(db / "data" / "t.log", "a", encoding="utf-8") as f:
+        f.write('{"op": "delete", "i')
+
+    assert row_ids(run_db(db, "select from t")) == [1]
+
+
+def test_corrupted_middle_line_is_an_error(db):
+    run_db(db, "create_table t name:str", 'insert into t values ("a")')
+    with open(db / "data" / "t.log", "a", encoding="utf-8") as f:
+        f.write("garbage\n")
+        f.write('{"op": "delete", "id": 1}\n')
+
+    output = run_db(db, "select from t")
+    assert "поврежден" in output
+    assert row_ids(output) == []
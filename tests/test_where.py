@@ -0,0 +1,35 @@
+import json
+
+import pytest
+from conftest import row_ids, run_db
+
+BOOKS = ("create_table books title:str year:int",
+         "import books books.jsonl")
+
+
+@pytest.fixture
+def db(db):
+    """База, в которую импортируются книги с пробелами в названиях."""
+    rows = [{"title": "War and Peace", "year": 1869},
+            {"title": "Anna Karenina", "year": 1878}]
+    (db / "books.jsonl").write_text(
+        "".join(json.dumps(row) + "\n" for row in rows), encoding="utf-8")
+    return db
+
+
+def test_quoted_value_with_keywords_in_select(db):
+    output = run_db(db, *BOOKS,
+                    'select from books where title = "War and Peace" '
+                    'order by year limit 5')
+    assert row_ids(output) == [1]
+
+
+def test_quoted_value_with_punctuation_in_update_and_delete(db):
+    output = run_db(db, *BOOKS,
+                    'update books set year = 1 where title = "War and Peace"',
+                    'delete from books where title in ("a, (b)", '
+                    '"Anna Karenina")',
+                    "select from books where year = 1")
+    assert "Некорректное условие" not in output
+    assert row_ids(output) == [1]
+    assert row_ids(run_db(db, "select from books")) == [1]